@@ -0,0 +1,291 @@
+# admission.py
+"""
+Admission control for expensive endpoints.
+
+Each policy has a per-user and a global token bucket, plus a limit on how
+many requests one user may have in flight. A request that cannot be
+admitted right away waits in a small, bounded per-process queue for up to
+``max_wait`` seconds. When the wait would be longer, or the queue is full,
+it is rejected at once with the number of seconds after which a retry
+should succeed (sent as Retry-After with a 429).
+
+State is shared by all gunicorn workers through the SQLite database
+(``SqliteAdmissionState``). It always commits on a connection of its own,
+so taking a token or a lease never touches the request's transaction, and
+a rollback of the request can never refund the token or drop the lease.
+``MemoryAdmissionState`` is a stand-in for a single process (development,
+benchmarks). If the database is unavailable (e.g. not migrated yet),
+requests are admitted, so rate limiting can never take the site down. A
+database that is merely locked by other writers means the site is busy:
+the request is rejected with a retry hint like any other.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import metrics
+import storage
+
+# Leases of requests whose worker died before releasing them expire after this
+DEFAULT_LEASE_SECONDS = 15 * 60
+# Retry hint when the user is at their concurrency limit (no bucket to compute it from),
+# and how often a queued request checks whether one of their requests has finished
+CONCURRENCY_RETRY_SECONDS = 2.0
+CONCURRENCY_POLL_SECONDS = 0.25
+# Retry hint when the admission tables stayed locked for the whole busy timeout
+BUSY_RETRY_SECONDS = 2.0
+
+ADMISSION_REQUESTS = metrics.counter('admission_requests_total', 'Admission decisions by policy and result',
+                                     ('policy', 'result'))
+ADMISSION_WAIT = metrics.histogram('admission_wait_seconds', 'Time admitted requests spent queued', ('policy',))
+ADMISSION_QUEUE_DEPTH = metrics.gauge('admission_queue_depth', 'Requests waiting for admission', ('policy',))
+
+
+class Rejected(Exception):
+    """The request was not admitted; retry_after is in seconds"""
+
+    def __init__(self, policy, reason, retry_after):
+        super().__init__(f"Too many requests ({reason}). Please try again in {retry_after} seconds.")
+        self.policy = policy
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Policy:
+    """
+    Limits for one group of endpoints. Rates are in requests per minute;
+    a rate of 0 disables that bucket and a concurrency of 0 disables the
+    in-flight limit.
+    """
+
+    def __init__(self, name, user_per_minute=10, user_burst=3, global_per_minute=120, global_burst=20,
+                 user_concurrency=2, max_wait=2.0, queue_size=8, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.name = name
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.global_per_minute = global_per_minute
+        self.global_burst = global_burst
+        self.user_concurrency = user_concurrency
+        self.max_wait = max_wait
+        self.queue_size = queue_size
+        self.lease_seconds = lease_seconds
+
+    @classmethod
+    def from_env(cls, name, **defaults):
+        """Read ADMISSION_<NAME>_<SETTING> overrides, e.g. ADMISSION_TTS_USER_PER_MINUTE=30"""
+        settings = dict(defaults)
+        for setting in ('user_per_minute', 'user_burst', 'global_per_minute', 'global_burst',
+                        'user_concurrency', 'max_wait', 'queue_size'):
+            value = os.getenv(f'ADMISSION_{name.upper()}_{setting.upper()}')
+            if value is not None:
+                settings[setting] = float(value) if setting == 'max_wait' else int(value)
+        return cls(name, **settings)
+
+    def buckets(self, user_id):
+        """(bucket key, capacity, refill per second) for each enabled bucket"""
+        buckets = []
+        if self.user_per_minute:
+            buckets.append((f'{self.name}:user:{user_id}', self.user_burst, self.user_per_minute / 60))
+        if self.global_per_minute:
+            buckets.append((f'{self.name}:global', self.global_burst, self.global_per_minute / 60))
+        return buckets
+
+
+def _refill(tokens, updated_at, capacity, rate, now):
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+def _shortfall(tokens, rate):
+    """Seconds until a bucket holding tokens has one whole token"""
+    return (1 - tokens) / rate
+
+
+class SqliteAdmissionState:
+    """Buckets and leases in the rate_buckets and admission_leases tables"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def try_acquire(self, policy, user_id, now):
+        """
+        Take one token from every bucket and open a lease, atomically.
+        Returns (lease_id, None, 0) or (None, reason, seconds to wait).
+        """
+        try:
+            with self._transaction() as conn:
+                return self._acquire(conn, policy, user_id, now)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            return None, 'busy', BUSY_RETRY_SECONDS
+
+    @contextmanager
+    def _transaction(self):
+        """
+        A write transaction on the 'admission' connection. Pending writes on this
+        thread's request connection hold the write lock it would wait for, so that
+        case fails at once as locked instead of waiting out the busy timeout.
+        """
+        if storage.get_connection(self.db_path).in_transaction:
+            raise sqlite3.OperationalError("database is locked by this thread's open transaction")
+        conn = storage.get_connection(self.db_path, 'admission')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _acquire(self, conn, policy, user_id, now):
+        scope = f'{policy.name}:user:{user_id}'
+        if policy.user_concurrency:
+            conn.execute('DELETE FROM admission_leases WHERE scope = ? AND expires_at < ?', (scope, now))
+            in_flight = conn.execute('SELECT COUNT(*) FROM admission_leases WHERE scope = ?', (scope,)).fetchone()[0]
+            if in_flight >= policy.user_concurrency:
+                return None, 'user_concurrency', CONCURRENCY_RETRY_SECONDS
+
+        levels = []
+        for key, capacity, rate in policy.buckets(user_id):
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE bucket = ?', (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], capacity, rate, now)
+            if tokens < 1:
+                return None, 'user_rate' if ':user:' in key else 'global_rate', _shortfall(tokens, rate)
+            levels.append((key, tokens - 1))
+
+        conn.executemany('INSERT OR REPLACE INTO rate_buckets (bucket, tokens, updated_at) VALUES (?, ?, ?)',
+                         [(key, tokens, now) for key, tokens in levels])
+        lease_id = uuid.uuid4().hex
+        if policy.user_concurrency:
+            conn.execute('INSERT INTO admission_leases (id, scope, expires_at) VALUES (?, ?, ?)',
+                         (lease_id, scope, now + policy.lease_seconds))
+        return lease_id, None, 0
+
+    def release(self, lease_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM admission_leases WHERE id = ?', (lease_id,))
+
+
+class MemoryAdmissionState:
+    """The same buckets and leases kept in this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._leases = {}   # lease id -> (scope, expires_at)
+
+    def try_acquire(self, policy, user_id, now):
+        with self._lock:
+            scope = f'{policy.name}:user:{user_id}'
+            if policy.user_concurrency:
+                self._leases = {lease_id: lease for lease_id, lease in self._leases.items() if lease[1] >= now}
+                in_flight = sum(1 for lease_scope, _ in self._leases.values() if lease_scope == scope)
+                if in_flight >= policy.user_concurrency:
+                    return None, 'user_concurrency', CONCURRENCY_RETRY_SECONDS
+
+            levels = []
+            for key, capacity, rate in policy.buckets(user_id):
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens = _refill(tokens, updated_at, capacity, rate, now)
+                if tokens < 1:
+                    return None, 'user_rate' if ':user:' in key else 'global_rate', _shortfall(tokens, rate)
+                levels.append((key, tokens - 1))
+
+            for key, tokens in levels:
+                self._buckets[key] = (tokens, now)
+            lease_id = uuid.uuid4().hex
+            if policy.user_concurrency:
+                self._leases[lease_id] = (scope, now + policy.lease_seconds)
+            return lease_id, None, 0
+
+    def release(self, lease_id):
+        with self._lock:
+            self._leases.pop(lease_id, None)
+
+
+class Ticket:
+    """
+    An admitted request; release() ends its lease (safe to call more than once).
+    Work that outlives the response (a background job) calls transfer() and
+    releases the ticket itself when it finishes.
+    """
+
+    def __init__(self, controller, lease_id):
+        self._controller = controller
+        self._lease_id = lease_id
+        self.transferred = False
+
+    def transfer(self):
+        self.transferred = True
+
+    def release(self):
+        lease_id, self._lease_id = self._lease_id, None
+        if lease_id is not None:
+            self._controller.release(lease_id)
+
+
+class AdmissionController:
+    """Applies named policies; admit() returns a Ticket or raises Rejected"""
+
+    def __init__(self, state, policies):
+        self.state = state
+        self.policies = {policy.name: policy for policy in policies}
+        self._waiting = {name: 0 for name in self.policies}
+        self._lock = threading.Lock()
+
+    def _try(self, policy, user_id):
+        try:
+            return self.state.try_acquire(policy, user_id, time.time())
+        except sqlite3.Error as e:
+            print(f"Admission control unavailable, admitting request: {e}")
+            return None, None, 0
+
+    def admit(self, name, user_id):
+        policy = self.policies[name]
+        started = time.monotonic()
+        queued = False
+        try:
+            while True:
+                lease_id, reason, wait = self._try(policy, user_id)
+                if reason is None:
+                    ADMISSION_REQUESTS.inc(name, 'queued' if queued else 'admitted')
+                    if queued:
+                        ADMISSION_WAIT.observe(time.monotonic() - started, name)
+                    return Ticket(self, lease_id)
+
+                remaining = policy.max_wait - (time.monotonic() - started)
+                if reason == 'busy':
+                    self._reject(name, reason, wait)  # It already waited out the busy timeout
+                if reason == 'user_concurrency':
+                    if remaining <= 0:
+                        self._reject(name, reason, wait)
+                    wait = min(CONCURRENCY_POLL_SECONDS, remaining)
+                elif wait > remaining:
+                    self._reject(name, reason, wait)
+                if not queued:
+                    with self._lock:
+                        if self._waiting[name] >= policy.queue_size:
+                            self._reject(name, 'queue_full', wait)
+                        self._waiting[name] += 1
+                    ADMISSION_QUEUE_DEPTH.inc(name)
+                    queued = True
+                time.sleep(max(wait, 0.01))
+        finally:
+            if queued:
+                with self._lock:
+                    self._waiting[name] -= 1
+                ADMISSION_QUEUE_DEPTH.inc(name, amount=-1)
+
+    def _reject(self, name, reason, wait):
+        ADMISSION_REQUESTS.inc(name, f'rejected_{reason}')
+        raise Rejected(name, reason, max(1, math.ceil(wait)))
+
+    def release(self, lease_id):
+        try:
+            self.state.release(lease_id)
+        except sqlite3.Error as e:
+            print(f"Could not release admission lease: {e}")  # It expires after lease_seconds
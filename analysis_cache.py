@@ -0,0 +1,126 @@
+# analysis_cache.py
+"""
+Persistent, content-addressed cache for AI analysis results.
+
+Entries are keyed by the hash of the normalized document text plus the
+analysis language and model name, and live in the same SQLite database as
+the documents table.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import storage
+
+
+def normalize_text(text):
+    """Normalize document text so trivially different copies hash the same"""
+    text = unicodedata.normalize('NFC', text or '')
+    return ' '.join(text.split())
+
+
+def text_hash(text):
+    """SHA-256 of the normalized document text"""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def cache_key(text, language, model_name):
+    """Build the cache key for a document analysed in a language by a model"""
+    return hashlib.sha256(f"{model_name}\0{language}\0{text_hash(text)}".encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """
+    SQLite-backed analysis cache with TTL and size-based eviction.
+
+    Cache failures are logged and treated as misses so they never break an
+    analysis request.
+    """
+
+    def __init__(self, db_path, ttl_seconds=30 * 24 * 3600, max_entries=5000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return storage.get_connection(self.db_path)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, text, language, model_name):
+        """Return a cached analysis dict (without original_text) or None"""
+        key = cache_key(text, language, model_name)
+        now = time.time()
+        try:
+            with storage.savepoint(self._connect(), 'analysis_cache') as conn:
+                row = conn.execute(
+                    'SELECT analysis_json FROM analysis_cache WHERE cache_key = ? AND created_at >= ?',
+                    (key, now - self.ttl_seconds)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        'UPDATE analysis_cache SET last_used = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                        (now, key)
+                    )
+        except sqlite3.Error as e:
+            print(f"Analysis cache lookup failed: {e}")
+            row = None
+
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(row[0])
+
+    def put(self, text, language, model_name, analysis_result):
+        """Store an analysis result; the document text itself is not duplicated"""
+        payload = {k: v for k, v in analysis_result.items() if k != 'original_text'}
+        now = time.time()
+        try:
+            with storage.savepoint(self._connect(), 'analysis_cache') as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO analysis_cache '
+                    '(cache_key, text_hash, language, model_name, analysis_json, created_at, last_used, hit_count) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                    (cache_key(text, language, model_name), text_hash(text), language, model_name,
+                     json.dumps(payload), now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"Analysis cache store failed: {e}")
+
+    def _evict(self, conn, now):
+        expired = conn.execute('DELETE FROM analysis_cache WHERE created_at < ?', (now - self.ttl_seconds,)).rowcount
+        overflow = conn.execute(
+            'DELETE FROM analysis_cache WHERE cache_key IN ('
+            'SELECT cache_key FROM analysis_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        ).rowcount
+        if expired or overflow:
+            with self._lock:
+                self.evictions += expired + overflow
+
+    def stats(self):
+        """Hit/miss counters for this process plus the persisted entry count"""
+        try:
+            entries, total_hits = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM analysis_cache'
+            ).fetchone()
+        except sqlite3.Error:
+            entries, total_hits = None, None
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'total_hits': total_hits,
+        }
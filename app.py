@@ -1,15 +1,36 @@
 # app.py
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, g, send_file
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, flash, session, g, send_file, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
 from flask_bcrypt import Bcrypt
 import json
-import sqlite3
-import io
 import os
 import base64
+import functools
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from werkzeug.utils import secure_filename
-from google.cloud import vision
-from google.cloud import texttospeech
+from analysis_cache import AnalysisCache
+from near_duplicates import MinHasher, NearDuplicateIndex, changed_sections, jaccard, shingles
+from chunking import chunk_text, merge_annotations, pack_by_bytes, split_sentences
+import clause_rules
+from model_registry import ModelRegistry, get_model_registry, set_model_registry
+import service_clients
+from tts_cache import AudioCache, audio_key
+from render_cache import RenderCache, template_version
+import storage
+import blob_store
+from ocr import UPLOAD_EXTENSIONS, UPLOAD_TYPE_NAMES, BatchOcr, is_supported_upload
+from ocr_cache import OcrCache
+import search_index
+from span_index import find_annotation_spans, merge_spans
+from jobs import JobQueue, QueueFull
+from batch import BatchError, BatchRunner, read_batch
+from json_stream import IncrementalJsonParser
+import metrics
+import admission
+import response_parsing
 
 # Load environment variables
 try:
@@ -21,34 +42,42 @@ except ImportError:
 # --- AI Configuration ---
 GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID')  # Must be set via environment variable
 GCP_LOCATION = "us-central1"
+VERTEX_MODEL_NAME = os.getenv('VERTEX_MODEL_NAME', 'gemini-pro')
+# Send each prompt's response schema to Vertex AI (needs a model and SDK with response_schema support)
+VERTEX_RESPONSE_SCHEMA = os.getenv('VERTEX_RESPONSE_SCHEMA', '').lower() in ('1', 'true', 'yes')
+# Follow-up calls asking the model to rewrite the broken tail of an unrepairable JSON response
+RESPONSE_FOLLOW_UPS = int(os.getenv('RESPONSE_FOLLOW_UPS', 1))
+
+# Documents longer than this are analyzed section by section (map-reduce)
+ANALYSIS_CHUNK_CHARS = int(os.getenv('ANALYSIS_CHUNK_CHARS', 12000))
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', 4))
+chunk_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CHUNK_CONCURRENCY, thread_name_prefix='analysis-chunk')
+
+# Boilerplate-only sections (signature blocks, counterparts, ...) are left out of prompts (see clause_rules.py)
+ANALYSIS_TRIM_BOILERPLATE = os.getenv('ANALYSIS_TRIM_BOILERPLATE', '1').lower() in ('1', 'true', 'yes')
+PROVISIONAL_MAX_ANNOTATIONS = int(os.getenv('PROVISIONAL_MAX_ANNOTATIONS', 50))
+TRIMMED_CHARS = metrics.counter('prompt_trimmed_chars_total', 'Boilerplate characters left out of prompts',
+                                ('language',))
+
+# Multi-page uploads are OCR'd in batched Vision requests, a few at a time (see ocr.py)
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', 4))
+OCR_MAX_PAGES = int(os.getenv('OCR_MAX_PAGES', 60))
+OCR_MAX_FILES = int(os.getenv('OCR_MAX_FILES', 40))
+OCR_TIMEOUT = float(os.getenv('OCR_TIMEOUT', 60))
+OCR_IMAGE_MAX_SIDE = int(os.getenv('OCR_IMAGE_MAX_SIDE', 2560))  # Longer side, in pixels, after downscaling
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix='ocr-batch')
 
 # Validate required environment variables
 if not GCP_PROJECT_ID:
     print("⚠️  Warning: GCP_PROJECT_ID not set. Google Cloud features will not work.")
     print("   Create a .env file with: GCP_PROJECT_ID=your-actual-project-id")
 
-# Initialize Vision API client
-try:
-    # Check if we have service account JSON as environment variable
-    service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-    if service_account_info:
-        import json
-        from google.oauth2 import service_account
-        
-        # Parse the JSON string
-        service_account_dict = json.loads(service_account_info)
-        credentials = service_account.Credentials.from_service_account_info(service_account_dict)
-        
-        vision_client = vision.ImageAnnotatorClient(credentials=credentials)
-        tts_client = texttospeech.TextToSpeechClient(credentials=credentials)
-    else:
-        # Fall back to default credentials (service account file)
-        vision_client = vision.ImageAnnotatorClient()
-        tts_client = texttospeech.TextToSpeechClient()
-except Exception as e:
-    print(f"Warning: Google Cloud APIs not configured properly: {e}")
-    vision_client = None
-    tts_client = None
+# Vision and Text-to-Speech clients are created on first use (see service_clients.py)
+# to keep cold starts fast. EAGER_SERVICE_CLIENTS=1 builds them at import instead.
+EAGER_SERVICE_CLIENTS = os.getenv('EAGER_SERVICE_CLIENTS', '').lower() in ('1', 'true', 'yes')
+if EAGER_SERVICE_CLIENTS:
+    service_clients.get_vision_client()
+    service_clients.get_tts_client()
 # --- End AI Configuration ---
 
 # --- Language Support ---
@@ -56,12 +85,14 @@ LANGUAGES = {
     'en': {
         'name': 'English',
         'tts_code': 'en-US',
-        'tts_voice': 'en-US-Neural2-C'
+        'tts_voice': 'en-US-Neural2-C',
+        'sentence_terminators': '.!?'
     },
     'hi': {
         'name': 'हिंदी',
         'tts_code': 'hi-IN',
-        'tts_voice': 'hi-IN-Neural2-A'
+        'tts_voice': 'hi-IN-Neural2-A',
+        'sentence_terminators': '।॥.!?'  # Danda and double danda end Hindi sentences
     }
 }
 
@@ -82,7 +113,14 @@ TRANSLATIONS = {
         'no_documents': 'No documents analyzed yet.',
         'document_analysis': 'Document Analysis',
         'important_clauses': 'Important Clauses',
-        'language': 'Language'
+        'preliminary_clauses': 'Likely key clauses (preliminary, still analyzing)',
+        'language': 'Language',
+        'search_documents': 'Search your documents',
+        'search': 'Search',
+        'no_results': 'No documents match your search.',
+        'older_documents': 'Older',
+        'newest_documents': 'Newest',
+        'translation_unavailable': 'This analysis could not be translated right now; showing the original.'
     },
     'hi': {
         'app_title': 'कानूनी स्पष्टता',
@@ -99,7 +137,14 @@ TRANSLATIONS = {
         'no_documents': 'अभी तक कोई दस्तावेज़ का विश्लेषण नहीं किया गया।',
         'document_analysis': 'दस्तावेज़ विश्लेषण',
         'important_clauses': 'महत्वपूर्ण खंड',
-        'language': 'भाषा'
+        'preliminary_clauses': 'संभावित मुख्य खंड (प्रारंभिक, विश्लेषण जारी है)',
+        'language': 'भाषा',
+        'search_documents': 'अपने दस्तावेज़ खोजें',
+        'search': 'खोजें',
+        'no_results': 'आपकी खोज से कोई दस्तावेज़ मेल नहीं खाता।',
+        'older_documents': 'पुराने',
+        'newest_documents': 'नवीनतम',
+        'translation_unavailable': 'यह विश्लेषण अभी अनुवादित नहीं हो सका; मूल दिखाया जा रहा है।'
     }
 }
 
@@ -114,6 +159,18 @@ def get_translation(key):
 
 # --- End Language Support ---
 
+# Vertex AI credentials and model handles are created once per worker process.
+# VERTEX_MODEL_NAME_<LANG> (e.g. VERTEX_MODEL_NAME_HI) overrides the model for one language.
+set_model_registry(ModelRegistry(
+    GCP_PROJECT_ID,
+    GCP_LOCATION,
+    VERTEX_MODEL_NAME,
+    language_models={
+        lang: os.getenv(f'VERTEX_MODEL_NAME_{lang.upper()}')
+        for lang in LANGUAGES if os.getenv(f'VERTEX_MODEL_NAME_{lang.upper()}')
+    }
+))
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY')  # Must be set via environment variable
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 10 * 1024 * 1024))  # Max upload size: 10MB
@@ -129,6 +186,66 @@ if not app.secret_key:
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 DATABASE = os.getenv('DATABASE_PATH', 'database.db')
+analysis_cache = AnalysisCache(
+    DATABASE,
+    ttl_seconds=int(os.getenv('ANALYSIS_CACHE_TTL', 30 * 24 * 3600)),  # Default: 30 days
+    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 5000))
+)
+# Documents that differ from an earlier one only in a few sections (same template, other
+# names/dates/amounts) reuse its analysis; only the changed sections go to the model.
+# NEAR_DUPLICATE_SCOPE=all also matches other users' documents.
+near_duplicate_index = NearDuplicateIndex(
+    MinHasher(num_perm=int(os.getenv('NEAR_DUPLICATE_NUM_PERM', 64)), bands=int(os.getenv('NEAR_DUPLICATE_BANDS', 16))),
+    threshold=float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.7)),
+    max_documents=int(os.getenv('NEAR_DUPLICATE_MAX_DOCUMENTS', 50000))
+)
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+NEAR_DUPLICATE_SCOPE = os.getenv('NEAR_DUPLICATE_SCOPE', 'user')
+NEAR_DUPLICATE_MAX_CHANGED = float(os.getenv('NEAR_DUPLICATE_MAX_CHANGED', 0.5))  # Share of the text
+# Analyses never change once saved, so each worker keeps their rendered pages (LRU, capped in bytes)
+# keyed by document, language and template version; 0 turns the cache off
+analysis_pages = RenderCache(max_bytes=int(os.getenv('ANALYSIS_PAGE_CACHE_BYTES', 32 * 1024 * 1024)))
+ANALYSIS_PAGE_VERSION = template_version(
+    os.path.join(app.root_path, app.template_folder), ['base.html', 'results.html'], LANGUAGES, TRANSLATIONS
+)
+# Re-uploads of an already OCR'd scan skip Vision entirely
+ocr_cache = OcrCache(DATABASE, max_entries=int(os.getenv('OCR_CACHE_MAX_ENTRIES', 20000)))
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', 25))
+# Stage timings are exported on /metrics (see metrics.py); METRICS_DIR aggregates gunicorn workers
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # If set, /metrics requires "Authorization: Bearer <token>"
+REQUEST_LOG = os.getenv('REQUEST_LOG', '1').lower() in ('1', 'true', 'yes')
+# Admission control for endpoints that call paid APIs: per-user and global token buckets,
+# a per-user in-flight limit and a short wait queue (see admission.py).
+# ADMISSION_BACKEND=memory keeps the state in-process instead of the shared database.
+admission_control = admission.AdmissionController(
+    admission.MemoryAdmissionState() if os.getenv('ADMISSION_BACKEND', 'sqlite') == 'memory'
+    else admission.SqliteAdmissionState(DATABASE),
+    [
+        admission.Policy.from_env('analyze', user_per_minute=10, user_burst=3, global_per_minute=120,
+                                  global_burst=20, user_concurrency=2),
+        admission.Policy.from_env('tts', user_per_minute=30, user_burst=5, global_per_minute=300,
+                                  global_burst=30, user_concurrency=2),
+        admission.Policy.from_env('batch', user_per_minute=2, user_burst=2, global_per_minute=10,
+                                  global_burst=4, user_concurrency=1, max_wait=0),
+    ]
+)
+# Synthesized audio is cached on disk by hash of text, voice, rate and encoding
+TTS_SPEAKING_RATE = 0.9  # Slightly slower than default for better comprehension
+TTS_CACHE_MAX_AGE = 7 * 24 * 3600
+tts_audio_cache = AudioCache(
+    os.getenv('TTS_CACHE_DIR', 'tts_cache'),
+    max_bytes=int(os.getenv('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))  # Default: 200MB
+)
+# Long text is synthesized as sentence-aligned segments in parallel and streamed in order.
+# The API accepts at most 5000 bytes per request; the first segment is kept short for a fast start.
+TTS_SEGMENT_MAX_BYTES = int(os.getenv('TTS_SEGMENT_MAX_BYTES', 1500))
+TTS_FIRST_SEGMENT_MAX_BYTES = int(os.getenv('TTS_FIRST_SEGMENT_MAX_BYTES', 300))
+tts_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TTS_CONCURRENCY', 4)), thread_name_prefix='tts-segment')
+# Requests for audio another request is already synthesizing wait this long for it, then synthesize themselves
+TTS_COALESCE_WAIT = int(os.getenv('TTS_COALESCE_WAIT', 60))
+TTS_COALESCED = metrics.counter('tts_coalesced_requests_total',
+                                'Speech requests that waited for another request synthesizing the same audio')
 bcrypt = Bcrypt(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -163,47 +280,51 @@ class User(UserMixin):
 
 # --- DB Helpers ---
 def get_db():
+    # Each worker thread reuses one tuned connection (WAL, pragmas) across requests
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        g.db = storage.get_connection(DATABASE)
     return g.db
 
 def init_db():
-    """Initialize the database with schema"""
+    """Create the database if needed and apply any pending migrations"""
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            with open('schema.sql', 'r') as f:
-                conn.executescript(f.read())
-        print("✅ Database initialized successfully")
+        applied = storage.migrate(storage.get_connection(DATABASE))
+        if applied:
+            print(f"✅ Database migrations applied: {', '.join(applied)}")
     except Exception as e:
-        print(f"❌ Database initialization failed: {e}")
+        print(f"❌ Database migration failed: {e}")
+        raise
 
-def ensure_db_exists():
-    """Ensure database exists and is properly initialized"""
-    if not os.path.exists(DATABASE):
-        print("📁 Database not found. Creating...")
-        init_db()
-    else:
-        # Check if tables exist
-        try:
-            with sqlite3.connect(DATABASE) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
-                if not cursor.fetchone():
-                    print("📁 Database exists but tables missing. Initializing...")
-                    init_db()
-        except Exception as e:
-            print(f"❌ Database check failed: {e}")
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply pending database migrations"""
+    init_db()
+
+# Initialize the database on the first request rather than at import, unless eager mode is on
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+@app.before_request
+def ensure_db_ready():
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if not _db_ready:
             init_db()
+            _db_ready = True
+
+if EAGER_SERVICE_CLIENTS:
+    ensure_db_ready()
 
-# Initialize database on startup
-ensure_db_exists()
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
 
 @app.teardown_appcontext
 def close_db(error):
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    # The connection stays open for the next request; just drop any unfinished transaction
+    storage.release(g.pop('db', None))
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -212,12 +333,72 @@ def load_user(user_id):
 @app.after_request
 def add_cache_control(response):
     """Add cache control headers to prevent caching of sensitive pages"""
-    if request.endpoint and any(endpoint in request.endpoint for endpoint in ['dashboard', 'view_analysis', 'logout']):
+    # Analysis pages set their own (private, revalidated) caching; see analysis_page_response
+    if request.endpoint and any(endpoint in request.endpoint for endpoint in ['dashboard', 'view_analysis', 'logout', 'job_status', 'search_documents']) \
+            and not response.headers.get('ETag'):
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
     return response
 
+@app.after_request
+def record_request_metrics(response):
+    """Export the request's latency, add its stage timings as Server-Timing and log it as JSON"""
+    elapsed, timings = metrics.end_request()
+    if elapsed is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics.REQUEST_SECONDS.observe(elapsed, request.method, endpoint, str(response.status_code))
+    
+    server_timing = metrics.server_timing(elapsed, timings)
+    if response.headers.get('Server-Timing'):
+        server_timing = f"{response.headers['Server-Timing']}, {server_timing}"
+    response.headers['Server-Timing'] = server_timing
+    
+    if REQUEST_LOG and endpoint not in ('static', 'prometheus_metrics'):
+        metrics.log_event(
+            'request',
+            method=request.method,
+            path=request.path,
+            endpoint=endpoint,
+            status=response.status_code,
+            duration_ms=round(elapsed * 1000, 1),
+            stages={stage: round(seconds * 1000, 1) for stage, (seconds, _) in timings.items()},
+            user_id=current_user.get_id()
+        )
+    metrics.flush(METRICS_DIR)
+    return response
+
+@app.errorhandler(admission.Rejected)
+def too_many_requests(e):
+    """Fast 429 with the number of seconds after which a retry should be admitted"""
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def admission_required(policy):
+    """
+    Admit the request under an admission policy before running the view.
+    The lease is held until the response (including a streamed body) is closed,
+    unless the view hands g.admission_ticket over to a background job.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            ticket = g.admission_ticket = admission_control.admit(policy, current_user.id)
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                # Drop the failed view's unfinished writes (teardown would) so they don't hold up the release
+                storage.release(g.get('db'))
+                ticket.release()
+                raise
+            if not ticket.transferred:
+                response.call_on_close(ticket.release)
+            return response
+        return wrapper
+    return decorator
+
 @app.context_processor
 def inject_language_data():
     """Make language data available to all templates"""
@@ -227,35 +408,68 @@ def inject_language_data():
         'get_translation': get_translation
     }
 
-def analyze_with_vertex_ai(document_text: str, language: str = 'en') -> dict:
+def generation_options(schema: dict) -> dict:
+    """generate_content keyword arguments declaring the response schema, when enabled"""
+    if not VERTEX_RESPONSE_SCHEMA or not schema:
+        return {}
+    return {'generation_config': {'response_mime_type': 'application/json', 'response_schema': schema}}
+
+def parse_model_response(model, response_text: str, schema: dict, language: str = 'en') -> dict:
+    """
+    Parse a model response against its schema; when it cannot be repaired, ask the model
+    to rewrite just the broken tail (RESPONSE_FOLLOW_UPS times at most)
+    """
+    def ask(prompt):
+        metrics.PROMPT_CHARS.observe(len(prompt), language)
+        with metrics.timed('vertex'):
+            return model.generate_content(prompt).text
+
+    return response_parsing.parse_with_follow_up(response_text, schema, ask, language, RESPONSE_FOLLOW_UPS)
+
+def generate_json(prompt: str, language: str = 'en', schema: dict = response_parsing.ANALYSIS_SCHEMA) -> dict:
     """
-    Analyze document using Google Vertex AI
+    Send a prompt to the Gemini model for the language and parse the JSON object it returns
     Requires: pip install google-cloud-aiplatform
     """
-    try:
-        from google.cloud import aiplatform
-        from vertexai.preview.generative_models import GenerativeModel
-    except ImportError:
-        raise Exception("Google Cloud AI Platform not installed. Run: pip install google-cloud-aiplatform")
+    model = get_model_registry().get_model(language)
+    metrics.PROMPT_CHARS.observe(len(prompt), language)
     
     try:
-        # Check if we have service account JSON as environment variable
-        service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-        if service_account_info:
-            import json
-            from google.oauth2 import service_account
-            
-            # Parse the JSON string
-            service_account_dict = json.loads(service_account_info)
-            credentials = service_account.Credentials.from_service_account_info(service_account_dict)
-            
-            aiplatform.init(project=GCP_PROJECT_ID, location=GCP_LOCATION, credentials=credentials)
-        else:
-            # Fall back to default credentials
-            aiplatform.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
+        with metrics.timed('vertex'):
+            response = model.generate_content(prompt, **generation_options(schema))
+        
+        # Parse the JSON response
+        return parse_model_response(model, response.text, schema, language)
+        
+    except json.JSONDecodeError as e:
+        raise Exception(f"Invalid JSON response from Vertex AI: {str(e)}")
     except Exception as e:
-        raise Exception(f"Failed to initialize Vertex AI. Check GCP_PROJECT_ID: {str(e)}")
+        raise Exception(f"Vertex AI analysis failed: {str(e)}")
+
+def generate_json_stream(prompt: str, language: str = 'en', schema: dict = response_parsing.ANALYSIS_SCHEMA):
+    """
+    Streaming variant of generate_json. Yields parser events ('field', key, value) and
+    ('item', key, index, value) as soon as each part of the JSON object is complete,
+    then returns the fully parsed object exactly as generate_json would.
+    """
+    model = get_model_registry().get_model(language)
+    parser = IncrementalJsonParser()
+    metrics.PROMPT_CHARS.observe(len(prompt), language)
     
+    try:
+        with metrics.timed('vertex'):
+            for chunk in model.generate_content(prompt, stream=True, **generation_options(schema)):
+                yield from parser.feed(chunk.text)
+        
+        return parse_model_response(model, parser.buffer, schema, language)
+        
+    except json.JSONDecodeError as e:
+        raise Exception(f"Invalid JSON response from Vertex AI: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Vertex AI analysis failed: {str(e)}")
+
+def analysis_prompt(document_text: str, language: str = 'en') -> str:
+    """Prompt for analyzing a whole document in a single call"""
     prompt_templates = {
         'en': f"""Analyze this legal document and provide a JSON response with:
 1. "title": Brief document title
@@ -274,46 +488,381 @@ Return only valid JSON:""",
 
 केवल वैध JSON वापस करें:"""
     }
+    return prompt_templates[language]
+
+def analyze_with_vertex_ai(document_text: str, language: str = 'en') -> dict:
+    """
+    Analyze document using Google Vertex AI in a single prompt
+    """
+    result = generate_json(analysis_prompt(document_text, language), language)
+    result['original_text'] = document_text
+    return result
+
+def chunk_prompt(section_text: str, language: str = 'en') -> str:
+    """Prompt for the map step: one section of a long document"""
+    prompt_templates = {
+        'en': f"""Analyze this section of a legal document and provide a JSON response with:
+1. "summary": Plain English summary of this section
+2. "annotations": Array of important clauses with "text_to_highlight" (copied exactly from the section) and "explanation"
+
+Section: {section_text}
+
+Return only valid JSON:""",
+        'hi': f"""इस कानूनी दस्तावेज़ के इस भाग का विश्लेषण करें और JSON प्रतिक्रिया प्रदान करें:
+1. "summary": इस भाग का सरल हिंदी सारांश
+2. "annotations": "text_to_highlight" (भाग से हूबहू लिया गया) और "explanation" के साथ महत्वपूर्ण खंडों की सरणी
+
+भाग: {section_text}
+
+केवल वैध JSON वापस करें:"""
+    }
+    return prompt_templates[language]
+
+def analyze_chunk(section_text: str, language: str = 'en') -> dict:
+    """
+    Map step: analyze one section of a long document.
+    Results are cached per chunk, so an edited document only re-analyzes changed chunks.
+    """
+    chunk_model = get_model_registry().model_name_for(language) + '#chunk'
+    cached_result = analysis_cache.get(section_text, language, chunk_model)
+    metrics.cache_lookup('analysis_section', cached_result is not None)
+    if cached_result is not None:
+        return cached_result
     
-    try:
-        model = GenerativeModel("gemini-pro")
-        response = model.generate_content(prompt_templates[language])
-        
-        # Clean the response text to extract JSON
-        response_text = response.text.strip()
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        # Parse the JSON response
-        result = json.loads(response_text)
+    result = generate_json(chunk_prompt(section_text, language), language, response_parsing.SECTION_SCHEMA)
+    analysis_cache.put(section_text, language, chunk_model, result)
+    return result
+
+def section_summaries(partial_results: list) -> list:
+    return [partial.get('summary', '') for partial in partial_results if partial.get('summary')]
+
+def number_summaries(summaries: list) -> str:
+    return '\n\n'.join(f"{i}. {summary}" for i, summary in enumerate(summaries, 1))
+
+def reduce_prompt(joined: str, language: str = 'en') -> str:
+    """Prompt for the reduce step: numbered section summaries in, title and summary out"""
+    prompt_templates = {
+        'en': f"""These are summaries of consecutive sections of one legal document. Provide a JSON response with:
+1. "title": Brief document title
+2. "summary": Plain English summary of the whole document
+
+Section summaries:
+{joined}
+
+Return only valid JSON:""",
+        'hi': f"""ये एक ही कानूनी दस्तावेज़ के क्रमिक भागों के सारांश हैं। JSON प्रतिक्रिया प्रदान करें:
+1. "title": संक्षिप्त दस्तावेज़ शीर्षक
+2. "summary": पूरे दस्तावेज़ का सरल हिंदी सारांश
+
+भागों के सारांश:
+{joined}
+
+केवल वैध JSON वापस करें:"""
+    }
+    return prompt_templates[language]
+
+def reduce_chunk_summaries(summaries: list, language: str = 'en') -> dict:
+    """
+    Reduce step: combine per-section summaries into one title and summary
+    """
+    reduce_model = get_model_registry().model_name_for(language) + '#reduce'
+    joined = number_summaries(summaries)
+    cached_result = analysis_cache.get(joined, language, reduce_model)
+    if cached_result is not None:
+        return cached_result
+    
+    result = generate_json(reduce_prompt(joined, language), language, response_parsing.SUMMARY_SCHEMA)
+    analysis_cache.put(joined, language, reduce_model, result)
+    return result
+
+def provisional_analysis(document_text: str, language: str = 'en') -> dict:
+    """
+    Rule-based clause highlights, available in milliseconds while the model runs.
+    Only the first PROVISIONAL_MAX_ANNOTATIONS are returned; 'total' counts all of them.
+    """
+    with metrics.timed('clause_rules'):
+        annotations = clause_rules.detect_clauses(document_text, language)
+    return {'annotations': annotations[:PROVISIONAL_MAX_ANNOTATIONS], 'total': len(annotations)}
+
+def prompt_text(document_text: str, language: str = 'en') -> str:
+    """The part of the document sent to the model: everything but boilerplate-only sections"""
+    if not ANALYSIS_TRIM_BOILERPLATE:
+        return document_text
+    with metrics.timed('clause_rules'):
+        trimmed, removed = clause_rules.trim_boilerplate(document_text, language)
+    if removed:
+        TRIMMED_CHARS.inc(language, amount=removed)
+    # Never send an (almost) empty prompt because everything looked like boilerplate
+    return trimmed if len(trimmed.strip()) >= 10 else document_text
+
+def analyze_in_chunks(document_text: str, language: str = 'en') -> dict:
+    """
+    Map-reduce analysis for long documents.
+    Short documents still go through a single analyze_with_vertex_ai call.
+    """
+    model_text = prompt_text(document_text, language)
+    chunks = chunk_text(model_text, ANALYSIS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        result = analyze_with_vertex_ai(model_text, language)
         result['original_text'] = document_text
         return result
-        
-    except json.JSONDecodeError as e:
-        raise Exception(f"Invalid JSON response from Vertex AI: {str(e)}")
+    
+    # The shared executor caps concurrent model calls across all requests and jobs
+    partial_results = list(chunk_executor.map(lambda chunk: analyze_chunk(chunk, language), chunks))
+    summaries = section_summaries(partial_results)
+    reduced = reduce_chunk_summaries(summaries, language)
+    
+    return {
+        'title': reduced.get('title', 'Untitled Document'),
+        'summary': reduced.get('summary', ''),
+        'annotations': merge_annotations(partial_results),
+        'original_text': document_text
+    }
+
+def revise_prompt(previous: dict, joined: str, language: str = 'en') -> str:
+    """Prompt that updates an earlier title and summary with the summaries of changed sections"""
+    prompt_templates = {
+        'en': f"""This is the analysis of an earlier version of a legal document, followed by summaries of the sections that are different in the new version. Provide a JSON response for the new version with:
+1. "title": Brief document title
+2. "summary": Plain English summary of the whole document (names, dates and amounts must come from the changed sections, not from the earlier version)
+
+Earlier title: {previous.get('title', '')}
+Earlier summary: {previous.get('summary', '')}
+
+Changed sections:
+{joined}
+
+Return only valid JSON:""",
+        'hi': f"""यह एक कानूनी दस्तावेज़ के पिछले संस्करण का विश्लेषण है, जिसके बाद नए संस्करण में बदले हुए भागों के सारांश हैं। नए संस्करण के लिए JSON प्रतिक्रिया प्रदान करें:
+1. "title": संक्षिप्त दस्तावेज़ शीर्षक
+2. "summary": पूरे दस्तावेज़ का सरल हिंदी सारांश (नाम, तिथियाँ और राशियाँ बदले हुए भागों से लें, पिछले संस्करण से नहीं)
+
+पिछला शीर्षक: {previous.get('title', '')}
+पिछला सारांश: {previous.get('summary', '')}
+
+बदले हुए भाग:
+{joined}
+
+केवल वैध JSON वापस करें:"""
+    }
+    return prompt_templates[language]
+
+def revise_summary(previous: dict, summaries: list, language: str = 'en') -> dict:
+    """
+    Title and summary of a near-duplicate: the earlier analysis updated with
+    the summaries of the sections that differ
+    """
+    revise_model = get_model_registry().model_name_for(language) + '#revise'
+    joined = number_summaries(summaries)
+    key_text = f"{previous.get('title', '')}\n{previous.get('summary', '')}\n{joined}"
+    cached_result = analysis_cache.get(key_text, language, revise_model)
+    if cached_result is not None:
+        return cached_result
+    
+    result = generate_json(revise_prompt(previous, joined, language), language,
+                           response_parsing.SUMMARY_SCHEMA)
+    analysis_cache.put(key_text, language, revise_model, result)
+    return result
+
+def find_near_duplicate(document_text: str, language: str, user_id=None):
+    """
+    The closest earlier document with the same language, as (document_id,
+    similarity, original_text, analysis), or None. Lookup errors count as a miss.
+    """
+    if not NEAR_DUPLICATE_ENABLED or (user_id is None and NEAR_DUPLICATE_SCOPE == 'user'):
+        return None
+    try:
+        conn = storage.get_connection(DATABASE)
+        with metrics.timed('near_duplicate'):
+            owner = user_id if NEAR_DUPLICATE_SCOPE == 'user' else None
+            for doc_id, _ in near_duplicate_index.candidates(conn, document_text, language, owner):
+                doc = conn.execute('SELECT text_hash, analysis_hash FROM documents WHERE id = ?', (doc_id,)).fetchone()
+                if doc is None:
+                    continue
+                previous_text = blob_store.get_text(conn, doc['text_hash'])
+                # The signature only estimates similarity; confirm it on the actual shingles
+                similarity = jaccard(shingles(previous_text), shingles(document_text))
+                if similarity >= near_duplicate_index.threshold:
+                    return doc_id, similarity, previous_text, blob_store.get_json(conn, doc['analysis_hash'])
     except Exception as e:
-        raise Exception(f"Vertex AI analysis failed: {str(e)}")
+        print(f"Near-duplicate lookup failed: {e}")
+    return None
+
+def plan_near_duplicate(document_text: str, language: str = 'en', user_id=None):
+    """
+    Work out what a near-duplicate still needs from the model. Returns None when there
+    is no close enough match, otherwise a dict with the earlier 'previous' analysis, the
+    'reused' annotations, the 'chunks' of changed text to analyze and log fields.
+    """
+    match = find_near_duplicate(document_text, language, user_id)
+    if match is not None:
+        doc_id, similarity, previous_text, previous = match
+        changed = changed_sections(previous_text, document_text)
+        changed_chars = sum(end - start for start, end in changed)
+        if changed_chars > NEAR_DUPLICATE_MAX_CHANGED * len(document_text):
+            match = None
+    metrics.cache_lookup('near_duplicate', match is not None)
+    if match is None:
+        return None
+    
+    # Earlier highlights still apply where their text is unchanged
+    annotations = [a for a in previous.get('annotations') or [] if isinstance(a, dict)]
+    located = {}
+    for start, end, index in find_annotation_spans(document_text, annotations):
+        located.setdefault(index, []).append((start, end))
+    reused = [
+        annotation for index, annotation in enumerate(annotations)
+        if any(not any(c_start <= start and end <= c_end for c_start, c_end in changed)
+               for start, end in located.get(index, []))
+    ]
+    changed_text = ''.join(document_text[start:end] for start, end in changed)
+    return {
+        'previous': {'title': previous.get('title', 'Untitled Document'), 'summary': previous.get('summary', '')},
+        'reused': reused,
+        'chunks': chunk_text(prompt_text(changed_text, language), ANALYSIS_CHUNK_CHARS) if changed else [],
+        'log': {'matched_document_id': doc_id, 'similarity': round(similarity, 3), 'changed_sections': len(changed),
+                'changed_chars': changed_chars, 'total_chars': len(document_text), 'reused_annotations': len(reused)},
+    }
+
+def finish_near_duplicate(plan: dict, document_text: str, partial_results: list, revised: dict = None) -> dict:
+    """Combine a plan with the analyses of its changed chunks (and the revised title/summary)"""
+    result = dict(plan['previous'])
+    if revised:
+        result = {'title': revised.get('title', result['title']), 'summary': revised.get('summary', result['summary'])}
+    result['annotations'] = merge_annotations([{'annotations': plan['reused']}] + partial_results)
+    result['original_text'] = document_text
+    metrics.log_event('near_duplicate_reused', **plan['log'])
+    return result
 
-def analyze_with_ai(document_text: str) -> dict:
+def analyze_near_duplicate(document_text: str, language: str = 'en', user_id=None):
+    """
+    Reuse the analysis of a near-duplicate and send only the changed sections to the model.
+    Returns None when there is no close enough match, so the caller runs a full analysis.
+    """
+    plan = plan_near_duplicate(document_text, language, user_id)
+    if plan is None:
+        return None
+    if not plan['chunks']:
+        return finish_near_duplicate(plan, document_text, [])
+    partial_results = list(chunk_executor.map(lambda chunk: analyze_chunk(chunk, language), plan['chunks']))
+    revised = revise_summary(plan['previous'], section_summaries(partial_results), language)
+    return finish_near_duplicate(plan, document_text, partial_results, revised)
+
+def analysis_failed(error: Exception, lang: str) -> Exception:
+    """The exception shown to the user when the model call fails, in their language"""
+    error_messages = {
+        'en': f"AI analysis failed: {str(error)}",
+        'hi': f"AI विश्लेषण असफल: {str(error)}"
+    }
+    return Exception(error_messages.get(lang, error_messages['en']))
+
+def analyze_with_ai(document_text: str, lang: str = None, user_id=None) -> dict:
     """
     Main AI analysis function using Google Vertex AI
+    Uses the session language unless one is given (e.g. from a background job).
+    With a user_id, near-duplicates of that user's earlier documents are re-analyzed only where they differ.
     """
     if not document_text or len(document_text.strip()) < 10:
         raise Exception("Document text is too short for analysis")
     
-    lang = get_current_language()
+    if lang is None:
+        lang = get_current_language()
+    
+    # Identical documents (after whitespace normalization) reuse the stored analysis
+    model_name = get_model_registry().model_name_for(lang)
+    cached_result = analysis_cache.get(document_text, lang, model_name)
+    metrics.cache_lookup('analysis', cached_result is not None)
+    if cached_result is not None:
+        cached_result['original_text'] = document_text
+        return cached_result
     
     try:
-        return analyze_with_vertex_ai(document_text, lang)
+        result = analyze_near_duplicate(document_text, lang, user_id) or analyze_in_chunks(document_text, lang)
     except Exception as e:
-        error_messages = {
-            'en': f"AI analysis failed: {str(e)}",
-            'hi': f"AI विश्लेषण असफल: {str(e)}"
-        }
-        raise Exception(error_messages.get(lang, error_messages['en']))
+        raise analysis_failed(e, lang)
+    
+    analysis_cache.put(document_text, lang, model_name, result)
+    return result
+
+def stream_analysis(document_text: str, lang: str, user_id=None):
+    """
+    Streaming counterpart of analyze_with_ai for /analyze-stream.
+    
+    Yields (event, data) pairs as parts of the analysis become ready: 'title',
+    'summary', each 'annotation', and 'progress' for long documents analyzed
+    section by section. The last pair is ('result', analysis_result), the same
+    dict analyze_with_ai returns, already stored in the analysis cache. Cached
+    analyses and near-duplicates (see analyze_near_duplicate) are replayed at once.
+    """
+    if not document_text or len(document_text.strip()) < 10:
+        raise Exception("Document text is too short for analysis")
+    
+    model_name = get_model_registry().model_name_for(lang)
+    result = analysis_cache.get(document_text, lang, model_name)
+    metrics.cache_lookup('analysis', result is not None)
+    if result is not None:
+        result['original_text'] = document_text
+    else:
+        try:
+            result = analyze_near_duplicate(document_text, lang, user_id)
+        except Exception as e:
+            raise analysis_failed(e, lang)
+        if result is not None:
+            analysis_cache.put(document_text, lang, model_name, result)
+    if result is not None:
+        yield 'title', {'title': result.get('title', '')}
+        yield 'summary', {'summary': result.get('summary', '')}
+        for index, annotation in enumerate(result.get('annotations', [])):
+            yield 'annotation', {'index': index, 'annotation': annotation}
+        yield 'result', result
+        return
+    
+    try:
+        model_text = prompt_text(document_text, lang)
+        chunks = chunk_text(model_text, ANALYSIS_CHUNK_CHARS)
+        if len(chunks) <= 1:
+            # One model call: forward each part of the JSON as soon as it has been generated
+            stream = generate_json_stream(analysis_prompt(model_text, lang), lang)
+            while True:
+                try:
+                    event = next(stream)
+                except StopIteration as finished:
+                    result = finished.value
+                    break
+                if event[0] == 'field' and event[1] in ('title', 'summary'):
+                    yield event[1], {event[1]: event[2]}
+                elif event[0] == 'item' and event[1] == 'annotations':
+                    yield 'annotation', {'index': event[2], 'annotation': event[3]}
+            result['original_text'] = document_text
+        else:
+            # Map-reduce: report annotations section by section as the chunk calls finish
+            futures = [chunk_executor.submit(analyze_chunk, chunk, lang) for chunk in chunks]
+            shown = 0
+            for done, future in enumerate(as_completed(futures), 1):
+                for annotation in future.result().get('annotations', []):
+                    yield 'annotation', {'index': shown, 'annotation': annotation}
+                    shown += 1
+                yield 'progress', {'sections_done': done, 'sections': len(chunks)}
+            partial_results = [future.result() for future in futures]
+            summaries = section_summaries(partial_results)
+            reduced = reduce_chunk_summaries(summaries, lang)
+            result = {
+                'title': reduced.get('title', 'Untitled Document'),
+                'summary': reduced.get('summary', ''),
+                'annotations': merge_annotations(partial_results),
+                'original_text': document_text
+            }
+            yield 'title', {'title': result['title']}
+            yield 'summary', {'summary': result['summary']}
+    except Exception as e:
+        raise analysis_failed(e, lang)
+    
+    analysis_cache.put(document_text, lang, model_name, result)
+    yield 'result', result
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # --- Auth Routes ---
 @app.route('/register', methods=['GET', 'POST'])
@@ -366,6 +915,8 @@ def logout():
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
+    # Analysis pages are kept in the browser cache (revalidated on every view); drop them on logout
+    response.headers['Clear-Site-Data'] = '"cache"'
     
     flash('You have been logged out successfully.')
     return response
@@ -373,7 +924,8 @@ def logout():
 # --- Home page (public) ---
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return render_template('index.html', upload_types=', '.join(UPLOAD_TYPE_NAMES),
+                           upload_accept=','.join(UPLOAD_EXTENSIONS))
 
 @app.route('/set_language/<language>')
 def set_language(language):
@@ -383,6 +935,47 @@ def set_language(language):
     # Redirect back to the page they came from, or dashboard if logged in, or home if not
     return redirect(request.referrer or (url_for('dashboard') if current_user.is_authenticated else url_for('home')))
 
+def warm_up():
+    """
+    Initialize Vertex AI and build the model handles for every supported language.
+    Called from the gunicorn post_fork hook when VERTEX_WARM_UP is enabled.
+    """
+    return get_model_registry().warm_up(tuple(LANGUAGES))
+
+@app.cli.command('warm-up')
+def warm_up_command():
+    """Initialize Vertex AI credentials and model handles"""
+    print(json.dumps(warm_up()))
+
+@app.cli.command('index-near-duplicates')
+def index_near_duplicates_command():
+    """Add documents saved before near-duplicate detection to its index"""
+    conn = storage.get_connection(DATABASE)
+    rows = conn.execute(
+        "SELECT id, user_id, text_hash, COALESCE(language, 'en') FROM documents "
+        'WHERE id NOT IN (SELECT document_id FROM near_duplicate_signatures) ORDER BY id'
+    ).fetchall()
+    for doc_id, user_id, text_hash, language in rows:
+        near_duplicate_index.add(conn, doc_id, user_id, language, blob_store.get_text(conn, text_hash))
+    conn.commit()
+    print(f"Indexed {len(rows)} documents")
+
+@app.route('/healthz')
+def healthz():
+    """Health check that also reports whether the Vertex AI models are warm"""
+    return jsonify({
+        'status': 'ok',
+        'vertex_ai': get_model_registry().health(),
+        'service_clients': service_clients.status()
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, call/error counters, cache hits, prompt sizes"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(METRICS_DIR), mimetype='text/plain; version=0.0.4')
+
 def extract_text_from_image(image_file):
     """
     Extract text from an uploaded image file using Google Cloud Vision API.
@@ -393,62 +986,203 @@ def extract_text_from_image(image_file):
     Returns:
         str: The extracted text from the image
     """
+    return extract_text_from_image_bytes(image_file.read())
+
+def extract_text_from_image_bytes(content):
+    """
+    Extract text from raw image bytes using Google Cloud Vision API.
+    
+    Args:
+        content: The image file content
+        
+    Returns:
+        str: The extracted text from the image
+    """
+    return extract_text_from_uploads([('image.png', content)]).text
+
+def extract_text_from_uploads(uploads):
+    """
+    Extract text from uploaded PDFs and images with batched Vision requests.
+    Images are shrunk to grayscale first, and uploads OCR'd before come from the cache.
+    
+    Args:
+        uploads: List of (filename, bytes) in the order the user chose them
+        
+    Returns:
+        OcrResult: The text in page order plus per-page timings and bytes sent
+    """
+    vision_client = service_clients.get_vision_client()
     if vision_client is None:
         raise Exception("Vision API not configured. Please set up Google Cloud credentials.")
     
     try:
-        # Read the file content
-        content = image_file.read()
-        
-        # Create an image object for the Vision API
-        image = vision.Image(content=content)
-        
-        # Perform OCR on the image
-        response = vision_client.text_detection(image=image)
-        texts = response.text_annotations
-        
-        # Check if any text was found
-        if not texts:
-            return ""
-            
-        # The first text annotation contains all the text in the image
-        full_text = texts[0].description
-        
-        # Check for errors
-        if response.error.message:
-            raise Exception(f"Vision API error: {response.error.message}")
-            
-        return full_text
-        
+        with metrics.timed('ocr'):
+            result = BatchOcr(
+                vision_client,
+                service_clients.vision_module(),
+                ocr_executor,
+                cache=ocr_cache,
+                max_pages=OCR_MAX_PAGES,
+                timeout=OCR_TIMEOUT,
+                image_max_side=OCR_IMAGE_MAX_SIDE
+            ).extract(uploads)
     except Exception as e:
-        print(f"Error extracting text from image: {e}")
+        print(f"Error extracting text from {len(uploads)} upload(s): {e}")
         raise e
+    
+    summary = result.summary()
+    metrics.cache_lookup('ocr_page', True, summary['cached_pages'])
+    metrics.cache_lookup('ocr_page', False, summary['pages'] - summary['cached_pages'])
+    metrics.log_event('ocr', **{key: value for key, value in summary.items() if key != 'timings'})
+    return result
+
+def save_document(analysis_result, user_id, conn=None, commit=True, language=None):
+    """
+    Insert an analysis result into the documents table and return the new ID.
+    Uses the thread's own connection when called outside a request (e.g. from a job).
+    With commit=False the caller commits, so several documents can share one transaction.
+    Documents saved with their analysis language are indexed for near-duplicate detection,
+    and can be shown in other languages (see analysis_variant).
+    """
+    if conn is None:
+        conn = storage.get_connection(DATABASE)
+    
+    # Text and analysis are stored once per distinct content, compressed, in the blobs table
+    analysis_payload = {k: v for k, v in analysis_result.items() if k != 'original_text'}
+    with metrics.timed('db_write'):
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO documents (title, user_id, text_hash, analysis_hash, language) VALUES (?, ?, ?, ?, ?)',
+            (
+                analysis_result.get('title', 'Untitled Document'),
+                user_id,
+                blob_store.put_blob(conn, analysis_result.get('original_text') or ''),
+                blob_store.put_json(conn, analysis_payload),
+                language
+            )
+        )
+        new_doc_id = cursor.lastrowid # Get the ID of the new document
+        save_annotation_spans(conn, new_doc_id, analysis_result)
+        search_index.index_document(
+            conn, new_doc_id, user_id, analysis_result.get('title', 'Untitled Document'),
+            analysis_result.get('summary', ''), analysis_result.get('original_text') or ''
+        )
+        if language and NEAR_DUPLICATE_ENABLED:
+            near_duplicate_index.add(conn, new_doc_id, user_id, language, analysis_result.get('original_text') or '')
+        if commit:
+            conn.commit()
+    if commit:
+        metrics.log_event('document_saved', document_id=new_doc_id, user_id=user_id)
+    return new_doc_id
+
+def save_documents(batch, conn=None, language=None):
+    """
+    Insert several (user_id, analysis_result) pairs in a single transaction.
+    Returns the new IDs in order; if the transaction fails, each document is
+    retried on its own and a failed one is represented by its exception.
+    """
+    if conn is None:
+        conn = storage.get_connection(DATABASE)
+    
+    try:
+        doc_ids = [save_document(result, user_id, conn, commit=False, language=language) for user_id, result in batch]
+        conn.commit()
+        metrics.log_event('documents_saved', document_ids=doc_ids)
+        return doc_ids
+    except Exception as e:
+        conn.rollback()
+        print(f"Batch insert of {len(batch)} documents failed, saving them one at a time: {e}")
+    
+    outcomes = []
+    for user_id, result in batch:
+        try:
+            outcomes.append(save_document(result, user_id, conn, language=language))
+        except Exception as e:
+            conn.rollback()
+            print(f"Database error: {e}")
+            outcomes.append(e)
+    return outcomes
+
+def save_annotation_spans(conn, doc_id, analysis_result):
+    """
+    Locate every annotation in the original text once, at save time, so pages
+    never have to search for highlights. Returns the spans it stored.
+    """
+    annotations = analysis_result.get('annotations')
+    if not isinstance(annotations, list):
+        annotations = []
+    spans = find_annotation_spans(analysis_result.get('original_text') or '', annotations)
+    conn.executemany(
+        'INSERT INTO document_spans (document_id, start_offset, end_offset, annotation_index) VALUES (?, ?, ?, ?)',
+        [(doc_id, start, end, index) for start, end, index in spans]
+    )
+    return spans
+
+def build_highlight_segments(conn, doc_id, analysis_data):
+    """
+    Turn the stored spans into non-overlapping segments for results.html:
+    a list of {'text': ..., 'explanations': [...]} in document order.
+    """
+    original_text = analysis_data.get('original_text') or ''
+    annotations = analysis_data.get('annotations')
+    if not isinstance(annotations, list):
+        annotations = []
+    
+    spans = [tuple(row) for row in conn.execute(
+        'SELECT start_offset, end_offset, annotation_index FROM document_spans WHERE document_id = ?',
+        (doc_id,)
+    )]
+    if not spans and annotations:
+        # Documents saved before spans were indexed get them on first view
+        spans = save_annotation_spans(conn, doc_id, analysis_data)
+        conn.commit()
+    
+    segments = []
+    for text, indexes in merge_spans(original_text, spans):
+        explanations = [
+            annotations[index].get('explanation', '')
+            for index in indexes
+            if index < len(annotations) and isinstance(annotations[index], dict)
+        ]
+        segments.append({'text': text, 'explanations': explanations})
+    return segments
+
+# Background analysis jobs keep the sync gunicorn workers free while OCR and Vertex AI run
+job_queue = JobQueue(
+    DATABASE,
+    ocr=extract_text_from_uploads,
+    analyze=analyze_with_ai,
+    persist=save_document,
+    preview=provisional_analysis,
+    max_workers=int(os.getenv('JOB_WORKERS', 2)),
+    max_pending=int(os.getenv('JOB_QUEUE_SIZE', 20))
+)
+
+# Bulk analysis (/analyze-batch): documents of all running batches share this pool
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))  # Documents in flight per batch, within the analyze policy
+BATCH_MAX_DOCUMENTS = int(os.getenv('BATCH_MAX_DOCUMENTS', 500))
+BATCH_COMMIT_SIZE = int(os.getenv('BATCH_COMMIT_SIZE', 25))  # Documents saved per transaction
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', 8)), thread_name_prefix='batch-document')
 
 @app.route('/analyze', methods=['POST'])
 @login_required
+@admission_required('analyze')
 def analyze_document():
     document_text = request.get_json().get('text', '')
     if not document_text:
         return jsonify({"error": "No text provided"}), 400
 
-    analysis_result = analyze_with_ai(document_text)
+    lang = get_current_language()
+    try:
+        analysis_result = analyze_with_ai(document_text, lang, current_user.id)
+    except Exception as e:
+        # The model error can include Vertex AI internals; log it, don't return it
+        print(f"Analysis failed: {e}")
+        return jsonify({"error": "Failed to analyze document"}), 500
 
     if analysis_result:
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO documents (title, original_text, analysis_json, user_id) VALUES (?, ?, ?, ?)',
-                (
-                    analysis_result.get('title', 'Untitled Document'),
-                    analysis_result.get('original_text'),
-                    json.dumps(analysis_result),
-                    current_user.id
-                )
-            )
-            new_doc_id = cursor.lastrowid # Get the ID of the new document
-            conn.commit()
-            print(f"Saved document with ID {new_doc_id} to database.")
+            new_doc_id = save_document(analysis_result, current_user.id, get_db(), language=lang)
             # Return the new ID so the frontend can redirect
             return jsonify({"success": True, "new_document_id": new_doc_id})
         except Exception as e:
@@ -456,101 +1190,541 @@ def analyze_document():
             return jsonify({"error": "Could not save to database"}), 500
     else:
         return jsonify({"error": "Failed to analyze document"}), 500
+
+@app.route('/analyze-stream', methods=['POST'])
+@login_required
+@admission_required('analyze')
+def analyze_stream():
+    """
+    Analyze pasted text and stream the title, summary and each annotation as
+    Server-Sent Events while the model is still writing. A 'provisional' event
+    with rule-based clause highlights comes first. The finished analysis
+    is saved exactly like /analyze and announced with a final 'done' event.
+    """
+    payload = request.get_json(silent=True) or {}
+    document_text = (payload.get('text') or request.form.get('text', '')).strip()
+    if not document_text:
+        return jsonify({"error": "No text provided"}), 400
+
+    # Read everything request-bound now; the generator runs after this view returns
+    user_id = current_user.id
+    lang = get_current_language()
+    started = time.perf_counter()
+
+    def generate():
+        yield sse_event('provisional', provisional_analysis(document_text, lang))
+        yield sse_event('status', {'stage': 'analyze'})
+        first_content_ms = None
+        try:
+            for event, data in stream_analysis(document_text, lang, user_id):
+                if event != 'result':
+                    if first_content_ms is None:
+                        first_content_ms = round((time.perf_counter() - started) * 1000)
+                        print(f"Streaming analysis: first content after {first_content_ms}ms")
+                    yield sse_event(event, data)
+                    continue
+
+                try:
+                    new_doc_id = save_document(data, user_id, get_db(), language=lang)
+                except Exception as e:
+                    print(f"Database error: {e}")
+                    yield sse_event('error', {'error': "Could not save to database"})
+                    return
+                yield sse_event('done', {
+                    'new_document_id': new_doc_id,
+                    'url': url_for('view_analysis', doc_id=new_doc_id),
+                    'first_content_ms': first_content_ms,
+                    'total_ms': round((time.perf_counter() - started) * 1000)
+                })
+        except Exception as e:
+            print(f"Streaming analysis failed: {e}")
+            yield sse_event('error', {'error': "Failed to analyze document"})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Let nginx pass events through unbuffered
+    return response
+
+class UploadRejected(Exception):
+    """An /analyze-document request without a usable document; the message is shown to the user"""
+
+def read_document_upload():
+    """
+    The document of an /analyze-document request as (document_text, uploads):
+    either the pasted text, or the uploaded files as a list of (filename, bytes).
+    """
+    # Check if files were uploaded (a multi-page PDF and/or several page images)
+    files = [file for file in request.files.getlist('document') if file.filename]
+    if files:
+        if len(files) > OCR_MAX_FILES:
+            raise UploadRejected(f"Upload at most {OCR_MAX_FILES} files at a time")
         
+        # Validate file types
+        if not all(is_supported_upload(file.filename) for file in files):
+            raise UploadRejected(f"Only {', '.join(UPLOAD_TYPE_NAMES[:-1])} and {UPLOAD_TYPE_NAMES[-1]} files are allowed")
+        
+        # Read the uploads now; the request stream is gone once the view returns
+        return None, [(file.filename, file.read()) for file in files]
+    
+    # Otherwise check for text input
+    if 'text' in request.form and request.form['text'].strip():
+        return request.form['text'].strip(), None
+    
+    raise UploadRejected("No document or text provided")
+
 @app.route('/analyze-document', methods=['POST'])
 @login_required
+@admission_required('analyze')
 def analyze_document_upload():
     """
-    Handle document analysis from either text input or file upload.
-    Uses Vision API for image uploads.
+    Queue document analysis from either text input or file uploads.
+    Uses Vision API for PDF and image uploads.
+    
+    Returns 202 with a job ID; poll /jobs/<job_id> for the new document ID.
     """
     try:
-        document_text = ""
+        try:
+            document_text, uploads = read_document_upload()
+        except UploadRejected as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Check if a file was uploaded
-        if 'document' in request.files and request.files['document'].filename:
-            file = request.files['document']
-            
-            # Validate file type
-            if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                return jsonify({"error": "Only PNG, JPG, and JPEG files are allowed"}), 400
-                
-            try:
-                # Extract text from the image
-                document_text = extract_text_from_image(file)
-                
-                if not document_text:
-                    return jsonify({"error": "Could not extract text from the image"}), 400
-                    
-            except Exception as e:
-                print(f"Error during OCR: {e}")
-                return jsonify({"error": "Failed to process the image"}), 500
-                
-        # Otherwise check for text input
-        elif 'text' in request.form and request.form['text'].strip():
-            document_text = request.form['text'].strip()
-            
-        else:
-            return jsonify({"error": "No document or text provided"}), 400
-            
-        # Analyze the text with the AI
-        analysis_result = analyze_with_ai(document_text)
+        try:
+            # The in-flight lease lasts until the job finishes, not just this request
+            job_id = job_queue.submit(
+                current_user.id,
+                get_current_language(),
+                text=document_text,
+                uploads=uploads,
+                on_finish=g.admission_ticket.release
+            )
+            g.admission_ticket.transfer()
+        except QueueFull as e:
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 503
         
-        if analysis_result:
-            try:
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute(
-                    'INSERT INTO documents (title, original_text, analysis_json, user_id) VALUES (?, ?, ?, ?)',
-                    (
-                        analysis_result.get('title', 'Untitled Document'),
-                        analysis_result.get('original_text'),
-                        json.dumps(analysis_result),
-                        current_user.id
-                    )
-                )
-                new_doc_id = cursor.lastrowid
-                conn.commit()
-                print(f"Saved document with ID {new_doc_id} to database.")
-                # Return the new ID so the frontend can redirect
-                return jsonify({"success": True, "new_document_id": new_doc_id})
-                
-            except Exception as e:
-                print(f"Database error: {e}")
-                return jsonify({"error": "Could not save to database"}), 500
-        else:
-            return jsonify({"error": "Failed to analyze document"}), 500
+        status_url = url_for('job_status', job_id=job_id)
+        response = jsonify({"success": True, "job_id": job_id, "status_url": status_url})
+        response.headers['Location'] = status_url
+        return response, 202
             
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
+@app.route('/analyze-batch', methods=['POST'])
+@login_required
+@admission_required('batch')
+def analyze_batch():
+    """
+    Analyze a whole batch of documents: a zip of .txt/.pdf/.png/.jpg files or a
+    JSONL file with one {"name", "text"} (or {"filename", "content_base64"})
+    object per line, uploaded as the "batch" field or sent as the request body.
+    
+    Streams NDJSON while the batch runs: a 'batch' line with the document
+    count, one 'document' line per document (its new ID and URL, or an
+    error) in completion order, and a final 'summary' line.
+    """
+    upload = request.files.get('batch')
+    if upload and upload.filename:
+        filename, data = upload.filename, upload.stream
+    elif request.content_length and not request.files:
+        filename, data = '', io.BytesIO(request.get_data())
+    else:
+        return jsonify({"error": "No batch provided"}), 400
+    
+    try:
+        items = read_batch(filename, data, max_documents=BATCH_MAX_DOCUMENTS,
+                           max_document_bytes=app.config['MAX_CONTENT_LENGTH'])
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Read everything request-bound now; the generator runs after this view returns
+    user_id = current_user.id
+    lang = get_current_language()
+    started = time.perf_counter()
+    runner = BatchRunner(
+        batch_executor,
+        ocr=extract_text_from_uploads,
+        analyze=analyze_with_ai,
+        persist_many=lambda batch: save_documents(batch, get_db(), language=lang),
+        concurrency=BATCH_CONCURRENCY,
+        commit_size=BATCH_COMMIT_SIZE,
+        admit=lambda user_id: admission_control.admit('analyze', user_id)  # Same quota as /analyze
+    )
+    
+    def generate():
+        yield json.dumps({'type': 'batch', 'documents': len(items)}) + '\n'
+        counts = {'ok': 0, 'error': 0}
+        for result in runner.run(items, user_id, lang):
+            counts[result['status']] += 1
+            if result['status'] == 'ok':
+                result['url'] = url_for('view_analysis', doc_id=result['document_id'])
+            yield json.dumps({'type': 'document', **result}, ensure_ascii=False) + '\n'
+        elapsed_ms = round((time.perf_counter() - started) * 1000)
+        metrics.log_event('batch_finished', user_id=user_id, documents=len(items), succeeded=counts['ok'],
+                          failed=counts['error'], elapsed_ms=elapsed_ms)
+        yield json.dumps({'type': 'summary', 'succeeded': counts['ok'], 'failed': counts['error'],
+                          'elapsed_ms': elapsed_ms}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Let nginx pass lines through unbuffered
+    return response
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Report the state of a background analysis job"""
+    job = job_queue.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
 # --- Protected Routes ---
 @app.route('/dashboard')
 @login_required
 def dashboard():
     conn = get_db()
-    # Fetch all documents for the current user, with the most recent ones first
-    documents = conn.execute('SELECT id, created, title FROM documents WHERE user_id = ? ORDER BY created DESC', (current_user.id,)).fetchall()
-    # Pass the list of documents to the dashboard template
-    return render_template('dashboard.html', documents=documents)
+    query = request.args.get('q', '').strip()
+    if query:
+        with metrics.timed('db_read'):
+            results = search_index.search(conn, current_user.id, query, limit=DASHBOARD_PAGE_SIZE)
+        return render_template('dashboard.html', documents=results, query=query, next_cursor=None)
+
+    # Keyset pagination: each page starts after the (created, id) of the last row shown,
+    # so deep pages cost the same as the first one
+    cursor = parse_page_cursor(request.args.get('before'))
+    with metrics.timed('db_read'):
+        if cursor:
+            documents = conn.execute(
+                'SELECT id, created, title FROM documents WHERE user_id = ? AND (created, id) < (?, ?) '
+                'ORDER BY created DESC, id DESC LIMIT ?',
+                (current_user.id, cursor[0], cursor[1], DASHBOARD_PAGE_SIZE + 1)
+            ).fetchall()
+        else:
+            documents = conn.execute(
+                'SELECT id, created, title FROM documents WHERE user_id = ? ORDER BY created DESC, id DESC LIMIT ?',
+                (current_user.id, DASHBOARD_PAGE_SIZE + 1)
+            ).fetchall()
+
+    next_cursor = None
+    if len(documents) > DASHBOARD_PAGE_SIZE:
+        documents = documents[:DASHBOARD_PAGE_SIZE]
+        next_cursor = f"{documents[-1]['created']}|{documents[-1]['id']}"
+    return render_template('dashboard.html', documents=documents, query='', next_cursor=next_cursor,
+                           paged=cursor is not None)
+
+def parse_page_cursor(value):
+    """Parse a 'created|id' dashboard cursor; anything malformed means the first page"""
+    if not value or '|' not in value:
+        return None
+    created, _, doc_id = value.rpartition('|')
+    try:
+        return created, int(doc_id)
+    except ValueError:
+        return None
+
+@app.route('/search')
+@login_required
+def search_documents():
+    """Ranked full-text search over the current user's analyses, with highlighted snippets"""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+    except ValueError:
+        limit = 20
+    started = time.perf_counter()
+    with metrics.timed('db_read'):
+        results = search_index.search(get_db(), current_user.id, query, limit=limit)
+    took_ms = (time.perf_counter() - started) * 1000
+    for result in results:
+        result['snippet'] = str(result['snippet'])
+        result['url'] = url_for('view_analysis', doc_id=result['id'])
+    return jsonify({'query': query, 'results': results, 'took_ms': round(took_ms, 2)})
+
+def translation_prompt(fields: str, language: str = 'en') -> str:
+    """Prompt that translates the text fields of an analysis (as JSON) into language"""
+    prompt_templates = {
+        'en': f"""Translate the values of this JSON object from a legal document analysis into plain English. Keep the same keys and the same number of "explanations", in the same order.
+
+{fields}
+
+Return only valid JSON:""",
+        'hi': f"""कानूनी दस्तावेज़ विश्लेषण के इस JSON ऑब्जेक्ट के मानों का सरल हिंदी में अनुवाद करें। वही कुंजियाँ रखें और "explanations" की संख्या और क्रम वही रखें।
+
+{fields}
+
+केवल वैध JSON वापस करें:"""
+    }
+    return prompt_templates[language]
+
+def translate_analysis(analysis_data: dict, language: str) -> dict:
+    """
+    The analysis with its title, summary and annotation explanations in language.
+    Only those fields go to the model, not the document; text_to_highlight stays
+    as quoted from the document so the highlights still line up.
+    """
+    annotations = analysis_data.get('annotations')
+    if not isinstance(annotations, list):
+        annotations = []
+    fields = json.dumps({
+        'title': analysis_data.get('title', ''),
+        'summary': analysis_data.get('summary', ''),
+        'explanations': [a.get('explanation', '') if isinstance(a, dict) else '' for a in annotations]
+    }, ensure_ascii=False)
+    
+    # Identical analyses (e.g. of re-uploaded documents) share one translation
+    translate_model = get_model_registry().model_name_for(language) + '#translate'
+    translated = analysis_cache.get(fields, language, translate_model)
+    metrics.cache_lookup('analysis_translation', translated is not None)
+    if translated is None:
+        translated = generate_json(translation_prompt(fields, language), language,
+                                   response_parsing.TRANSLATION_SCHEMA)
+        analysis_cache.put(fields, language, translate_model, translated)
+    
+    explanations = translated.get('explanations')
+    if not isinstance(explanations, list):
+        explanations = []
+    variant = {k: v for k, v in analysis_data.items() if k != 'original_text'}
+    variant['title'] = translated.get('title') or analysis_data.get('title', '')
+    variant['summary'] = translated.get('summary') or analysis_data.get('summary', '')
+    # Annotations keep their order (the span index refers to them by position)
+    variant['annotations'] = [
+        dict(annotation, explanation=explanations[index] if index < len(explanations) and explanations[index]
+             else annotation.get('explanation', '')) if isinstance(annotation, dict) else annotation
+        for index, annotation in enumerate(annotations)
+    ]
+    variant['language'] = language
+    return variant
+
+def analysis_variant(conn, doc_id: int, analysis_data: dict, language: str) -> dict:
+    """
+    The document's analysis in another language, translated on first request and
+    stored in document_variants. Raises admission.Rejected or the model error.
+    """
+    with metrics.timed('db_read'):
+        row = conn.execute(
+            'SELECT analysis_hash FROM document_variants WHERE document_id = ? AND language = ?', (doc_id, language)
+        ).fetchone()
+    metrics.cache_lookup('analysis_variant', row is not None)
+    if row is not None:
+        return blob_store.get_json(conn, row['analysis_hash'])
+    
+    # A translation is a (small) model call, so it is admitted like an analysis
+    ticket = admission_control.admit('analyze', current_user.id)
+    try:
+        variant = translate_analysis(analysis_data, language)
+    finally:
+        ticket.release()
+    with metrics.timed('db_write'):
+        conn.execute(
+            'INSERT OR REPLACE INTO document_variants (document_id, language, analysis_hash, created_at) '
+            'VALUES (?, ?, ?, ?)',
+            (doc_id, language, blob_store.put_json(conn, variant), time.time())
+        )
+        conn.commit()
+    metrics.log_event('analysis_variant_saved', document_id=doc_id, language=language)
+    return variant
+
+def analysis_page_response(page):
+    """
+    A cached analysis page, or 304 when the browser already has it. The page may be
+    stored by the browser (never by shared caches) but is revalidated on every view,
+    so the login and owner checks always run first.
+    """
+    response = Response(page.body, mimetype='text/html')
+    response.set_etag(page.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Cookie'  # The session picks the user and the language
+    return response.make_conditional(request)
 
 @app.route('/analysis/<int:doc_id>')
 @login_required
 def view_analysis(doc_id):
-    conn = get_db()
-    # Fetch the specific document by its ID and the current user's ID
-    doc = conn.execute('SELECT analysis_json FROM documents WHERE id = ? AND user_id = ?', (doc_id, current_user.id)).fetchone()
+    """Show an analysis in the language chosen with /set_language, translating it on first view"""
+    lang = get_current_language()
+    page_key = (doc_id, lang, ANALYSIS_PAGE_VERSION)
+    # Pending flash messages are rendered into the page, so such a view is neither served from nor stored in the cache
+    has_flashes = bool(session.get('_flashes'))
+    page = analysis_pages.get(page_key)
+    hit = page is not None and page.user_id == current_user.id and not has_flashes
+    metrics.cache_lookup('analysis_page', hit)
+    if hit:
+        return analysis_page_response(page)
     
-    if doc is None:
-        flash('Document not found or access denied.')
-        return redirect(url_for('dashboard'))
+    conn = get_db()
+    with metrics.timed('db_read'):
+        # Fetch the specific document by its ID and the current user's ID
+        doc = conn.execute('SELECT text_hash, analysis_hash, language FROM documents WHERE id = ? AND user_id = ?', (doc_id, current_user.id)).fetchone()
         
-    # The analysis_json is a string, so we need to parse it back into a dictionary
-    analysis_data = json.loads(doc['analysis_json'])
+        if doc is None:
+            flash('Document not found or access denied.')
+            return redirect(url_for('dashboard'))
+            
+        # The analysis and the original text are stored as separate compressed blobs
+        analysis_data = blob_store.get_json(conn, doc['analysis_hash'])
+        original_text = blob_store.get_text(conn, doc['text_hash'])
+    
+    if lang != (doc['language'] or 'en') and lang in LANGUAGES:
+        try:
+            analysis_data = analysis_variant(conn, doc_id, analysis_data, lang)
+        except Exception as e:
+            print(f"Could not translate document {doc_id} to {lang}: {e}")
+            flash(get_translation('translation_unavailable'))
+            has_flashes = True
+    analysis_data['original_text'] = original_text
+    
+    with metrics.timed('db_read'):
+        # Highlights come pre-located and pre-merged from the span index
+        segments = build_highlight_segments(conn, doc_id, analysis_data)
     
     # Pass this data to our existing results template
-    return render_template('results.html', analysis_data=analysis_data)
+    with metrics.timed('render'):
+        html = render_template('results.html', analysis_data=analysis_data, segments=segments)
+    if has_flashes:
+        return html
+    return analysis_page_response(analysis_pages.put(page_key, current_user.id, html.encode('utf-8')))
+
+class TTSNotConfigured(Exception):
+    """Raised when the Text-to-Speech client could not be created"""
+
+def speech_request(text, lang_config):
+    """Keyword arguments of a synthesize_speech call (shared by the sync and async clients)"""
+    texttospeech = service_clients.tts_module()
+    
+    # Set the text input to be synthesized
+    synthesis_input = texttospeech.SynthesisInput(text=text)
+    
+    # Build the voice request based on selected language
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=lang_config['tts_code'],
+        name=lang_config['tts_voice'],
+        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+    )
+    
+    # Select the type of audio file to return
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.MP3,
+        speaking_rate=TTS_SPEAKING_RATE,
+        pitch=0.0,  # Default pitch
+        volume_gain_db=0.0  # Default volume
+    )
+    return {'input': synthesis_input, 'voice': voice, 'audio_config': audio_config}
+
+def synthesize_speech(text, lang_config):
+    """
+    Synthesize text with Google Cloud Text-to-Speech and return the MP3 bytes
+    """
+    tts_client = service_clients.get_tts_client()
+    if tts_client is None:
+        raise TTSNotConfigured('Text-to-Speech API not configured. Please set up Google Cloud credentials.')
+    
+    # Perform the text-to-speech request
+    request_kwargs = speech_request(text, lang_config)
+    with metrics.timed('tts'):
+        response = tts_client.synthesize_speech(**request_kwargs)
+    return response.audio_content
+
+def send_cached_audio(path, audio_key):
+    """
+    Serve a cached audio file straight from disk.
+    Conditional (ETag/Last-Modified -> 304) and Range requests are handled for GET.
+    """
+    response = send_file(
+        path,
+        mimetype='audio/mpeg',
+        as_attachment=False,
+        download_name='summary.mp3',
+        conditional=True,
+        etag=audio_key,
+        max_age=TTS_CACHE_MAX_AGE
+    )
+    # Audio is only reachable by logged-in users, so keep it out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+def stream_speech(text, lang_config, key, synthesis=None):
+    """
+    Synthesize sentence-aligned segments concurrently and stream the MP3 frames in order.
+    
+    The first segment is awaited before the response starts, so synthesis errors
+    still produce a proper error status; its latency is reported in the headers.
+    The complete audio is written to the cache once the stream finishes, which
+    also finishes the synthesis claim (see AudioCache.claim) if one is given.
+    """
+    # Only synthesis is admission-controlled; cached audio is served freely
+    ticket = admission_control.admit('tts', current_user.id)
+    started = time.perf_counter()
+    sentences = split_sentences(text, lang_config.get('sentence_terminators', '.!?'))
+    segments = pack_by_bytes(sentences, TTS_SEGMENT_MAX_BYTES, TTS_FIRST_SEGMENT_MAX_BYTES)
+    futures = [tts_executor.submit(synthesize_speech, segment, lang_config) for segment in segments]
+    try:
+        first_audio = futures[0].result()
+    except Exception:
+        ticket.release()
+        for future in futures:
+            future.cancel()
+        raise
+    first_byte_ms = (time.perf_counter() - started) * 1000
+    
+    def generate():
+        parts = [first_audio]
+        completed = False
+        try:
+            yield first_audio
+            for future in futures[1:]:
+                audio = future.result()
+                parts.append(audio)
+                yield audio
+            completed = True
+        finally:
+            if completed:
+                tts_audio_cache.put(key, b''.join(parts))
+            else:
+                for future in futures:
+                    future.cancel()
+            if synthesis is not None:
+                tts_audio_cache.finish(key, synthesis)
+    
+    response = Response(stream_with_context(generate()), mimetype='audio/mpeg')
+    response.call_on_close(ticket.release)
+    if synthesis is not None:
+        # Also when the stream is never iterated (the generator's finally does not run then)
+        response.call_on_close(lambda: tts_audio_cache.finish(key, synthesis))
+    response.headers['X-TTS-Segments'] = str(len(segments))
+    response.headers['X-TTS-First-Byte-Ms'] = f'{first_byte_ms:.0f}'
+    response.headers['Server-Timing'] = f'tts-first-segment;dur={first_byte_ms:.1f}'
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def speech_response(text, lang_config, key):
+    """
+    The audio for key: the cached file, or synthesized and streamed by this request.
+    While another request in this process is synthesizing the same audio, wait for
+    it (up to TTS_COALESCE_WAIT seconds) and serve the file it cached.
+    """
+    deadline = time.monotonic() + TTS_COALESCE_WAIT
+    while True:
+        path = tts_audio_cache.get(key)
+        if path is not None:
+            return send_cached_audio(path, key)
+        leader, synthesis = tts_audio_cache.claim(key)
+        if leader:
+            break
+        TTS_COALESCED.inc()
+        if not wait([synthesis], timeout=max(deadline - time.monotonic(), 0)).done:
+            return stream_speech(text, lang_config, key)  # Waited long enough; synthesize alongside it
+        # It finished: loop to serve its file, or to synthesize if it failed
+    try:
+        return stream_speech(text, lang_config, key, synthesis)
+    except BaseException:
+        tts_audio_cache.finish(key, synthesis)
+        raise
 
 @app.route('/text-to-speech', methods=['POST'])
 @login_required
@@ -559,11 +1733,11 @@ def text_to_speech():
     Convert text to speech using Google Cloud Text-to-Speech API
     Supports both English and Hindi based on user's language preference
     
-    Returns the audio file as a response that can be played in the browser
+    Returns the audio as a response that can be played in the browser; uncached
+    text is synthesized sentence by sentence and streamed as it becomes ready.
+    Clients that prefer JSON get {"audio_url": ...} instead and synthesis starts
+    when that URL is fetched. Audio is cached on disk, so repeat plays never call the API.
     """
-    if tts_client is None:
-        return jsonify({'error': 'Text-to-Speech API not configured. Please set up Google Cloud credentials.'}), 503
-    
     try:
         # Get the text from the request
         data = request.get_json()
@@ -576,43 +1750,54 @@ def text_to_speech():
         lang = get_current_language()
         lang_config = LANGUAGES.get(lang, LANGUAGES['en'])
         
-        # Set the text input to be synthesized
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+        key = audio_key(text, lang_config['tts_voice'], TTS_SPEAKING_RATE, 'MP3')
+        path = tts_audio_cache.get(key)
+        metrics.cache_lookup('tts_audio', path is not None)
         
-        # Build the voice request based on selected language
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=lang_config['tts_code'],
-            name=lang_config['tts_voice'],
-            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-        )
-        
-        # Select the type of audio file to return
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=0.9,  # Slightly slower than default for better comprehension
-            pitch=0.0,  # Default pitch
-            volume_gain_db=0.0  # Default volume
-        )
-        
-        # Perform the text-to-speech request
-        response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
+        if request.accept_mimetypes.best_match(['audio/mpeg', 'application/json']) == 'application/json':
+            if path is None and tts_audio_cache.get_pending(key) is None:
+                # A new pending request takes cache space and leads to a synthesis, so it is rate limited too
+                admission_control.admit('tts', current_user.id).release()
+                tts_audio_cache.put_pending(key, {'text': text, 'language': lang})
+            return jsonify({'audio_url': url_for('text_to_speech_audio', audio_key=key)})
         
-        # Create an in-memory bytes buffer
-        audio_buffer = io.BytesIO(response.audio_content)
-        audio_buffer.seek(0)
+        if path is None:
+            return speech_response(text, lang_config, key)
         
         # Return the audio as a file response
-        return send_file(
-            audio_buffer,
-            mimetype='audio/mp3',
-            as_attachment=False,
-            download_name='summary.mp3'
-        )
+        return send_cached_audio(path, key)
         
+    except TTSNotConfigured as e:
+        return jsonify({'error': str(e)}), 503
+    except admission.Rejected:
+        raise
+    except Exception as e:
+        print(f"Error in text-to-speech: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/text-to-speech/<audio_key>')
+@login_required
+def text_to_speech_audio(audio_key):
+    """
+    Serve synthesized audio with HTTP caching and byte-range support.
+    Audio requested via POST but not synthesized yet is streamed on first fetch.
+    """
+    try:
+        path = tts_audio_cache.get(audio_key)
+    except ValueError:
+        return jsonify({'error': 'Audio not found'}), 404
+    if path is not None:
+        return send_cached_audio(path, audio_key)
+    
+    pending = tts_audio_cache.get_pending(audio_key)
+    if pending is None:
+        return jsonify({'error': 'Audio not found'}), 404
+    try:
+        return speech_response(pending['text'], LANGUAGES.get(pending['language'], LANGUAGES['en']), audio_key)
+    except TTSNotConfigured as e:
+        return jsonify({'error': str(e)}), 503
+    except admission.Rejected:
+        raise
     except Exception as e:
         print(f"Error in text-to-speech: {e}")
         return jsonify({'error': str(e)}), 500
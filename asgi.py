@@ -0,0 +1,852 @@
+# asgi.py
+"""
+Async serving mode: an ASGI entry point next to ``app:app``.
+
+    uvicorn asgi:app --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:app
+
+The routes that spend their time waiting on Google APIs run on the event
+loop with the asyncio clients (Vertex AI ``generate_content_async``,
+``ImageAnnotatorAsyncClient``, ``TextToSpeechAsyncClient``), so one worker
+keeps hundreds of analyses in flight instead of one per thread:
+
+    POST /analyze, /analyze-stream, /analyze-document
+    GET  /text-to-speech/<audio_key> for audio that still has to be synthesized
+
+They answer exactly like the Flask views. Requests they do not take over
+(not logged in, no text, cached audio, ...) and every other route go to the
+unchanged Flask app through a small WSGI bridge that runs each request on one
+thread of a bounded pool. SQLite (sessions, caches, documents, jobs,
+admission leases) is only ever touched from executor threads, never from the
+event loop.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+from flask_login import current_user
+
+import app as app_module
+import metrics
+import response_parsing
+import service_clients
+from admission import Rejected
+from chunking import chunk_text, merge_annotations, pack_by_bytes, split_sentences
+from jobs import AsyncJobQueue, QueueFull
+from json_stream import IncrementalJsonParser
+from model_registry import get_model_registry
+from ocr import AsyncBatchOcr
+
+flask_app = app_module.app
+
+# Calls in flight per worker process; each one is a coroutine, not a thread
+ASYNC_MODEL_CONCURRENCY = int(os.getenv('ASYNC_MODEL_CONCURRENCY', 64))
+ASYNC_OCR_CONCURRENCY = int(os.getenv('ASYNC_OCR_CONCURRENCY', 32))
+ASYNC_TTS_CONCURRENCY = int(os.getenv('ASYNC_TTS_CONCURRENCY', 32))
+ASYNC_JOB_QUEUE_SIZE = int(os.getenv('ASYNC_JOB_QUEUE_SIZE', 200))
+# Threads for SQLite and other blocking work, and for requests served by the Flask app
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 4))
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 16))
+# Chunks a streamed Flask response may run ahead of the client
+WSGI_BUFFERED_CHUNKS = 8
+
+
+class LoopSemaphore:
+    """
+    An asyncio.Semaphore for ``async with``, created on first use in each running
+    loop. Before Python 3.10 a semaphore binds to the event loop current when it
+    is constructed, so one built at import time belongs to a loop the server never
+    runs, and waiting on it fails.
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.value)
+        return semaphore
+
+    async def __aenter__(self):
+        await self._semaphore().acquire()
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore().release()
+
+
+db_executor = ThreadPoolExecutor(max_workers=ASYNC_DB_THREADS, thread_name_prefix='asgi-db')
+wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+model_slots = LoopSemaphore(ASYNC_MODEL_CONCURRENCY)
+ocr_slots = LoopSemaphore(ASYNC_OCR_CONCURRENCY)
+tts_slots = LoopSemaphore(ASYNC_TTS_CONCURRENCY)
+
+
+async def blocking(function, *args):
+    """Run a blocking call (SQLite, file I/O) on the db threads"""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, function, *args)
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its request body arrived"""
+
+
+# --- Async analysis pipeline (mirrors analyze_with_ai / stream_analysis in app.py) ---
+async def get_model(language):
+    # The first call per process initializes Vertex AI, which blocks for a while
+    return await asyncio.to_thread(get_model_registry().get_model, language)
+
+
+async def parse_model_response_async(model, response_text, schema, language='en'):
+    """Coroutine version of app.parse_model_response"""
+    async def ask(prompt):
+        metrics.PROMPT_CHARS.observe(len(prompt), language)
+        async with model_slots:
+            with metrics.timed('vertex'):
+                return (await model.generate_content_async(prompt)).text
+
+    return await response_parsing.parse_with_follow_up_async(response_text, schema, ask, language,
+                                                             app_module.RESPONSE_FOLLOW_UPS)
+
+
+async def generate_json_async(prompt, language='en', schema=response_parsing.ANALYSIS_SCHEMA):
+    """Coroutine version of app.generate_json"""
+    model = await get_model(language)
+    metrics.PROMPT_CHARS.observe(len(prompt), language)
+    try:
+        async with model_slots:
+            with metrics.timed('vertex'):
+                response = await model.generate_content_async(prompt, **app_module.generation_options(schema))
+        return await parse_model_response_async(model, response.text, schema, language)
+    except json.JSONDecodeError as e:
+        raise Exception(f"Invalid JSON response from Vertex AI: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Vertex AI analysis failed: {str(e)}")
+
+
+async def generate_json_stream_async(prompt, language='en', schema=response_parsing.ANALYSIS_SCHEMA):
+    """
+    Coroutine version of app.generate_json_stream: yields the parser events,
+    then ('result', parsed object) last.
+    """
+    model = await get_model(language)
+    parser = IncrementalJsonParser()
+    metrics.PROMPT_CHARS.observe(len(prompt), language)
+    try:
+        async with model_slots:
+            with metrics.timed('vertex'):
+                stream = await model.generate_content_async(prompt, stream=True,
+                                                            **app_module.generation_options(schema))
+                async for chunk in stream:
+                    for event in parser.feed(chunk.text):
+                        yield event
+        result = await parse_model_response_async(model, parser.buffer, schema, language)
+    except json.JSONDecodeError as e:
+        raise Exception(f"Invalid JSON response from Vertex AI: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Vertex AI analysis failed: {str(e)}")
+    yield ('result', result)
+
+
+async def cached_json_async(key_text, language, model_suffix, prompt, schema, cache_name=None):
+    """A model answer cached in the analysis cache, as analyze_chunk and friends do"""
+    cache_model = get_model_registry().model_name_for(language) + model_suffix
+    cached_result = await blocking(app_module.analysis_cache.get, key_text, language, cache_model)
+    if cache_name:
+        metrics.cache_lookup(cache_name, cached_result is not None)
+    if cached_result is not None:
+        return cached_result
+    result = await generate_json_async(prompt, language, schema)
+    await blocking(app_module.analysis_cache.put, key_text, language, cache_model, result)
+    return result
+
+
+async def analyze_chunk_async(section_text, language='en'):
+    return await cached_json_async(section_text, language, '#chunk',
+                                   app_module.chunk_prompt(section_text, language),
+                                   response_parsing.SECTION_SCHEMA, 'analysis_section')
+
+
+async def reduce_chunk_summaries_async(summaries, language='en'):
+    joined = app_module.number_summaries(summaries)
+    return await cached_json_async(joined, language, '#reduce', app_module.reduce_prompt(joined, language),
+                                   response_parsing.SUMMARY_SCHEMA)
+
+
+async def revise_summary_async(previous, summaries, language='en'):
+    joined = app_module.number_summaries(summaries)
+    key_text = f"{previous.get('title', '')}\n{previous.get('summary', '')}\n{joined}"
+    return await cached_json_async(key_text, language, '#revise', app_module.revise_prompt(previous, joined, language),
+                                   response_parsing.SUMMARY_SCHEMA)
+
+
+async def analyze_near_duplicate_async(document_text, language='en', user_id=None):
+    """Coroutine version of app.analyze_near_duplicate"""
+    plan = await blocking(app_module.plan_near_duplicate, document_text, language, user_id)
+    if plan is None:
+        return None
+    if not plan['chunks']:
+        return app_module.finish_near_duplicate(plan, document_text, [])
+    partial_results = list(await asyncio.gather(*(analyze_chunk_async(chunk, language) for chunk in plan['chunks'])))
+    revised = await revise_summary_async(plan['previous'], app_module.section_summaries(partial_results), language)
+    return app_module.finish_near_duplicate(plan, document_text, partial_results, revised)
+
+
+def prompt_chunks(document_text, language):
+    model_text = app_module.prompt_text(document_text, language)
+    return model_text, chunk_text(model_text, app_module.ANALYSIS_CHUNK_CHARS)
+
+
+async def analyze_in_chunks_async(document_text, language='en'):
+    """Coroutine version of app.analyze_in_chunks"""
+    # Boilerplate trimming scans the whole text; keep it off the event loop
+    model_text, chunks = await asyncio.to_thread(prompt_chunks, document_text, language)
+    if len(chunks) <= 1:
+        result = await generate_json_async(app_module.analysis_prompt(model_text, language), language)
+        result['original_text'] = document_text
+        return result
+
+    partial_results = list(await asyncio.gather(*(analyze_chunk_async(chunk, language) for chunk in chunks)))
+    reduced = await reduce_chunk_summaries_async(app_module.section_summaries(partial_results), language)
+    return {
+        'title': reduced.get('title', 'Untitled Document'),
+        'summary': reduced.get('summary', ''),
+        'annotations': merge_annotations(partial_results),
+        'original_text': document_text
+    }
+
+
+async def cached_analysis(document_text, lang):
+    model_name = get_model_registry().model_name_for(lang)
+    result = await blocking(app_module.analysis_cache.get, document_text, lang, model_name)
+    metrics.cache_lookup('analysis', result is not None)
+    if result is not None:
+        result['original_text'] = document_text
+    return result
+
+
+async def analyze_async(document_text, lang, user_id=None):
+    """Coroutine version of app.analyze_with_ai (the language is always given)"""
+    if not document_text or len(document_text.strip()) < 10:
+        raise Exception("Document text is too short for analysis")
+
+    cached_result = await cached_analysis(document_text, lang)
+    if cached_result is not None:
+        return cached_result
+
+    try:
+        result = (await analyze_near_duplicate_async(document_text, lang, user_id)
+                  or await analyze_in_chunks_async(document_text, lang))
+    except Exception as e:
+        raise app_module.analysis_failed(e, lang)
+
+    model_name = get_model_registry().model_name_for(lang)
+    await blocking(app_module.analysis_cache.put, document_text, lang, model_name, result)
+    return result
+
+
+async def stream_analysis_async(document_text, lang, user_id=None):
+    """Coroutine version of app.stream_analysis: the same (event, data) pairs, ending with 'result'"""
+    if not document_text or len(document_text.strip()) < 10:
+        raise Exception("Document text is too short for analysis")
+
+    model_name = get_model_registry().model_name_for(lang)
+    result = await cached_analysis(document_text, lang)
+    if result is None:
+        try:
+            result = await analyze_near_duplicate_async(document_text, lang, user_id)
+        except Exception as e:
+            raise app_module.analysis_failed(e, lang)
+        if result is not None:
+            await blocking(app_module.analysis_cache.put, document_text, lang, model_name, result)
+    if result is not None:
+        yield 'title', {'title': result.get('title', '')}
+        yield 'summary', {'summary': result.get('summary', '')}
+        for index, annotation in enumerate(result.get('annotations', [])):
+            yield 'annotation', {'index': index, 'annotation': annotation}
+        yield 'result', result
+        return
+
+    try:
+        model_text, chunks = await asyncio.to_thread(prompt_chunks, document_text, lang)
+        if len(chunks) <= 1:
+            async for event in generate_json_stream_async(app_module.analysis_prompt(model_text, lang), lang):
+                if event[0] == 'result':
+                    result = event[1]
+                elif event[0] == 'field' and event[1] in ('title', 'summary'):
+                    yield event[1], {event[1]: event[2]}
+                elif event[0] == 'item' and event[1] == 'annotations':
+                    yield 'annotation', {'index': event[2], 'annotation': event[3]}
+            result['original_text'] = document_text
+        else:
+            tasks = [asyncio.ensure_future(analyze_chunk_async(chunk, lang)) for chunk in chunks]
+            try:
+                shown = 0
+                for done, finished in enumerate(asyncio.as_completed(tasks), 1):
+                    for annotation in (await finished).get('annotations', []):
+                        yield 'annotation', {'index': shown, 'annotation': annotation}
+                        shown += 1
+                    yield 'progress', {'sections_done': done, 'sections': len(chunks)}
+            finally:
+                for task in tasks:
+                    task.cancel()
+            partial_results = [task.result() for task in tasks]
+            reduced = await reduce_chunk_summaries_async(app_module.section_summaries(partial_results), lang)
+            result = {
+                'title': reduced.get('title', 'Untitled Document'),
+                'summary': reduced.get('summary', ''),
+                'annotations': merge_annotations(partial_results),
+                'original_text': document_text
+            }
+            yield 'title', {'title': result['title']}
+            yield 'summary', {'summary': result['summary']}
+    except Exception as e:
+        raise app_module.analysis_failed(e, lang)
+
+    await blocking(app_module.analysis_cache.put, document_text, lang, model_name, result)
+    yield 'result', result
+
+
+async def extract_text_async(uploads):
+    """Coroutine version of app.extract_text_from_uploads"""
+    vision_client = service_clients.get_vision_async_client()
+    if vision_client is None:
+        raise Exception("Vision API not configured. Please set up Google Cloud credentials.")
+
+    try:
+        with metrics.timed('ocr'):
+            result = await AsyncBatchOcr(
+                vision_client,
+                service_clients.vision_module(),
+                app_module.ocr_executor,
+                ocr_slots,
+                cache=app_module.ocr_cache,
+                max_pages=app_module.OCR_MAX_PAGES,
+                timeout=app_module.OCR_TIMEOUT,
+                image_max_side=app_module.OCR_IMAGE_MAX_SIDE
+            ).extract_async(uploads)
+    except Exception as e:
+        print(f"Error extracting text from {len(uploads)} upload(s): {e}")
+        raise e
+
+    summary = result.summary()
+    metrics.cache_lookup('ocr_page', True, summary['cached_pages'])
+    metrics.cache_lookup('ocr_page', False, summary['pages'] - summary['cached_pages'])
+    metrics.log_event('ocr', **{key: value for key, value in summary.items() if key != 'timings'})
+    return result
+
+
+async def synthesize_speech_async(text, lang_config):
+    """Coroutine version of app.synthesize_speech"""
+    tts_client = service_clients.get_tts_async_client()
+    if tts_client is None:
+        raise app_module.TTSNotConfigured('Text-to-Speech API not configured. Please set up Google Cloud credentials.')
+    request_kwargs = app_module.speech_request(text, lang_config)
+    async with tts_slots:
+        with metrics.timed('tts'):
+            response = await tts_client.synthesize_speech(**request_kwargs)
+    return response.audio_content
+
+
+job_queue = AsyncJobQueue(
+    app_module.DATABASE,
+    ocr=extract_text_async,
+    analyze=analyze_async,
+    persist=app_module.save_document,
+    db_executor=db_executor,
+    preview=app_module.provisional_analysis,
+    max_pending=ASYNC_JOB_QUEUE_SIZE
+)
+
+
+# --- ASGI plumbing ---
+def wsgi_environ(scope, body):
+    """A WSGI environ for an ASGI HTTP scope whose body has been read already"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive, limit):
+    """The request body, or None when it is larger than limit"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+        *((name.encode('latin-1'), value.encode('latin-1')) for name, value in headers)
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def until_disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def cancel_on_disconnect(receive, coroutine):
+    """Run a handler, cancelling it if the client disconnects first (as a WSGI server would on a broken pipe)"""
+    work = asyncio.ensure_future(coroutine)
+    watcher = asyncio.ensure_future(until_disconnected(receive))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+    try:
+        await work
+    except asyncio.CancelledError:
+        pass
+
+
+async def serve_wsgi(scope, send, body):
+    """
+    Serve a request with the Flask app on a wsgi_executor thread. The whole response,
+    streamed bodies included, is produced on that one thread, because stream_with_context
+    generators and thread-local metrics must not move between threads.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    credits = threading.Semaphore(WSGI_BUFFERED_CHUNKS)
+    closed = threading.Event()
+    environ = wsgi_environ(scope, body)
+
+    def push(*event):
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        except RuntimeError:
+            closed.set()  # The loop is gone (server shutdown)
+
+    def produce():
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        try:
+            iterable = flask_app(environ, start_response)
+            try:
+                push('start', started)
+                for chunk in iterable:
+                    if not chunk:
+                        continue
+                    # Backpressure: wait for the client to take earlier chunks
+                    while not credits.acquire(timeout=0.5):
+                        if closed.is_set():
+                            return
+                    if closed.is_set():
+                        return
+                    push('body', chunk)
+            finally:
+                # Runs call_on_close handlers (admission leases) and generator cleanup on this thread
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        except BaseException as e:
+            push('error', e)
+        finally:
+            push('end', None)
+
+    loop.run_in_executor(wsgi_executor, produce)
+    response_started = False
+    try:
+        while True:
+            kind, value = await events.get()
+            if kind == 'start':
+                await send({'type': 'http.response.start', 'status': value['status'], 'headers': value['headers']})
+                response_started = True
+            elif kind == 'body':
+                await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+                credits.release()
+            elif kind == 'error':
+                print(f"Unhandled error in {scope['method']} {scope['path']}: {value!r}")
+                if not response_started:
+                    await send({'type': 'http.response.start', 'status': 500,
+                                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+                    response_started = True
+            else:
+                break
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        closed.set()
+
+
+def request_state(environ, read=None):
+    """
+    On a db thread, in a Flask request context: the logged-in user, their language,
+    URL builder and read() of the request (e.g. its form). None when not logged in.
+    """
+    with flask_app.request_context(environ) as context:
+        app_module.ensure_db_ready()
+        if not current_user.is_authenticated:
+            return None
+        return {
+            'user_id': current_user.id,
+            'language': app_module.get_current_language(),
+            'urls': context.url_adapter,
+            'payload': read() if read is not None else None,
+        }
+
+
+async def admit(policy, user_id):
+    """An admission ticket, or a Rejected exception; admit() may sleep while queued"""
+    future = asyncio.get_running_loop().run_in_executor(None, app_module.admission_control.admit, policy, user_id)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # The client left while queued: give the lease back once admit() returns
+        future.add_done_callback(lambda done: done.exception() is None and done.result().release())
+        raise
+
+
+def release(ticket):
+    asyncio.get_running_loop().run_in_executor(db_executor, ticket.release)
+
+
+def record_request(scope, endpoint, status, started, user_id):
+    """What app.record_request_metrics does for Flask views"""
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.observe(elapsed, scope['method'], endpoint, str(status))
+    if app_module.REQUEST_LOG:
+        metrics.log_event('request', method=scope['method'], path=scope['path'], endpoint=endpoint, status=status,
+                          duration_ms=round(elapsed * 1000, 1), user_id=str(user_id), server='asgi')
+    asyncio.get_running_loop().run_in_executor(db_executor, metrics.flush, app_module.METRICS_DIR)
+    return elapsed
+
+
+# --- Native routes: each returns False to hand the request to Flask instead ---
+def read_text_payload():
+    payload = request.get_json(silent=True)
+    return payload.get('text', '') if isinstance(payload, dict) else ''
+
+
+def read_stream_payload():
+    payload = request.get_json(silent=True) or {}
+    return (payload.get('text') or request.form.get('text', '')).strip()
+
+
+def read_upload_payload():
+    try:
+        return app_module.read_document_upload()
+    except app_module.UploadRejected:
+        return None
+
+
+async def analyze(scope, send, environ, started):
+    state = await blocking(request_state, environ, read_text_payload)
+    if state is None or not state['payload']:
+        return False
+    user_id, lang = state['user_id'], state['language']
+    try:
+        ticket = await admit('analyze', user_id)
+    except Rejected as e:
+        await send_json(send, 429, {'error': str(e)}, [('Retry-After', str(e.retry_after))])
+        record_request(scope, 'analyze_document', 429, started, user_id)
+        return True
+
+    try:
+        try:
+            analysis_result = await analyze_async(state['payload'], lang, user_id)
+        except Exception as e:
+            print(f"Analysis failed: {e}")
+            status, payload = 500, {'error': "Failed to analyze document"}
+        else:
+            try:
+                new_doc_id = await blocking(app_module.save_document, analysis_result, user_id, None, True, lang)
+                status, payload = 200, {'success': True, 'new_document_id': new_doc_id}
+            except Exception as e:
+                print(f"Database error: {e}")
+                status, payload = 500, {'error': "Could not save to database"}
+    finally:
+        release(ticket)
+    elapsed = time.perf_counter() - started
+    await send_json(send, status, payload, [('Server-Timing', metrics.server_timing(elapsed, {}))])
+    record_request(scope, 'analyze_document', status, started, user_id)
+    return True
+
+
+async def analyze_stream(scope, send, environ, started):
+    state = await blocking(request_state, environ, read_stream_payload)
+    if state is None or not state['payload']:
+        return False
+    user_id, lang, document_text = state['user_id'], state['language'], state['payload']
+    try:
+        ticket = await admit('analyze', user_id)
+    except Rejected as e:
+        await send_json(send, 429, {'error': str(e)}, [('Retry-After', str(e.retry_after))])
+        record_request(scope, 'analyze_stream', 429, started, user_id)
+        return True
+
+    async def event(name, data):
+        await send({'type': 'http.response.body', 'body': app_module.sse_event(name, data).encode('utf-8'),
+                    'more_body': True})
+
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]})
+        record_request(scope, 'analyze_stream', 200, started, user_id)
+        await event('provisional', await asyncio.to_thread(app_module.provisional_analysis, document_text, lang))
+        await event('status', {'stage': 'analyze'})
+        first_content_ms = None
+        try:
+            async for name, data in stream_analysis_async(document_text, lang, user_id):
+                if name != 'result':
+                    if first_content_ms is None:
+                        first_content_ms = round((time.perf_counter() - started) * 1000)
+                        print(f"Streaming analysis: first content after {first_content_ms}ms")
+                    await event(name, data)
+                    continue
+
+                try:
+                    new_doc_id = await blocking(app_module.save_document, data, user_id, None, True, lang)
+                except Exception as e:
+                    print(f"Database error: {e}")
+                    await event('error', {'error': "Could not save to database"})
+                    break
+                await event('done', {
+                    'new_document_id': new_doc_id,
+                    'url': state['urls'].build('view_analysis', {'doc_id': new_doc_id}),
+                    'first_content_ms': first_content_ms,
+                    'total_ms': round((time.perf_counter() - started) * 1000)
+                })
+        except Exception as e:
+            print(f"Streaming analysis failed: {e}")
+            await event('error', {'error': "Failed to analyze document"})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        release(ticket)
+    return True
+
+
+async def analyze_document(scope, send, environ, started):
+    state = await blocking(request_state, environ, read_upload_payload)
+    if state is None or state['payload'] is None:
+        return False
+    user_id = state['user_id']
+    document_text, uploads = state['payload']
+    try:
+        ticket = await admit('analyze', user_id)
+    except Rejected as e:
+        await send_json(send, 429, {'error': str(e)}, [('Retry-After', str(e.retry_after))])
+        record_request(scope, 'analyze_document_upload', 429, started, user_id)
+        return True
+
+    try:
+        # The in-flight lease lasts until the job finishes, not just this request
+        job_id = await job_queue.submit_async(user_id, state['language'], text=document_text, uploads=uploads,
+                                              on_finish=ticket.release)
+    except QueueFull as e:
+        release(ticket)
+        await send_json(send, 503, {'error': str(e)}, [('Retry-After', '5')])
+        record_request(scope, 'analyze_document_upload', 503, started, user_id)
+        return True
+    except Exception as e:
+        release(ticket)
+        print(f"Unexpected error: {e}")
+        await send_json(send, 500, {'error': "An unexpected error occurred"})
+        record_request(scope, 'analyze_document_upload', 500, started, user_id)
+        return True
+
+    status_url = state['urls'].build('job_status', {'job_id': job_id})
+    await send_json(send, 202, {'success': True, 'job_id': job_id, 'status_url': status_url},
+                    [('Location', status_url)])
+    record_request(scope, 'analyze_document_upload', 202, started, user_id)
+    return True
+
+
+def read_pending_audio(key):
+    """The pending synthesis request for key, unless the audio is cached already"""
+    try:
+        if app_module.tts_audio_cache.get(key) is not None:
+            return None
+    except ValueError:
+        return None
+    return app_module.tts_audio_cache.get_pending(key)
+
+
+async def text_to_speech_audio(scope, send, environ, started, key):
+    """
+    Coroutine version of app.speech_response for audio requested via POST /text-to-speech.
+    While another request in this process synthesizes the same audio, wait for it
+    and let Flask serve the cached file.
+    """
+    state = await blocking(request_state, environ, lambda: read_pending_audio(key))
+    if state is None or state['payload'] is None:
+        return False
+    leader, synthesis = app_module.tts_audio_cache.claim(key)
+    if not leader:
+        app_module.TTS_COALESCED.inc()
+        done, _ = await asyncio.wait({asyncio.wrap_future(synthesis)}, timeout=app_module.TTS_COALESCE_WAIT)
+        if done:
+            return False  # Flask serves its file, or synthesizes the audio if that request failed
+        synthesis = None  # Waited long enough; synthesize alongside it
+    try:
+        return await stream_pending_audio(scope, send, started, key, state['user_id'], state['payload'])
+    finally:
+        if synthesis is not None:
+            app_module.tts_audio_cache.finish(key, synthesis)
+
+
+async def stream_pending_audio(scope, send, started, key, user_id, pending):
+    """Coroutine version of app.stream_speech"""
+    try:
+        ticket = await admit('tts', user_id)
+    except Rejected as e:
+        await send_json(send, 429, {'error': str(e)}, [('Retry-After', str(e.retry_after))])
+        record_request(scope, 'text_to_speech_audio', 429, started, user_id)
+        return True
+
+    lang_config = app_module.LANGUAGES.get(pending['language'], app_module.LANGUAGES['en'])
+    sentences = split_sentences(pending['text'], lang_config.get('sentence_terminators', '.!?'))
+    segments = pack_by_bytes(sentences, app_module.TTS_SEGMENT_MAX_BYTES, app_module.TTS_FIRST_SEGMENT_MAX_BYTES)
+    tasks = [asyncio.ensure_future(synthesize_speech_async(segment, lang_config)) for segment in segments]
+    completed = False
+    try:
+        try:
+            first_audio = await tasks[0]
+        except app_module.TTSNotConfigured as e:
+            await send_json(send, 503, {'error': str(e)})
+            record_request(scope, 'text_to_speech_audio', 503, started, user_id)
+            return True
+        except Exception as e:
+            print(f"Error in text-to-speech: {e}")
+            await send_json(send, 500, {'error': str(e)})
+            record_request(scope, 'text_to_speech_audio', 500, started, user_id)
+            return True
+        first_byte_ms = (time.perf_counter() - started) * 1000
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'audio/mpeg'), (b'cache-control', b'private, no-cache'),
+            (b'x-tts-segments', str(len(segments)).encode()),
+            (b'x-tts-first-byte-ms', f'{first_byte_ms:.0f}'.encode()),
+            (b'server-timing', f'tts-first-segment;dur={first_byte_ms:.1f}'.encode()),
+        ]})
+        record_request(scope, 'text_to_speech_audio', 200, started, user_id)
+        parts = [first_audio]
+        await send({'type': 'http.response.body', 'body': first_audio, 'more_body': True})
+        for task in tasks[1:]:
+            audio = await task
+            parts.append(audio)
+            await send({'type': 'http.response.body', 'body': audio, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        completed = True
+    finally:
+        for task in tasks:
+            task.cancel()
+        release(ticket)
+    if completed:
+        await blocking(app_module.tts_audio_cache.put, key, b''.join(parts))
+    return True
+
+
+NATIVE_ROUTES = {
+    ('POST', '/analyze'): analyze,
+    ('POST', '/analyze-stream'): analyze_stream,
+    ('POST', '/analyze-document'): analyze_document,
+}
+AUDIO_PREFIX = '/text-to-speech/'
+
+
+def native_route(scope):
+    """The native handler for a request, if there is one"""
+    path = scope['path'][len(scope.get('root_path', '')):] if scope['path'].startswith(scope.get('root_path', '')) \
+        else scope['path']
+    handler = NATIVE_ROUTES.get((scope['method'], path))
+    if handler is not None:
+        return handler
+    if scope['method'] == 'GET' and path.startswith(AUDIO_PREFIX) and '/' not in path[len(AUDIO_PREFIX):]:
+        key = path[len(AUDIO_PREFIX):]
+        return lambda *args: text_to_speech_audio(*args, key)
+    return None
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if app_module.EAGER_SERVICE_CLIENTS:
+                # The asyncio clients must be created on the loop that will use them
+                service_clients.get_vision_async_client()
+                service_clients.get_tts_async_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.gather(*job_queue._tasks, return_exceptions=True)
+            db_executor.shutdown(wait=False)
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return  # No websockets
+
+    started = time.perf_counter()
+    try:
+        body = await read_body(receive, flask_app.config['MAX_CONTENT_LENGTH'] or sys.maxsize)
+    except ClientDisconnected:
+        return
+    if body is None:
+        await send_json(send, 413, {'error': 'Request is too large'})
+        return
+
+    async def handle():
+        handler = native_route(scope)
+        if handler is None or not await handler(scope, send, wsgi_environ(scope, body), started):
+            await serve_wsgi(scope, send, body)
+
+    await cancel_on_disconnect(receive, handle())
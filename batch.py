@@ -0,0 +1,249 @@
+# batch.py
+"""
+Bulk analysis of many documents in one request.
+
+``read_batch`` opens a zip of documents (text files, PDFs, images) or a
+JSONL file with one document per line. ``BatchRunner`` pushes the documents
+through the same OCR -> analyze -> persist stages as a background job, a
+few at a time, and yields one result per document as soon as it has been
+saved. Saves are grouped into one transaction per ``commit_size`` documents
+(or per ``commit_interval`` seconds, whichever comes first) instead of one
+commit per document. Each document is admitted like a single analysis, so
+a batch spends the same model quota as that many /analyze requests; when
+the quota is used up the batch waits for it instead of failing documents.
+"""
+import base64
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from admission import Rejected
+from ocr import UPLOAD_EXTENSIONS, OcrError, is_supported_upload
+
+TEXT_EXTENSIONS = ('.txt', '.md')
+
+
+class BatchError(Exception):
+    """A batch or one of its documents cannot be processed; the message is safe to show to the user"""
+
+
+class BatchItem:
+    """One document of a batch; load() returns ('text', str) or ('upload', (filename, bytes))"""
+
+    def __init__(self, index, name, load):
+        self.index = index
+        self.name = name
+        self.load = load
+
+
+def _zip_items(data, max_documents, max_document_bytes):
+    try:
+        archive = zipfile.ZipFile(data)
+    except zipfile.BadZipFile:
+        raise BatchError("The batch is not a valid zip file")
+
+    items = []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base or base.startswith('.') or name.startswith('__MACOSX/'):
+            continue
+        if len(items) == max_documents:
+            raise BatchError(f"A batch can contain at most {max_documents} documents")
+
+        def load(info=info, name=name, base=base):
+            if info.file_size > max_document_bytes:
+                raise BatchError(f"Larger than {max_document_bytes // (1024 * 1024)}MB")
+            content = archive.read(info)
+            if name.lower().endswith(TEXT_EXTENSIONS):
+                return 'text', content.decode('utf-8', errors='replace')
+            if is_supported_upload(name):
+                return 'upload', (base, content)
+            extensions = TEXT_EXTENSIONS + UPLOAD_EXTENSIONS
+            raise BatchError(f"Unsupported file type; use {', '.join(extensions[:-1])} or {extensions[-1]}")
+        items.append(BatchItem(len(items), name, load))
+    return items
+
+
+def _jsonl_items(data, max_documents):
+    """Lines are {"name": ..., "text": ...} or {"name": ..., "filename": ..., "content_base64": ...}"""
+    items = []
+    for line_number, line in enumerate(data.read().decode('utf-8', errors='replace').splitlines(), 1):
+        if not line.strip():
+            continue
+        if len(items) == max_documents:
+            raise BatchError(f"A batch can contain at most {max_documents} documents")
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+
+        def load(record=record, line_number=line_number):
+            if not isinstance(record, dict):
+                raise BatchError(f"Line {line_number} is not a JSON object")
+            if isinstance(record.get('text'), str):
+                return 'text', record['text']
+            filename = record.get('filename') or ''
+            if not is_supported_upload(filename) or not record.get('content_base64'):
+                raise BatchError(f"Line {line_number} needs \"text\", or \"filename\" and \"content_base64\"")
+            try:
+                return 'upload', (filename, base64.b64decode(record['content_base64'], validate=True))
+            except ValueError:
+                raise BatchError(f"Line {line_number} has invalid base64 content")
+
+        name = (record.get('name') or record.get('filename')) if isinstance(record, dict) else None
+        items.append(BatchItem(len(items), name or f'line {line_number}', load))
+    return items
+
+
+def read_batch(filename, data, max_documents=500, max_document_bytes=10 * 1024 * 1024):
+    """
+    List the documents of an uploaded batch (a file-like object) without reading them yet.
+    A .zip is read as an archive; anything else (.jsonl, .ndjson) as JSON lines.
+    """
+    if (filename or '').lower().endswith('.zip') or zipfile.is_zipfile(data):
+        data.seek(0)
+        items = _zip_items(data, max_documents, max_document_bytes)
+    else:
+        data.seek(0)
+        items = _jsonl_items(data, max_documents)
+    if not items:
+        raise BatchError("The batch does not contain any documents")
+    return items
+
+
+class BatchRunner:
+    """
+    Runs the documents of one batch on a shared executor, at most
+    ``concurrency`` at a time. The stages mirror jobs.JobQueue:
+        ocr(uploads) -> OcrResult
+        analyze(document_text, language, user_id) -> dict
+        persist_many([(user_id, analysis_result)]) -> [document id or Exception]
+    and, optionally, the admission check each document passes before it starts:
+        admit(user_id) -> ticket with release(), released when the document is done;
+        raises admission.Rejected while the user's quota is used up
+    """
+
+    def __init__(self, executor, ocr, analyze, persist_many, concurrency=4, commit_size=25, commit_interval=1.0,
+                 admit=None):
+        self.executor = executor
+        self.ocr = ocr
+        self.analyze = analyze
+        self.persist_many = persist_many
+        self.concurrency = concurrency
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.admit = admit
+
+    def _process(self, item, language, user_id):
+        """OCR (if needed) and analyze one document; returns the analysis or raises BatchError"""
+        kind, payload = item.load()
+        if kind == 'upload':
+            try:
+                text = self.ocr([payload]).text
+            except OcrError as e:
+                raise BatchError(str(e))
+            except Exception as e:
+                print(f"Error during OCR for batch document {item.name}: {e}")
+                raise BatchError("Failed to process the document")
+            if not text:
+                raise BatchError("Could not extract text from the document")
+        else:
+            text = payload
+        try:
+            return self.analyze(text, language, user_id)
+        except Exception as e:
+            print(f"Error during analysis for batch document {item.name}: {e}")
+            raise BatchError("Failed to analyze document")
+
+    def _commit(self, analyzed, user_id):
+        """Save (item, analysis) pairs in one transaction and return their result lines"""
+        outcomes = self.persist_many([(user_id, analysis) for _, analysis in analyzed])
+        results = []
+        for (item, analysis), outcome in zip(analyzed, outcomes):
+            if isinstance(outcome, Exception):
+                results.append(self._failure(item, "Could not save to database"))
+            else:
+                results.append({'index': item.index, 'name': item.name, 'status': 'ok',
+                                'document_id': outcome, 'title': analysis.get('title', 'Untitled Document')})
+        return results
+
+    @staticmethod
+    def _failure(item, message):
+        return {'index': item.index, 'name': item.name, 'status': 'error', 'error': message}
+
+    def _start(self, item, language, user_id):
+        """Submit one document once it is admitted; returns its future"""
+        ticket = self.admit(user_id) if self.admit is not None else None
+        future = self.executor.submit(self._process, item, language, user_id)
+        if ticket is not None:
+            future.add_done_callback(lambda _: ticket.release())
+        return future
+
+    def run(self, items, user_id, language):
+        """Yield one result dict per document, in completion order"""
+        queue = iter(items)
+        waiting = None    # The next document, when admission turned it away
+        retry_at = 0.0
+        pending = {}
+        analyzed = []
+        oldest = None
+        try:
+            while True:
+                while len(pending) < self.concurrency and time.monotonic() >= retry_at:
+                    item = waiting or next(queue, None)
+                    if item is None:
+                        break
+                    try:
+                        future = self._start(item, language, user_id)
+                    except Rejected as e:
+                        waiting, retry_at = item, time.monotonic() + e.retry_after
+                        break
+                    waiting = None
+                    pending[future] = item
+                if not pending and not analyzed and waiting is None:
+                    return
+
+                timeout = self.commit_interval
+                if waiting is not None:
+                    timeout = min(timeout, max(retry_at - time.monotonic(), 0))
+                if pending:
+                    done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    done = ()
+                    time.sleep(timeout)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        analyzed.append((item, future.result()))
+                        oldest = oldest or time.monotonic()
+                    except BatchError as e:
+                        yield self._failure(item, str(e))
+                    except Exception as e:
+                        print(f"Unexpected error for batch document {item.name}: {e}")
+                        yield self._failure(item, "An unexpected error occurred")
+
+                if analyzed and (len(analyzed) >= self.commit_size or not pending
+                                 or time.monotonic() - oldest >= self.commit_interval):
+                    committing, analyzed, oldest = analyzed, [], None
+                    yield from self._commit(committing, user_id)
+        finally:
+            # The client went away (or the batch failed): stop starting new documents, but
+            # save the analyses that are finished or already running, since the model call is paid for
+            for future in pending:
+                future.cancel()
+            for future, item in pending.items():
+                if future.cancelled():
+                    continue
+                try:
+                    analyzed.append((item, future.result()))
+                except Exception:
+                    pass  # Its error would only have been reported to the client
+            if analyzed:
+                try:
+                    self._commit(analyzed, user_id)
+                    print(f"Batch stopped early; saved {len(analyzed)} finished documents")
+                except Exception as e:
+                    print(f"Could not save the finished documents of a stopped batch: {e}")
@@ -0,0 +1,134 @@
+# benchmarks/analysis_page_bench.py
+"""
+Repeat-view latency of /analysis/<id>: rendered-page cache and 304 revalidation.
+
+--documents analyses of about --paragraphs paragraphs each are created
+through /analyze (fake model, no latency), then every page is viewed
+--views times in four ways:
+
+    uncached     cache off (ANALYSIS_PAGE_CACHE_BYTES=0): SQLite, blobs, spans, Jinja every time
+    first view   cache on but empty: the same work plus storing the page
+    cached       a repeat view served from the render cache
+    revalidated  a repeat view with If-None-Match, answered 304 without a body
+
+Times are measured around the test client call (the whole Flask request),
+in one process, so they compare server work rather than network time.
+
+    python benchmarks/analysis_page_bench.py --documents 50 --paragraphs 200
+    python benchmarks/analysis_page_bench.py --language hi
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(os.path.abspath(__file__))]
+
+WORDS = ('tenant landlord rent deposit notice premises agreement month payment repair consent written '
+         'party period interest default property maintenance renewal termination arbitration').split()
+
+
+def make_document(rng, paragraphs):
+    return '\n\n'.join(f'{number}. ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(15, 40))).capitalize() + '.'
+                       for number in range(1, paragraphs + 1))
+
+
+def timed_get(client, path, headers=None):
+    started = time.perf_counter()
+    response = client.get(path, headers=headers or {})
+    return (time.perf_counter() - started) * 1000, response
+
+
+def percentiles(samples):
+    return {'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(statistics.quantiles(samples, n=20)[18], 3) if len(samples) > 1 else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=30)
+    parser.add_argument('--paragraphs', type=int, default=120)
+    parser.add_argument('--views', type=int, default=10, help='Repeat views per document and mode')
+    parser.add_argument('--language', default='en', help='Session language (hi views a translated variant)')
+    parser.add_argument('--seed', type=int, default=24)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='page-bench-')
+    os.environ.update(
+        DATABASE_PATH=os.path.join(tmp, 'bench.db'), TTS_CACHE_DIR=os.path.join(tmp, 'tts'),
+        FLASK_SECRET_KEY=os.getenv('FLASK_SECRET_KEY', 'page-bench'), GCP_PROJECT_ID='page-bench',
+        REQUEST_LOG='0', ADMISSION_BACKEND='memory',
+        ADMISSION_ANALYZE_USER_PER_MINUTE='0', ADMISSION_ANALYZE_GLOBAL_PER_MINUTE='0',
+        ADMISSION_ANALYZE_USER_CONCURRENCY='0',
+    )
+    import app as app_module
+    import fakes
+
+    backends = fakes.from_env(seed=args.seed)
+    backends['model'] = fakes.FakeModel(latency_ms=0, ms_per_char=0, seed=args.seed)
+    fakes.install(app_module, backends)
+
+    client = app_module.app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'bench'})
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    client.get(f'/set_language/{args.language}')
+
+    rng = random.Random(args.seed)
+    paths = []
+    for _ in range(args.documents):
+        response = client.post('/analyze', json={'text': make_document(rng, args.paragraphs)})
+        paths.append(f"/analysis/{response.get_json()['new_document_id']}")
+    for path in paths:
+        client.get(path)  # Translate once (for --language hi) so every mode sees the stored variant
+
+    pages = app_module.analysis_pages
+    max_bytes = pages.max_bytes
+    samples = {'uncached': [], 'first view': [], 'cached': [], 'revalidated': []}
+    sizes = {}
+
+    pages.max_bytes = 0
+    pages.clear()
+    for _ in range(args.views):
+        for path in paths:
+            ms, response = timed_get(client, path)
+            samples['uncached'].append(ms)
+            sizes['uncached'] = len(response.data)
+
+    pages.max_bytes = max_bytes
+    for _ in range(args.views):
+        pages.clear()
+        for path in paths:
+            samples['first view'].append(timed_get(client, path)[0])
+    etags = {}
+    for _ in range(args.views):
+        for path in paths:
+            ms, response = timed_get(client, path)
+            samples['cached'].append(ms)
+            etags[path] = response.headers['ETag']
+            sizes['cached'] = len(response.data)
+    for _ in range(args.views):
+        for path in paths:
+            ms, response = timed_get(client, path, {'If-None-Match': etags[path]})
+            assert response.status_code == 304, response.status_code
+            samples['revalidated'].append(ms)
+            sizes['revalidated'] = len(response.data)
+
+    results = {'documents': args.documents, 'paragraphs': args.paragraphs, 'language': args.language,
+               'cache_entries': len(pages), 'cache_bytes': pages.bytes, 'modes': {}}
+    baseline = statistics.median(samples['uncached'])
+    print(f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'body bytes':>11}")
+    for mode, values in samples.items():
+        stats = dict(percentiles(values), body_bytes=sizes.get(mode, sizes['cached']),
+                     speedup=round(baseline / statistics.median(values), 1))
+        results['modes'][mode] = stats
+        print(f"{mode:<12} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['speedup']:>7}x {stats['body_bytes']:>11}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
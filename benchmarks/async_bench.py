@@ -0,0 +1,176 @@
+# benchmarks/async_bench.py
+"""
+Sync vs async serving benchmark under the same fake backend latency.
+
+--clients concurrent clients each POST unique documents to /analyze until
+--requests have been answered, first against the Flask app as deployed
+(gunicorn app:app --workers 2 --threads 8: --sync-slots requests in
+flight, emulated in this process with that many request slots), then
+against asgi:app driven directly on one event loop (a single worker). The
+model, Vision and TTS fakes sleep for the same latency in both runs, so the
+difference is how many of those waits one deployment overlaps.
+
+    python benchmarks/async_bench.py --clients 200 --requests 400 --model-latency-ms 800
+    python benchmarks/async_bench.py --clients 50 --sync-slots 8 --skip-sync
+
+Reported: throughput, p50/p95 latency (queueing included) and status codes.
+To compare real servers, run benchmarks/fake_app.py under gunicorn and
+``uvicorn asgi:app`` with the same FAKE_* settings and point loadtest.py at each.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(os.path.abspath(__file__))]
+
+WORDS = ('tenant landlord rent deposit notice premises agreement month payment repair consent written '
+         'party period interest default property maintenance renewal termination arbitration').split()
+
+
+def make_document(rng):
+    """A unique document of a few hundred words, so no cache or near-duplicate answers it"""
+    sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 18))).capitalize() + '.'
+                 for _ in range(rng.randint(12, 24))]
+    return '\n\n'.join(f'{number}. {sentence}' for number, sentence in enumerate(sentences, 1))
+
+
+def summarize(name, latencies, statuses, elapsed):
+    return {
+        'server': name,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000),
+        'p95_ms': round(statistics.quantiles(latencies, n=20)[18] * 1000),
+        'statuses': dict(Counter(statuses)),
+    }
+
+
+def run_sync(app_module, cookie, documents, clients, slots):
+    """Clients queue for slots request threads, as they would for gunicorn's worker threads"""
+    client = app_module.app.test_client()
+    client.set_cookie('session', cookie)
+    workers = threading.BoundedSemaphore(slots)
+    pending = list(documents)
+    latencies = []
+    statuses = []
+
+    def run_client():
+        while True:
+            try:
+                text = pending.pop()
+            except IndexError:
+                return
+            # Latency counts the time spent queued for a free worker
+            started = time.perf_counter()
+            with workers:
+                response = client.post('/analyze', json={'text': text})
+            statuses.append(response.status_code)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for _ in range(clients):
+            pool.submit(run_client)
+    return summarize(f'sync ({slots} in flight)', latencies, statuses, time.perf_counter() - started)
+
+
+async def run_async(asgi_app, cookie, documents, clients):
+    pending = list(documents)
+    latencies = []
+    statuses = []
+
+    async def request(text):
+        scope = {'type': 'http', 'method': 'POST', 'path': '/analyze', 'root_path': '', 'query_string': b'',
+                 'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+                 'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                             (b'cookie', f'session={cookie}'.encode())]}
+        messages = [{'type': 'http.request', 'body': json.dumps({'text': text}).encode(), 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()  # No disconnect
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await asgi_app(scope, receive, send)
+        return status[0]
+
+    async def client():
+        while pending:
+            text = pending.pop()
+            started = time.perf_counter()
+            statuses.append(await request(text))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return summarize('async (1 worker)', latencies, statuses, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--sync-slots', type=int, default=16, help='gunicorn workers x threads of the sync deployment')
+    parser.add_argument('--model-latency-ms', type=float, default=800)
+    parser.add_argument('--model-ms-per-char', type=float, default=0.5)
+    parser.add_argument('--skip-sync', action='store_true')
+    parser.add_argument('--seed', type=int, default=21)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='async-bench-')
+    os.environ.update(
+        DATABASE_PATH=os.path.join(tmp, 'bench.db'), TTS_CACHE_DIR=os.path.join(tmp, 'tts'),
+        FLASK_SECRET_KEY=os.getenv('FLASK_SECRET_KEY', 'async-bench'), GCP_PROJECT_ID='async-bench',
+        REQUEST_LOG='0', ADMISSION_BACKEND='memory', ASYNC_MODEL_CONCURRENCY=str(max(args.clients, 1)),
+        # Admission control would turn most of the burst into 429s in both runs
+        ADMISSION_ANALYZE_USER_PER_MINUTE='0', ADMISSION_ANALYZE_GLOBAL_PER_MINUTE='0',
+        ADMISSION_ANALYZE_USER_CONCURRENCY='0', ADMISSION_ANALYZE_QUEUE_SIZE=str(args.requests),
+    )
+    import app as app_module
+    import asgi
+    import fakes
+
+    backends = fakes.from_env(seed=args.seed)
+    backends['model'] = fakes.FakeModel(latency_ms=args.model_latency_ms, ms_per_char=args.model_ms_per_char,
+                                        seed=args.seed)
+    fakes.install(app_module, backends)
+
+    client = app_module.app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'bench'})
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    cookie = client.get_cookie('session').value
+
+    rng = random.Random(args.seed)
+    results = []
+    if not args.skip_sync:
+        documents = [make_document(rng) for _ in range(args.requests)]
+        results.append(run_sync(app_module, cookie, documents, args.clients, args.sync_slots))
+    documents = [make_document(rng) for _ in range(args.requests)]
+    results.append(asyncio.run(run_async(asgi.app, cookie, documents, args.clients)))
+
+    print(f"{'server':<20} {'requests':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}  statuses")
+    for result in results:
+        print(f"{result['server']:<20} {result['requests']:>8} {result['throughput_rps']:>7} "
+              f"{result['p50_ms']:>8} {result['p95_ms']:>8}  {result['statuses']}")
+    print(json.dumps({'model_latency_ms': args.model_latency_ms, 'clients': args.clients, 'results': results},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/blob_storage_bench.py
+"""
+Blob storage benchmark: database size and analysis-page read latency.
+
+Builds a database in the pre-blob layout (original text stored in
+documents.original_text and again inside analysis_json), measures it, then
+runs the migrations that move payloads into the compressed, deduplicated
+blobs table and measures again. A share of documents reuse a handful of
+templates, as pasted lease templates do in production.
+
+    python benchmarks/blob_storage_bench.py --documents 5000 --template-share 0.4
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blob_store  # noqa: E402
+import storage  # noqa: E402
+from migrations import MIGRATIONS  # noqa: E402
+
+CLAUSES = [
+    "The Tenant shall pay the monthly rent of Rs. {amount} on or before the {day} day of each month.",
+    "Either party may terminate this agreement by giving {days} days' written notice to the other party.",
+    "The Landlord shall refund the security deposit within {days} days of the Tenant vacating the premises.",
+    "The Tenant shall not sublet the premises without the prior written consent of the Landlord.",
+    "Any dispute arising out of this agreement shall be referred to arbitration in {city}.",
+    "A late fee of Rs. {amount} shall be payable for every day of delay in payment of rent.",
+    "This agreement shall automatically renew for a further period of {months} months unless terminated.",
+    "The Tenant shall indemnify the Landlord against all losses arising from the Tenant's negligence.",
+]
+
+
+def make_document(rng):
+    clauses = [
+        rng.choice(CLAUSES).format(amount=rng.randint(1000, 90000), day=rng.randint(1, 28),
+                                   days=rng.choice([15, 30, 60]), city=rng.choice(['Delhi', 'Mumbai', 'Pune']),
+                                   months=rng.choice([11, 12, 24]))
+        for _ in range(rng.randint(20, 60))
+    ]
+    return '\n\n'.join(f"{i}. {clause}" for i, clause in enumerate(clauses, 1))
+
+
+def make_analysis(rng, text):
+    sentences = [line.split('. ', 1)[-1] for line in text.split('\n\n')]
+    return {
+        'title': 'Residential Lease Agreement',
+        'summary': 'This agreement sets out the rent, deposit, termination and dispute terms of a lease. ' * 3,
+        'annotations': [
+            {'text_to_highlight': sentence, 'explanation': 'This clause affects your obligations as a tenant.'}
+            for sentence in rng.sample(sentences, min(8, len(sentences)))
+        ],
+    }
+
+
+def build_legacy(path, documents, template_share, seed):
+    rng = random.Random(seed)
+    templates = [make_document(rng) for _ in range(5)]
+    conn = sqlite3.connect(path)
+    conn.executescript(MIGRATIONS[0][2])
+    conn.executemany('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                     ((f'user{i}', 'x') for i in range(200)))
+    for _ in range(documents):
+        text = rng.choice(templates) if rng.random() < template_share else make_document(rng)
+        analysis = make_analysis(rng, text)
+        analysis['original_text'] = text
+        conn.execute(
+            'INSERT INTO documents (title, original_text, analysis_json, user_id) VALUES (?, ?, ?, ?)',
+            (analysis['title'], text, json.dumps(analysis), rng.randint(1, 200))
+        )
+    conn.commit()
+    conn.close()
+
+
+def file_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def read_latencies(conn, read_one, ids):
+    samples = []
+    for doc_id in ids:
+        started = time.perf_counter()
+        read_one(conn, doc_id)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return {'p50_us': round(statistics.median(samples), 1),
+            'p95_us': round(statistics.quantiles(samples, n=20)[18], 1)}
+
+
+def read_legacy(conn, doc_id):
+    row = conn.execute('SELECT analysis_json FROM documents WHERE id = ?', (doc_id,)).fetchone()
+    return json.loads(row[0])
+
+
+def read_blobs(conn, doc_id):
+    row = conn.execute('SELECT text_hash, analysis_hash FROM documents WHERE id = ?', (doc_id,)).fetchone()
+    analysis = blob_store.get_json(conn, row[1])
+    analysis['original_text'] = blob_store.get_text(conn, row[0])
+    return analysis
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--template-share', type=float, default=0.4)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build_legacy(path, args.documents, args.template_share, args.seed)
+        ids = [random.Random(args.seed).randint(1, args.documents) for _ in range(args.reads)]
+
+        before_size = file_size(path)
+        conn = storage.connect(path)
+        before_reads = read_latencies(conn, read_legacy, ids)
+
+        started = time.perf_counter()
+        storage.migrate(conn)
+        migrate_seconds = time.perf_counter() - started
+        conn.close()
+
+        after_size = file_size(path)
+        conn = storage.connect(path)
+        after_reads = read_latencies(conn, read_blobs, ids)
+        blobs = conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+        conn.close()
+
+    results = {
+        'codec': 'zstd' if blob_store.zstandard is not None else 'zlib',
+        'documents': args.documents,
+        'blobs': blobs,
+        'migration_seconds': round(migrate_seconds, 2),
+        'before': {'db_bytes': before_size, 'read': before_reads},
+        'after': {'db_bytes': after_size, 'read': after_reads},
+        'size_ratio': round(after_size / before_size, 3),
+    }
+    print(f"database size: {before_size / 1e6:.1f} MB -> {after_size / 1e6:.1f} MB "
+          f"({results['size_ratio']:.1%} of original)")
+    print(f"read p50: {before_reads['p50_us']} us -> {after_reads['p50_us']} us, "
+          f"p95: {before_reads['p95_us']} us -> {after_reads['p95_us']} us")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# benchmarks/clause_rules_bench.py
+"""
+Rule-based clause pre-analyzer benchmark: accuracy against saved model
+analyses, speed, and how much boilerplate trimming takes off the prompt.
+
+With --database, every saved document is used: the model's annotations
+(located in the original text as on the results page) are the reference.
+Recall is the share of model highlights overlapped by a rule highlight,
+precision the share of rule highlights overlapping a model highlight, and
+"lost" counts model highlights that fall inside a trimmed section (those
+would be missing from the prompt). Without --database a synthetic corpus of
+labeled English and Hindi clauses, filler and boilerplate is generated.
+
+    python benchmarks/clause_rules_bench.py --database database.db --language en
+    python benchmarks/clause_rules_bench.py --documents 500
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blob_store  # noqa: E402
+import clause_rules  # noqa: E402
+import storage  # noqa: E402
+from chunking import split_sections  # noqa: E402
+from span_index import find_annotation_spans  # noqa: E402
+
+CLAUSES = {
+    'en': [
+        "Either party may terminate this agreement by giving {n} days' written notice to the other party.",
+        "This agreement shall automatically renew for a further period of {n} months unless terminated.",
+        "The Tenant shall indemnify the Landlord against all losses arising from the Tenant's negligence.",
+        "Any dispute arising out of this agreement shall be referred to arbitration in Mumbai.",
+        "A late fee of Rs. {n} shall be payable for every day of delay in payment of rent.",
+        "In no event shall the Company be liable for any indirect or consequential damages.",
+        "The Employee shall keep all confidential information of the Company secret for {n} years.",
+        "This agreement shall be governed by the laws of India and the courts at Pune shall have jurisdiction.",
+        "The Landlord shall refund the security deposit within {n} days of the Tenant vacating the premises.",
+        "The Employee shall not join a competitor for {n} months; this non-compete survives termination.",
+        "The Tenant shall not sublet the premises without the prior written consent of the Landlord.",
+        "The lease has a lock-in period of {n} months during which neither party may end it.",
+    ],
+    'hi': [
+        "कोई भी पक्ष {n} दिनों का लिखित नोटिस देकर इस समझौते को समाप्त कर सकता है।",
+        "यह समझौता {n} महीनों की अवधि के लिए स्वतः नवीनीकरण होगा जब तक कि इसे समाप्त न किया जाए।",
+        "किरायेदार मकान मालिक को अपनी लापरवाही से हुए सभी नुकसानों की क्षतिपूर्ति करेगा।",
+        "इस समझौते से उत्पन्न कोई भी विवाद मुंबई में मध्यस्थता के लिए भेजा जाएगा।",
+        "किराए के भुगतान में देरी के प्रत्येक दिन के लिए {n} रुपये का जुर्माना देय होगा।",
+        "कर्मचारी कंपनी की सभी गोपनीय जानकारी {n} वर्षों तक सुरक्षित रखेगा।",
+        "मकान मालिक किरायेदार के परिसर खाली करने के {n} दिनों के भीतर सुरक्षा जमा लौटाएगा।",
+        "किरायेदार मकान मालिक की लिखित सहमति के बिना परिसर को उप-किराए पर नहीं देगा।",
+    ],
+}
+FILLER = {
+    'en': [
+        "The premises are situated at flat number {n} on the second floor of the building.",
+        "The monthly rent is Rs. {n} and is payable on the first day of each month.",
+        "The Tenant shall use the premises for residential purposes only.",
+        "The Landlord shall carry out structural repairs to the building as required.",
+        "Electricity and water charges shall be paid by the Tenant as per actual consumption.",
+    ],
+    'hi': [
+        "परिसर भवन की दूसरी मंजिल पर फ्लैट संख्या {n} में स्थित है।",
+        "मासिक किराया {n} रुपये है और प्रत्येक महीने के पहले दिन देय है।",
+        "किरायेदार परिसर का उपयोग केवल आवासीय उद्देश्यों के लिए करेगा।",
+    ],
+}
+BOILERPLATE = {
+    'en': [
+        "IN WITNESS WHEREOF the parties have signed this agreement on the date first written above.",
+        "This agreement may be executed in counterparts, each of which shall be deemed an original.",
+        "Signature: ____________\nName: ____________\nDate: ____________",
+        "Page {n} of 12",
+    ],
+    'hi': [
+        "साक्षी 1: ____________\nसाक्षी 2: ____________",
+        "हस्ताक्षर: ____________ दिनांक: ____________",
+    ],
+}
+
+
+def make_document(rng, language):
+    """A synthetic document and the (start, end) of its labeled clauses"""
+    paragraphs = []
+    for _ in range(rng.randint(6, 20)):
+        kind = rng.random()
+        if kind < 0.4:
+            paragraphs.append(('clause', rng.choice(CLAUSES[language])))
+        elif kind < 0.85:
+            paragraphs.append(('filler', rng.choice(FILLER[language])))
+        else:
+            paragraphs.append(('boilerplate', rng.choice(BOILERPLATE[language])))
+
+    text = ''
+    spans = []
+    for number, (kind, template) in enumerate(paragraphs, 1):
+        paragraph = template.format(n=rng.randint(2, 90))
+        if kind == 'clause':
+            spans.append((len(text) + len(f'{number}. '), len(text) + len(f'{number}. ') + len(paragraph)))
+        text += f'{number}. {paragraph}\n\n'
+    return text, spans
+
+
+def synthetic_corpus(documents, seed):
+    rng = random.Random(seed)
+    return [(language, *make_document(rng, language))
+            for language in ('en', 'hi') for _ in range(documents // 2)]
+
+
+def saved_corpus(path, language):
+    """(language, original text, model highlight spans) for every saved document"""
+    conn = storage.connect(path)
+    corpus = []
+    for row in conn.execute('SELECT text_hash, analysis_hash FROM documents'):
+        text = blob_store.get_text(conn, row['text_hash'])
+        annotations = blob_store.get_json(conn, row['analysis_hash']).get('annotations')
+        if not text or not isinstance(annotations, list):
+            continue
+        spans = [(start, end) for start, end, _ in find_annotation_spans(text, annotations)]
+        corpus.append((language, text, spans))
+    conn.close()
+    return corpus
+
+
+def overlaps(span, others):
+    return any(start < span[1] and span[0] < end for start, end in others)
+
+
+def trimmed_ranges(text, language):
+    """(start, end) of each section trim_boilerplate leaves out"""
+    ranges = []
+    position = 0
+    for section in split_sections(text):
+        _, removed = clause_rules.trim_boilerplate(section, language)
+        if removed:
+            ranges.append((position, position + len(section)))
+        position += len(section)
+    return ranges
+
+
+def evaluate(corpus, repeat):
+    by_language = {}
+    for language, text, reference in corpus:
+        stats = by_language.setdefault(language, {
+            'documents': 0, 'chars': 0, 'reference': 0, 'found': 0, 'predicted': 0, 'correct': 0,
+            'lost': 0, 'trimmed_chars': 0, 'detect_ms': [], 'trim_ms': []})
+        predicted = [(a['start'], a['end']) for a in clause_rules.detect_clauses(text, language)]
+        stats['documents'] += 1
+        stats['chars'] += len(text)
+        stats['reference'] += len(reference)
+        stats['found'] += sum(1 for span in reference if overlaps(span, predicted))
+        stats['predicted'] += len(predicted)
+        stats['correct'] += sum(1 for span in predicted if overlaps(span, reference))
+
+        _, removed = clause_rules.trim_boilerplate(text, language)
+        stats['trimmed_chars'] += removed
+        if removed:
+            stats['lost'] += sum(1 for span in reference if overlaps(span, trimmed_ranges(text, language)))
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            clause_rules.detect_clauses(text, language)
+            stats['detect_ms'].append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            clause_rules.trim_boilerplate(text, language)
+            stats['trim_ms'].append((time.perf_counter() - started) * 1000)
+
+    results = {}
+    for language, stats in by_language.items():
+        detect_seconds = sum(stats['detect_ms']) / 1000 / repeat
+        results[language] = {
+            'documents': stats['documents'],
+            'recall': round(stats['found'] / stats['reference'], 3) if stats['reference'] else None,
+            'precision': round(stats['correct'] / stats['predicted'], 3) if stats['predicted'] else None,
+            'lost_highlights': stats['lost'],
+            'trimmed_share': round(stats['trimmed_chars'] / stats['chars'], 3),
+            'detect_p50_ms': round(statistics.median(stats['detect_ms']), 3),
+            'detect_p95_ms': round(statistics.quantiles(stats['detect_ms'], n=20)[18], 3),
+            'trim_p50_ms': round(statistics.median(stats['trim_ms']), 3),
+            'detect_mb_per_s': round(stats['chars'] / 1e6 / detect_seconds, 1) if detect_seconds else None,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='A LegalClarity database with saved analyses')
+    parser.add_argument('--language', default='en', help='Language of the saved analyses')
+    parser.add_argument('--documents', type=int, default=400, help='Synthetic documents (without --database)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=19)
+    args = parser.parse_args()
+
+    corpus = saved_corpus(args.database, args.language) if args.database else []
+    source = 'database'
+    if not corpus:
+        if args.database:
+            print("No saved analyses found; using the synthetic corpus")
+        corpus = synthetic_corpus(args.documents, args.seed)
+        source = 'synthetic'
+
+    results = evaluate(corpus, args.repeat)
+    print(f"{'language':<9} {'docs':>6} {'recall':>7} {'prec.':>7} {'lost':>5} {'trimmed':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'MB/s':>7}")
+    for language, stats in results.items():
+        print(f"{language:<9} {stats['documents']:>6} {stats['recall']!s:>7} {stats['precision']!s:>7} "
+              f"{stats['lost_highlights']:>5} {stats['trimmed_share']:>8} {stats['detect_p50_ms']:>8} "
+              f"{stats['detect_p95_ms']:>8} {stats['detect_mb_per_s']!s:>7}")
+    print(json.dumps({'source': source, 'languages': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/cold_start.py
+"""
+Cold-start benchmark: time to import app.py and serve the first request.
+
+Each run starts a fresh interpreter with an empty database, the way a
+serverless instance does. The default lazy mode is compared against
+EAGER_SERVICE_CLIENTS=1, which restores the previous behaviour of importing
+and building the Vision/TTS clients and bootstrapping the database at import.
+
+    python benchmarks/cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_request': served - started}))
+"""
+
+
+def run_once(eager):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_PATH': os.path.join(tmp, 'database.db'),
+            'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+            'EAGER_SERVICE_CLIENTS': '1' if eager else '0',
+            'FLASK_SECRET_KEY': 'benchmark',
+            'GCP_PROJECT_ID': 'benchmark',
+        })
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples, key):
+    values = [sample[key] * 1000 for sample in samples]
+    return {'median_ms': round(statistics.median(values), 1), 'min_ms': round(min(values), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for label, eager in (('eager (before)', True), ('lazy (after)', False)):
+        samples = [run_once(eager) for _ in range(args.runs)]
+        results[label] = {'import': summarize(samples, 'import'), 'first_request': summarize(samples, 'first_request')}
+
+    print(f"{'mode':<16} {'import median':>14} {'first request median':>22}")
+    for label, result in results.items():
+        print(f"{label:<16} {result['import']['median_ms']:>11.1f} ms {result['first_request']['median_ms']:>19.1f} ms")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+# benchmarks/fake_app.py
+"""
+The real app with fake Google backends, for load tests against gunicorn.
+
+    DATABASE_PATH=/tmp/loadtest.db FAKE_MODEL_LATENCY_MS=800 \
+        gunicorn -c gunicorn.conf.py --pythonpath benchmarks -w 4 fake_app:app
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --concurrency 32
+
+Latency and error rates come from the FAKE_* variables read by fakes.from_env.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+import fakes  # noqa: E402
+
+backends = fakes.install(app_module)
+app = app_module.app
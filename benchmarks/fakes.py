@@ -0,0 +1,241 @@
+# benchmarks/fakes.py
+"""
+In-process fake Google backends for load tests and benchmarks.
+
+FakeVisionClient, FakeTTSClient and FakeModelRegistry implement just the
+calls app.py (and the async variants asgi.py makes), with configurable latency (mean plus uniform jitter)
+and error rate, so a run exercises the real request handling, job queue,
+caches and database without network access or credentials.
+
+``install(app_module)`` swaps them in; ``from_env`` reads the FAKE_*
+settings so a gunicorn worker (see fake_app.py) is configured the same way.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeBackendError(Exception):
+    """An injected backend failure"""
+
+
+class FakeBackend:
+    """Sleeps for latency_ms +/- jitter and fails with probability error_rate"""
+
+    def __init__(self, latency_ms=0, jitter=0.2, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, latency_ms=None):
+        """(seconds to wait, whether to fail) for one call"""
+        latency_ms = self.latency_ms if latency_ms is None else latency_ms
+        with self._lock:
+            self.calls += 1
+            spread = self._random.uniform(-self.jitter, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return max(latency_ms * (1 + spread), 0) / 1000, fail
+
+    def _simulate(self, latency_ms=None):
+        seconds, fail = self._draw(latency_ms)
+        time.sleep(seconds)
+        if fail:
+            raise FakeBackendError(f"Injected {type(self).__name__} failure")
+
+    async def _simulate_async(self, latency_ms=None):
+        """The same latency without blocking the event loop"""
+        seconds, fail = self._draw(latency_ms)
+        await asyncio.sleep(seconds)
+        if fail:
+            raise FakeBackendError(f"Injected {type(self).__name__} failure")
+
+
+def _ok():
+    return SimpleNamespace(message='')
+
+
+class FakeVisionClient(FakeBackend):
+    """Batch OCR; every image or PDF page 'contains' a few lines of a lease"""
+
+    PAGE_TEXT = ("Page {page}. The Tenant shall pay the monthly rent on or before the fifth day of each month. "
+                 "Either party may terminate this agreement with thirty days' written notice.")
+
+    def __init__(self, pdf_pages=8, **kwargs):
+        super().__init__(**kwargs)
+        self.pdf_pages = pdf_pages
+
+    def _page(self, number):
+        text = self.PAGE_TEXT.format(page=number)
+        return SimpleNamespace(error=_ok(), full_text_annotation=SimpleNamespace(text=text), text_annotations=[])
+
+    def batch_annotate_images(self, requests, timeout=None):
+        self._simulate()
+        return SimpleNamespace(responses=[self._page(1) for _ in requests])
+
+    def _files_response(self, requests):
+        numbers = list(requests[0].pages) or list(range(1, min(5, self.pdf_pages) + 1))
+        return SimpleNamespace(responses=[SimpleNamespace(
+            error=_ok(), total_pages=self.pdf_pages, responses=[self._page(number) for number in numbers]
+        )])
+
+    def batch_annotate_files(self, requests, timeout=None):
+        self._simulate()
+        return self._files_response(requests)
+
+
+class FakeAsyncVisionClient(FakeVisionClient):
+    """ImageAnnotatorAsyncClient counterpart: the batch methods are coroutines"""
+
+    async def batch_annotate_images(self, requests, timeout=None):
+        await self._simulate_async()
+        return SimpleNamespace(responses=[self._page(1) for _ in requests])
+
+    async def batch_annotate_files(self, requests, timeout=None):
+        await self._simulate_async()
+        return self._files_response(requests)
+
+
+class FakeTTSClient(FakeBackend):
+    """Returns about 1 KB of 'MP3' per 15 characters of input, like a 32 kbps voice"""
+
+    def _response(self, input):
+        return SimpleNamespace(audio_content=b'\xff\xfb' + os.urandom(max(len(input.text) * 1024 // 15, 64)))
+
+    def synthesize_speech(self, input, voice, audio_config):
+        self._simulate()
+        return self._response(input)
+
+
+class FakeAsyncTTSClient(FakeTTSClient):
+    """TextToSpeechAsyncClient counterpart"""
+
+    async def synthesize_speech(self, input, voice, audio_config):
+        await self._simulate_async()
+        return self._response(input)
+
+
+# The document or section text in app.py's analysis prompts
+DOCUMENT_PATTERN = re.compile(r'^(?:Document|Section|दस्तावेज़|भाग): (.*)\n\n', re.S | re.M)
+# The fields of an analysis in app.py's translation prompts
+TRANSLATION_PATTERN = re.compile(r'^(\{.*"explanations".*\})$', re.M)
+
+
+class FakeModel(FakeBackend):
+    """
+    Answers analysis prompts with JSON built from the document's sentences.
+    Latency is latency_ms for the first token plus ms_per_char for the output,
+    spread over the chunks when streaming.
+    """
+
+    def __init__(self, ms_per_char=2.0, **kwargs):
+        super().__init__(**kwargs)
+        self.ms_per_char = ms_per_char
+
+    def _response_text(self, prompt):
+        translation = TRANSLATION_PATTERN.search(prompt)
+        if translation:
+            # "Translate" by tagging every value with the prompt's language
+            tag = '[hi] ' if re.search('[\u0900-\u097f]', prompt[:40]) else '[en] '
+            fields = json.loads(translation.group(1))
+            return json.dumps({'title': tag + fields['title'], 'summary': tag + fields['summary'],
+                               'explanations': [tag + text for text in fields['explanations']]}, ensure_ascii=False)
+        match = DOCUMENT_PATTERN.search(prompt)
+        document = match.group(1) if match else prompt
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?।])\s+', document) if len(s.strip()) > 20]
+        return '```json\n' + json.dumps({
+            'title': 'Residential Lease Agreement',
+            'summary': ' '.join(sentences[:3])[:600] or 'A short legal document.',
+            'annotations': [
+                {'text_to_highlight': sentence[:120], 'explanation': 'This clause sets out an obligation you should note.'}
+                for sentence in sentences[:6]
+            ],
+        }, ensure_ascii=False) + '\n```'
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        text = self._response_text(prompt)
+        if not stream:
+            self._simulate(self.latency_ms + len(text) * self.ms_per_char)
+            return SimpleNamespace(text=text)
+
+        def chunks():
+            self._simulate()
+            for start in range(0, len(text), 40):
+                time.sleep(40 * self.ms_per_char / 1000)
+                yield SimpleNamespace(text=text[start:start + 40])
+        return chunks()
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None):
+        """Like GenerativeModel.generate_content_async: awaited, and an async iterator when streaming"""
+        text = self._response_text(prompt)
+        if not stream:
+            await self._simulate_async(self.latency_ms + len(text) * self.ms_per_char)
+            return SimpleNamespace(text=text)
+
+        async def chunks():
+            await self._simulate_async()
+            for start in range(0, len(text), 40):
+                await asyncio.sleep(40 * self.ms_per_char / 1000)
+                yield SimpleNamespace(text=text[start:start + 40])
+        return chunks()
+
+
+class FakeModelRegistry:
+    """Stands in for model_registry.ModelRegistry"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def model_name_for(self, language='en'):
+        return 'fake-model'
+
+    def get_model(self, language='en'):
+        return self.model
+
+    def warm_up(self, languages=('en',)):
+        return self.health()
+
+    def health(self):
+        return {'initialized': True, 'models': ['fake-model'], 'fake': True}
+
+
+def from_env(seed=None):
+    """Build the fakes from FAKE_* environment variables"""
+    error_rate = float(os.getenv('FAKE_ERROR_RATE', 0))
+    vision = dict(latency_ms=float(os.getenv('FAKE_VISION_LATENCY_MS', 400)),
+                  pdf_pages=int(os.getenv('FAKE_VISION_PDF_PAGES', 8)), error_rate=error_rate, seed=seed)
+    tts = dict(latency_ms=float(os.getenv('FAKE_TTS_LATENCY_MS', 300)), error_rate=error_rate, seed=seed)
+    return {
+        'vision': FakeVisionClient(**vision),
+        'vision_async': FakeAsyncVisionClient(**vision),
+        'tts': FakeTTSClient(**tts),
+        'tts_async': FakeAsyncTTSClient(**tts),
+        'model': FakeModel(
+            latency_ms=float(os.getenv('FAKE_MODEL_LATENCY_MS', 800)),
+            ms_per_char=float(os.getenv('FAKE_MODEL_MS_PER_CHAR', 2.0)),
+            error_rate=error_rate, seed=seed),
+    }
+
+
+def install(app_module, fakes=None):
+    """Replace the Google clients and the Vertex AI registry used by app_module"""
+    import service_clients
+
+    fakes = fakes or from_env()
+    service_clients.set_client('vision', fakes['vision'])
+    service_clients.set_client('tts', fakes['tts'])
+    for name in ('vision_async', 'tts_async'):
+        if name in fakes:
+            service_clients.set_client(name, fakes[name])
+    app_module.set_model_registry(FakeModelRegistry(fakes['model']))
+    return fakes
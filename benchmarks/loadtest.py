@@ -0,0 +1,412 @@
+# benchmarks/loadtest.py
+"""
+Offline load test: drives the real app with fake Google backends.
+
+Each virtual user registers and logs in, then repeatedly submits a document
+to /analyze-document (pasted text, or a page image with --upload-ratio),
+polls its job, opens /analysis/<id> and /dashboard, and plays the summary
+through /text-to-speech. Throughput and p50/p95/p99 latency are reported per
+endpoint and saved as JSON; --compare prints the change against an earlier
+run and exits with status 1 when a p95 regressed by more than --max-regression.
+
+Without --url the app runs in this process on a threaded werkzeug server with
+a temporary database and the fakes from fakes.py (latency flags below). To
+measure the production server instead, start benchmarks/fake_app.py under
+gunicorn and pass its --url; the FAKE_* variables then configure the fakes.
+
+    python benchmarks/loadtest.py --concurrency 16 --duration 30 --output baseline.json
+    python benchmarks/loadtest.py --concurrency 16 --duration 30 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zlib
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLAUSES = [
+    "The Tenant shall pay the monthly rent of {amount} rupees on or before the fifth day of each month.",
+    "A security deposit equal to {months} months of rent is payable before possession and is refundable within thirty days of vacating.",
+    "Either party may terminate this agreement by giving {days} days' written notice to the other party.",
+    "The Landlord may increase the rent by up to {percent} percent at each renewal of this agreement.",
+    "The Tenant shall not sublet or assign the premises without the prior written consent of the Landlord.",
+    "Late payment of rent attracts interest at {percent} percent per month on the outstanding amount.",
+    "The Tenant is responsible for minor repairs costing less than {amount} rupees.",
+    "Any dispute arising under this agreement shall be referred to arbitration in {city}.",
+]
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Chennai', 'Pune', 'Hyderabad']
+
+
+def make_document(rng, unique):
+    """A lease of 8-16 clauses; with unique=False only 20 distinct documents are produced"""
+    if not unique:
+        rng = random.Random(rng.randrange(20))
+    clauses = [
+        rng.choice(CLAUSES).format(amount=rng.randrange(5, 90) * 1000, months=rng.randrange(1, 7),
+                                   days=rng.choice([15, 30, 60, 90]), percent=rng.randrange(2, 15),
+                                   city=rng.choice(CITIES))
+        for _ in range(rng.randrange(8, 17))
+    ]
+    return 'RESIDENTIAL LEASE AGREEMENT\n\n' + '\n\n'.join(f"{n}. {clause}" for n, clause in enumerate(clauses, 1))
+
+
+def make_png(rng, width=800, height=1100):
+    """A grayscale PNG with a random pattern, so every upload misses the OCR cache"""
+    row_seed = bytes(rng.randrange(256) for _ in range(width))
+    raw = b''.join(b'\x00' + row_seed[y % 7:] + row_seed[:y % 7] for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency samples, error and rejection counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.error_messages = defaultdict(int)
+
+    def add(self, name, elapsed, ok=True, rejected=False, message=None):
+        with self._lock:
+            if rejected:
+                self.rejected[name] += 1
+            elif ok:
+                self.samples[name].append(elapsed * 1000)
+            else:
+                self.errors[name] += 1
+                if message:
+                    self.error_messages[f"{name}: {message[:120]}"] += 1
+
+    def report(self, duration):
+        endpoints = {}
+        for name in sorted(set(self.samples) | set(self.errors) | set(self.rejected)):
+            values = sorted(self.samples[name])
+            count = len(values)
+            endpoints[name] = {
+                'requests': count + self.errors[name] + self.rejected[name],
+                'ok': count,
+                'errors': self.errors[name],
+                'rejected': self.rejected[name],
+                'throughput_rps': round(count / duration, 2),
+                'mean_ms': round(sum(values) / count, 1) if count else None,
+                'p50_ms': round(percentile(values, 0.50), 1) if count else None,
+                'p95_ms': round(percentile(values, 0.95), 1) if count else None,
+                'p99_ms': round(percentile(values, 0.99), 1) if count else None,
+                'max_ms': round(values[-1], 1) if count else None,
+            }
+        return endpoints
+
+
+class Response:
+    """The parts of an HTTP response the load test looks at"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Hand 3xx responses back as they are (the login check reads their Location)"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def encode_body(form=None, json_body=None, files=None):
+    """(body bytes, content type) for a urlencoded form, a JSON body or a multipart upload"""
+    if json_body is not None:
+        return json.dumps(json_body).encode('utf-8'), 'application/json'
+    if files:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in (form or {}).items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8')
+                         + str(value).encode('utf-8') + b'\r\n')
+        for name, (filename, content, content_type) in files.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                         f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+        return b''.join(parts) + f'--{boundary}--\r\n'.encode('utf-8'), f'multipart/form-data; boundary={boundary}'
+    if form is not None:
+        return urllib.parse.urlencode(form).encode('utf-8'), 'application/x-www-form-urlencoded'
+    return None, None
+
+
+class VirtualUser:
+    """One logged-in browser session working through the analysis flow"""
+
+    def __init__(self, base_url, recorder, args, index):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.args = args
+        self.rng = random.Random(f"{args.seed}-{index}")
+        # One cookie jar per user, like a browser session
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+        self.username = f"load-{uuid.uuid4().hex[:10]}"
+        self.analyses = 0
+
+    def send(self, method, path, body, content_type):
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with self.opener.open(request, timeout=self.args.timeout) as response:
+                # Reading the body includes it (e.g. streamed audio) in the latency
+                return Response(response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            # Error statuses and unfollowed redirects
+            with e:
+                return Response(e.code, e.headers, e.read())
+
+    def request(self, name, method, path, retry_until=None, form=None, json_body=None, files=None):
+        """
+        Send one request and record it under name. 429s and 503s with Retry-After
+        are counted as rejected and retried after the advertised delay until retry_until.
+        """
+        body, content_type = encode_body(form, json_body, files)
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.send(method, path, body, content_type)
+            except (urllib.error.URLError, OSError) as e:
+                self.recorder.add(name, time.perf_counter() - started, ok=False, message=type(e).__name__)
+                return None
+            elapsed = time.perf_counter() - started
+            if response.status_code in (429, 503) and 'Retry-After' in response.headers:
+                self.recorder.add(name, elapsed, rejected=True)
+                delay = min(float(response.headers['Retry-After']), 5.0)
+                if retry_until is None or time.monotonic() + delay >= retry_until:
+                    return None
+                time.sleep(delay * self.rng.uniform(0.5, 1.0))
+                continue
+            ok = response.status_code < 400
+            self.recorder.add(name, elapsed, ok=ok, message=None if ok else f"HTTP {response.status_code}")
+            return response if ok else None
+
+    def sign_in(self):
+        form = {'username': self.username, 'password': 'load-test-password'}
+        if self.request('POST /register', 'POST', '/register', form=form) is None:
+            return False
+        response = self.request('POST /login', 'POST', '/login', form=form)
+        return response is not None and '/dashboard' in response.headers.get('Location', '')
+
+    def submit(self, deadline):
+        if self.rng.random() < self.args.upload_ratio:
+            png = make_png(self.rng if self.args.unique else random.Random(self.rng.randrange(5)))
+            kwargs = {'files': {'document': ('page.png', png, 'image/png')}}
+        else:
+            kwargs = {'form': {'text': make_document(self.rng, self.args.unique)}}
+        return self.request('POST /analyze-document', 'POST', '/analyze-document', retry_until=deadline, **kwargs)
+
+    def wait_for_job(self, status_url, submitted, deadline):
+        """Poll the job until it finishes; records the end-to-end analysis time"""
+        while time.monotonic() < deadline + self.args.timeout:
+            time.sleep(self.args.poll_interval)
+            response = self.request('GET /jobs/<id>', 'GET', status_url)
+            if response is None:
+                return None
+            job = response.json()
+            if job['status'] == 'succeeded':
+                self.recorder.add('analysis (submit to done)', time.perf_counter() - submitted)
+                return job['new_document_id']
+            if job['status'] == 'failed':
+                self.recorder.add('analysis (submit to done)', 0, ok=False, message=job.get('error'))
+                return None
+        self.recorder.add('analysis (submit to done)', 0, ok=False, message='still running at the end of the run')
+        return None
+
+    def run(self, deadline):
+        if not self.sign_in():
+            return
+        while time.monotonic() < deadline:
+            submitted = time.perf_counter()
+            response = self.submit(deadline)
+            if response is None:
+                continue
+            doc_id = self.wait_for_job(response.json()['status_url'], submitted, deadline)
+            if doc_id is None:
+                continue
+            self.analyses += 1
+            page = self.request('GET /analysis/<id>', 'GET', f"/analysis/{doc_id}")
+            self.request('GET /dashboard', 'GET', '/dashboard')
+            if page is not None and self.rng.random() < self.args.tts_ratio:
+                # With --no-unique the same few passages repeat, so the audio cache hits
+                text = f"Summary of document {doc_id if self.args.unique else doc_id % 20}. " * 3
+                self.request('POST /text-to-speech', 'POST', '/text-to-speech', retry_until=deadline, json_body={'text': text})
+            time.sleep(self.rng.uniform(0, self.args.think_time))
+
+
+def start_in_process_server(args, tmp):
+    """Import app.py against a temporary database, install the fakes and serve it on a free port"""
+    os.environ.update({
+        'DATABASE_PATH': os.path.join(tmp, 'database.db'),
+        'UPLOAD_FOLDER': os.path.join(tmp, 'uploads'),
+        'TTS_CACHE_DIR': os.path.join(tmp, 'tts_cache'),
+        'FLASK_SECRET_KEY': os.environ.get('FLASK_SECRET_KEY', 'load-test'),
+        'GCP_PROJECT_ID': os.environ.get('GCP_PROJECT_ID', 'load-test'),
+    })
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No access log line per request
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fakes
+
+    backends = {
+        'vision': fakes.FakeVisionClient(latency_ms=args.vision_latency, error_rate=args.error_rate, seed=args.seed),
+        'tts': fakes.FakeTTSClient(latency_ms=args.tts_latency, error_rate=args.error_rate, seed=args.seed),
+        'model': fakes.FakeModel(latency_ms=args.model_latency, ms_per_char=args.model_ms_per_char,
+                                 error_rate=args.error_rate, seed=args.seed),
+    }
+    fakes.install(app_module, backends)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, backends
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(endpoints):
+    print(f"{'endpoint':<28}{'ok':>7}{'err':>6}{'shed':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in endpoints.items():
+        cells = [f"{stats[key]:>9}" if stats[key] is not None else f"{'-':>9}" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{name:<28}{stats['ok']:>7}{stats['errors']:>6}{stats['rejected']:>6}"
+              f"{stats['throughput_rps']:>8}" + ''.join(cells))
+
+
+def compare(endpoints, baseline_path, max_regression):
+    """Print p50/p95/throughput changes against a saved run; return the endpoints whose p95 regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    regressed = []
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'endpoint':<28}{'p50':>10}{'p95':>10}{'req/s':>10}")
+    for name, stats in endpoints.items():
+        before = baseline.get(name)
+        if not before or not before['p95_ms'] or stats['p95_ms'] is None:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'throughput_rps'):
+            changes.append((stats[key] - before[key]) / before[key] if before[key] else 0.0)
+        print(f"{name:<28}" + ''.join(f"{change:>+10.1%}" for change in changes))
+        if changes[1] > max_regression:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Base URL of a running server (default: run the app in this process)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to keep submitting documents")
+    parser.add_argument('--unique', action=argparse.BooleanOptionalAction, default=True,
+                        help="Generate a new document each time, so the analysis and OCR caches miss")
+    parser.add_argument('--upload-ratio', type=float, default=0.2, help="Share of submissions that upload an image")
+    parser.add_argument('--tts-ratio', type=float, default=0.5, help="Share of analyses that are played as audio")
+    parser.add_argument('--think-time', type=float, default=0.5, help="Maximum pause between analyses, in seconds")
+    parser.add_argument('--poll-interval', type=float, default=0.25)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--model-latency', type=float, default=800, help="Fake Vertex AI time to first token, ms")
+    parser.add_argument('--model-ms-per-char', type=float, default=2.0)
+    parser.add_argument('--vision-latency', type=float, default=400, help="Fake Vision latency per request, ms")
+    parser.add_argument('--tts-latency', type=float, default=300, help="Fake TTS latency per request, ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of fake backend calls that fail")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Save the results as JSON")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="With --compare, fail when a p95 is this much slower (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server, backends = None, None
+        base_url = args.url.rstrip('/') if args.url else None
+        if base_url is None:
+            server, backends = start_in_process_server(args, tmp)
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+        recorder = Recorder()
+        users = [VirtualUser(base_url, recorder, args, index) for index in range(args.concurrency)]
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=user.run, args=(deadline,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if server is not None:
+            server.shutdown()
+
+    endpoints = recorder.report(elapsed)
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'elapsed_s': round(elapsed, 2),
+        'analyses_completed': sum(user.analyses for user in users),
+        'endpoints': endpoints,
+        'errors': dict(recorder.error_messages),
+    }
+    if backends is not None:
+        results['backend_calls'] = {name: {'calls': fake.calls, 'errors': fake.errors} for name, fake in backends.items()}
+
+    print_table(endpoints)
+    print(f"\n{results['analyses_completed']} analyses in {elapsed:.1f}s "
+          f"({results['analyses_completed'] / elapsed:.2f}/s) with {args.concurrency} users")
+    for message, count in sorted(recorder.error_messages.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {count} x {message}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.compare:
+        regressed = compare(endpoints, args.compare, args.max_regression)
+        if regressed:
+            print(f"p95 regressed by more than {args.max_regression:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# benchmarks/near_duplicate_bench.py
+"""
+Near-duplicate detection benchmark: detection quality, lookup latency,
+index size, and how much text still goes to the model.
+
+Documents are generated from a few contract templates with different
+names, dates and amounts (plus some reworded clauses), mixed with
+unrelated documents. The index is filled with --documents of them, then
+--queries new variants are looked up. A query counts as a true near-duplicate
+when its exact shingle Jaccard similarity to some indexed document of the
+same template reaches the threshold.
+
+    python benchmarks/near_duplicate_bench.py --documents 5000 --num-perm 64 --bands 16
+    python benchmarks/near_duplicate_bench.py --num-perm 128 --bands 32 --threshold 0.8
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from near_duplicates import MinHasher, NearDuplicateIndex, changed_sections, jaccard, shingles  # noqa: E402
+
+NAMES = ['Ravi Kumar', 'Anita Desai', 'Kiran Rao', 'Sunil Mehta', 'Priya Nair', 'Arjun Singh', 'Meera Iyer',
+         'Farhan Ali', 'Neha Gupta', 'Vikram Joshi']
+CITIES = ['Mumbai', 'Pune', 'Delhi', 'Bengaluru', 'Chennai', 'Hyderabad', 'Kolkata']
+WORDS = ('party premises rent deposit notice term agreement landlord tenant payment month period '
+         'repair consent written default interest liability property use water electricity maintenance '
+         'inspection renewal termination arbitration court law schedule possession key fixture damage').split()
+
+
+def sentence(rng, words=WORDS):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(12, 24))).capitalize() + '.'
+
+
+def make_template(rng):
+    """Paragraphs with {name}, {city}, {amount} and {date} placeholders in some of them"""
+    paragraphs = []
+    for number in range(1, rng.randint(15, 35)):
+        text = ' '.join(sentence(rng) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            text += ' ' + rng.choice(['This is agreed by {name}.', 'The amount is Rs. {amount}.',
+                                      'Executed at {city} on {date}.', 'Payable to {name} by {date}.'])
+        paragraphs.append(f'{number}. {text}')
+    return paragraphs
+
+
+def fill(rng, template, reworded_share):
+    """One document from a template; some paragraphs get a sentence rewritten"""
+    values = {'name': rng.choice(NAMES), 'city': rng.choice(CITIES), 'amount': rng.randint(5, 90) * 1000,
+              'date': f'{rng.randint(1, 28)}/{rng.randint(1, 12)}/20{rng.randint(20, 26)}'}
+    paragraphs = []
+    for paragraph in template:
+        if rng.random() < reworded_share:
+            paragraph = paragraph.split('. ')[0] + '. ' + sentence(rng)
+        paragraphs.append(paragraph.format(**values))
+    return '\n\n'.join(paragraphs) + '\n'
+
+
+def build_corpus(rng, count, templates, unrelated_share, reworded_share):
+    corpus = []
+    for _ in range(count):
+        if rng.random() < unrelated_share:
+            corpus.append((None, '\n\n'.join(sentence(rng) for _ in range(rng.randint(10, 30)))))
+        else:
+            family = rng.randrange(len(templates))
+            corpus.append((family, fill(rng, templates[family], reworded_share)))
+    return corpus
+
+
+def index_bytes(conn):
+    """Bytes used by the index tables (and their indexes), from dbstat when SQLite has it"""
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE '%near_duplicate%'").fetchone()[0]
+    except Exception:
+        return None
+
+
+def percentiles(samples):
+    return {'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(statistics.quantiles(samples, n=20)[18], 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=3000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--templates', type=int, default=20)
+    parser.add_argument('--unrelated-share', type=float, default=0.3)
+    parser.add_argument('--reworded-share', type=float, default=0.08, help='Paragraphs rewritten per variant')
+    parser.add_argument('--num-perm', type=int, default=64)
+    parser.add_argument('--bands', type=int, default=16)
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    templates = [make_template(rng) for _ in range(args.templates)]
+    stored = build_corpus(rng, args.documents, templates, args.unrelated_share, args.reworded_share)
+    queries = build_corpus(rng, args.queries, templates, args.unrelated_share, args.reworded_share)
+    index = NearDuplicateIndex(MinHasher(args.num_perm, args.bands), threshold=args.threshold,
+                               max_documents=args.documents)
+
+    results = {'documents': args.documents, 'queries': args.queries, 'num_perm': args.num_perm,
+               'bands': args.bands, 'threshold': args.threshold}
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = storage.connect(os.path.join(tmp, 'bench.db'))
+        storage.migrate(conn)
+        add_ms = []
+        for doc_id, (_, text) in enumerate(stored, 1):
+            started = time.perf_counter()
+            index.add(conn, doc_id, 1, 'en', text)
+            add_ms.append((time.perf_counter() - started) * 1000)
+        conn.commit()
+        results['add'] = percentiles(add_ms)
+        size = index_bytes(conn)
+        results['index_bytes'] = size
+        results['index_bytes_per_document'] = round(size / args.documents) if size else None
+
+        stored_shingles = [(family, shingles(text), text) for family, text in stored]
+        counts = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0}
+        lookup_ms = []
+        sent_shares = []
+        for family, text in queries:
+            query_shingles = shingles(text)
+            best, best_text = 0.0, None
+            if family is not None:
+                for other_family, other_shingles, other_text in stored_shingles:
+                    if other_family == family:
+                        similarity = jaccard(query_shingles, other_shingles)
+                        if similarity > best:
+                            best, best_text = similarity, other_text
+            expected = best >= args.threshold
+
+            started = time.perf_counter()
+            candidates = index.candidates(conn, text, 'en')
+            # As in app.find_near_duplicate: confirm on the exact shingles
+            found = None
+            for doc_id, _ in candidates:
+                _, other_shingles, other_text = stored_shingles[doc_id - 1]
+                if jaccard(query_shingles, other_shingles) >= args.threshold:
+                    found = other_text
+                    break
+            lookup_ms.append((time.perf_counter() - started) * 1000)
+
+            counts[('t' if bool(found) == expected else 'f') + ('p' if found else 'n')] += 1
+            if found:
+                changed = sum(end - start for start, end in changed_sections(found, text))
+                sent_shares.append(changed / len(text))
+        conn.close()
+
+    results['lookup'] = percentiles(lookup_ms)
+    results['detection'] = dict(counts, precision=round(counts['tp'] / max(counts['tp'] + counts['fp'], 1), 3),
+                                recall=round(counts['tp'] / max(counts['tp'] + counts['fn'], 1), 3))
+    results['reused'] = len(sent_shares)
+    results['text_sent_to_model_when_reused'] = round(statistics.mean(sent_shares), 3) if sent_shares else None
+
+    print(f"index: {results['index_bytes']} bytes ({results['index_bytes_per_document']} per document)")
+    print(f"add p50 {results['add']['p50_ms']} ms, lookup p50 {results['lookup']['p50_ms']} ms "
+          f"p95 {results['lookup']['p95_ms']} ms")
+    print(f"precision {results['detection']['precision']} recall {results['detection']['recall']}, "
+          f"{results['reused']} of {args.queries} queries reuse an analysis and send "
+          f"{results['text_sent_to_model_when_reused']} of their text to the model")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
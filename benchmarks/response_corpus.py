@@ -0,0 +1,117 @@
+# benchmarks/response_corpus.py
+"""
+Offline regression run of response_parsing over a corpus of bad model responses.
+
+Each line of bad_responses.jsonl (next to this file) is one response as a
+model really sent it: fenced, wrapped in prose, with trailing commas, cut off
+mid-annotation, with unescaped quotes, ... and what parsing it must give:
+
+    {"name": ..., "schema": "analysis" | "section" | "summary" | "translation",
+     "response": ..., "follow_up_reply": ...,  (what the model answers a follow-up)
+     "outcome": "ok" | "repaired" | "reasked" | "failed",
+     "expect": {"field": "exact value" | item count | null (field dropped)}}
+
+No model is called. The script prints each case, the outcome counts and how
+long parsing takes, and exits 1 when any case regresses, so it can run in CI:
+
+    python benchmarks/response_corpus.py
+    python benchmarks/response_corpus.py --corpus my_responses.jsonl --repeat 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import response_parsing  # noqa: E402
+from response_parsing import ResponseParseError  # noqa: E402
+
+SCHEMAS = {
+    'analysis': response_parsing.ANALYSIS_SCHEMA,
+    'section': response_parsing.SECTION_SCHEMA,
+    'summary': response_parsing.SUMMARY_SCHEMA,
+    'translation': response_parsing.TRANSLATION_SCHEMA,
+}
+
+
+def run_case(case):
+    """(outcome, value, follow-up prompt or None) for one corpus case"""
+    prompts = []
+
+    def ask(prompt):
+        prompts.append(prompt)
+        return case.get('follow_up_reply', '')
+
+    before = dict(response_parsing.RESPONSES.samples)
+    try:
+        value = response_parsing.parse_with_follow_up(case['response'], SCHEMAS[case['schema']], ask)
+    except ResponseParseError:
+        value = None
+    outcome = next(labels[0] for labels, count in response_parsing.RESPONSES.samples.items()
+                   if count != before.get(labels, 0))
+    return outcome, value, prompts[0] if prompts else None
+
+
+def problems(case, outcome, value):
+    found = []
+    if outcome != case['outcome']:
+        found.append(f"outcome {outcome}, expected {case['outcome']}")
+    for field, expected in case.get('expect', {}).items():
+        actual = (value or {}).get(field)
+        if expected is None:
+            if field in (value or {}):
+                found.append(f'{field} should have been dropped')
+        elif isinstance(expected, int):
+            if not isinstance(actual, list) or len(actual) != expected:
+                found.append(f'{field}: {len(actual) if isinstance(actual, list) else actual!r} items, expected {expected}')
+        elif actual != expected:
+            found.append(f'{field}: {actual!r}, expected {expected!r}')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'bad_responses.jsonl'))
+    parser.add_argument('--repeat', type=int, default=200, help='Parses per case when timing')
+    parser.add_argument('--verbose', action='store_true', help='Print follow-up prompts')
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    outcomes = Counter()
+    failures = 0
+    for case in cases:
+        outcome, value, prompt = run_case(case)
+        outcomes[outcome] += 1
+        found = problems(case, outcome, value)
+        failures += bool(found)
+        print(f"{'FAIL' if found else 'ok':<5} {case['name']:<40} {outcome:<9} {'; '.join(found)}")
+        if prompt and args.verbose:
+            print('      ' + prompt.replace('\n', '\n      '))
+
+    # Parse time per response (no follow-ups), i.e. what the repair pass adds to a model call
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for case in cases:
+            try:
+                response_parsing.parse(case['response'], SCHEMAS[case['schema']])
+            except ResponseParseError:
+                pass
+    per_parse_us = (time.perf_counter() - started) / (args.repeat * len(cases)) * 1e6
+
+    total = len(cases)
+    print(f"\n{total} responses: {dict(outcomes)}; "
+          f"{outcomes['repaired']} saved a model call, {outcomes['reasked']} cost a tail-only follow-up; "
+          f"{per_parse_us:.1f} us per parse")
+    print(json.dumps({'cases': total, 'regressions': failures, 'outcomes': dict(outcomes),
+                      'parse_us': round(per_parse_us, 1)}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
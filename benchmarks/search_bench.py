@@ -0,0 +1,137 @@
+# benchmarks/search_bench.py
+"""
+Dashboard pagination and full-text search benchmark.
+
+Fills a database with synthetic contracts (one heavy user owns a large
+share of them), then measures
+  * search     - search_index.search (FTS5 match + bm25 + blob snippets)
+                 for common, rare, multi-term and unmatched queries
+  * dashboard  - a deep dashboard page fetched with OFFSET (what a page
+                 number would cost) versus the (created, id) keyset cursor
+
+    python benchmarks/search_bench.py --documents 100000 --heavy-share 0.05
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blob_store  # noqa: E402
+import search_index  # noqa: E402
+import storage  # noqa: E402
+
+WORDS = (
+    'tenant landlord lessee lessor rent deposit premises notice terminate arbitration indemnify '
+    'sublet renewal maintenance repairs utilities electricity water insurance liability damages '
+    'breach default interest penalty payment month year period agreement clause party parties '
+    'property possession vacate inspection keys furniture fixtures society charges tax stamp duty '
+    'registration jurisdiction court dispute mediation force majeure confidentiality assignment '
+    'employee employer salary probation gratuity leave resignation non-compete severance bonus'
+).split()
+QUERIES = {
+    'common': 'tenant rent',
+    'rare': 'gratuity severance',
+    'four-terms': 'landlord deposit notice terminate',
+    'no-match': 'security refund',
+}
+PAGE_SIZE = 25
+
+
+def make_text(rng, words):
+    sentences = []
+    for _ in range(rng.randint(15, 40)):
+        sentences.append(' '.join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + '.')
+    return ' '.join(sentences)
+
+
+def build(path, documents, users, heavy_share, seed):
+    rng = random.Random(seed)
+    # A larger vocabulary than the legal words alone so posting lists look realistic
+    words = WORDS + [f"term{i}" for i in range(5000)]
+    conn = storage.connect(path)
+    storage.migrate(conn)
+    conn.executemany('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                     ((f'user{i}', 'x') for i in range(users)))
+    for i in range(documents):
+        user_id = 1 if rng.random() < heavy_share else rng.randint(2, users)
+        text = make_text(rng, words)
+        analysis = {'title': f'Agreement {i}', 'summary': make_text(rng, WORDS)[:300], 'annotations': []}
+        created = f'2024-{1 + i * 12 // documents:02d}-01 00:00:{i % 60:02d}'
+        cursor = conn.execute(
+            'INSERT INTO documents (created, title, user_id, text_hash, analysis_hash) VALUES (?, ?, ?, ?, ?)',
+            (created, analysis['title'], user_id, blob_store.put_blob(conn, text), blob_store.put_json(conn, analysis))
+        )
+        search_index.index_document(conn, cursor.lastrowid, user_id, analysis['title'], analysis['summary'], text)
+        if i % 5000 == 4999:
+            conn.commit()
+    conn.commit()
+    conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(statistics.quantiles(samples, n=20)[18], 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--heavy-share', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    results = {'documents': args.documents, 'search': {}, 'dashboard': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        build(path, args.documents, args.users, args.heavy_share, args.seed)
+        results['build_seconds'] = round(time.perf_counter() - started, 1)
+
+        conn = storage.connect(path)
+        heavy_docs = conn.execute('SELECT COUNT(*) FROM documents WHERE user_id = 1').fetchone()[0]
+        results['heavy_user_documents'] = heavy_docs
+        for user_label, user_id in (('heavy', 1), ('typical', 2)):
+            for label, query in QUERIES.items():
+                hits = len(search_index.search(conn, user_id, query))
+                stats = timed(lambda: search_index.search(conn, user_id, query), args.repeat)
+                results['search'][f'{user_label}/{label}'] = dict(stats, results=hits)
+
+        deep = heavy_docs - PAGE_SIZE * 2
+        offset_sql = ('SELECT id, created, title FROM documents WHERE user_id = 1 '
+                      'ORDER BY created DESC, id DESC LIMIT ? OFFSET ?')
+        last = conn.execute(offset_sql, (1, deep - 1)).fetchone()
+        keyset_sql = ('SELECT id, created, title FROM documents WHERE user_id = 1 AND (created, id) < (?, ?) '
+                      'ORDER BY created DESC, id DESC LIMIT ?')
+        results['dashboard']['offset_deep_page'] = timed(
+            lambda: conn.execute(offset_sql, (PAGE_SIZE + 1, deep)).fetchall(), args.repeat)
+        results['dashboard']['keyset_deep_page'] = timed(
+            lambda: conn.execute(keyset_sql, (last['created'], last['id'], PAGE_SIZE + 1)).fetchall(), args.repeat)
+        results['dashboard']['load_all_rows'] = timed(
+            lambda: conn.execute('SELECT id, created, title FROM documents WHERE user_id = 1 '
+                                 'ORDER BY created DESC').fetchall(), args.repeat)
+        conn.close()
+
+    print(f"{'case':<28} {'p50 ms':>8} {'p95 ms':>8}")
+    for section in ('search', 'dashboard'):
+        for label, stats in results[section].items():
+            print(f"{section + ' ' + label:<28} {stats['p50_ms']:>8} {stats['p95_ms']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
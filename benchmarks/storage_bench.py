@@ -0,0 +1,122 @@
+# benchmarks/storage_bench.py
+"""
+Storage benchmark: dashboard query and insert throughput.
+
+Builds a database with thousands of users and documents, then compares
+  * baseline - default journaling, no composite index, a new connection per
+               operation (how get_db/init_db worked before storage.py)
+  * tuned    - storage.get_connection (WAL + pragmas, reused connection)
+               with all migrations applied, including the
+               documents(user_id, created) index
+
+    python benchmarks/storage_bench.py --users 2000 --documents 50000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blob_store  # noqa: E402
+import storage  # noqa: E402
+from migrations import INITIAL_SCHEMA  # noqa: E402
+
+DASHBOARD_QUERY = 'SELECT id, created, title FROM documents WHERE user_id = ? ORDER BY created DESC'
+INSERT_DOCUMENT = 'INSERT INTO documents (title, original_text, analysis_json, user_id) VALUES (?, ?, ?, ?)'
+ANALYSIS_JSON = json.dumps({'title': 'Lease', 'summary': 'A residential lease.', 'annotations': []})
+ORIGINAL_TEXT = 'The tenant shall pay rent on the first day of each month. ' * 40
+
+
+def populate(conn, users, documents):
+    conn.executemany(
+        'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+        ((f'user{i}', 'x') for i in range(users))
+    )
+    conn.executemany(
+        'INSERT INTO documents (created, title, original_text, analysis_json, user_id) VALUES (?, ?, ?, ?, ?)',
+        ((f'2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}', f'Document {i}', ORIGINAL_TEXT, ANALYSIS_JSON,
+          random.randint(1, users)) for i in range(documents))
+    )
+    conn.commit()
+
+
+def build(path, users, documents, tuned):
+    conn = sqlite3.connect(path)
+    conn.executescript(INITIAL_SCHEMA)
+    populate(conn, users, documents)
+    conn.close()
+    if tuned:
+        # Upgrade the populated database the way a deployment would
+        conn = storage.connect(path)
+        storage.migrate(conn)
+        conn.close()
+
+
+def insert_tuned(conn, user_id):
+    conn.execute(
+        'INSERT INTO documents (title, user_id, text_hash, analysis_hash) VALUES (?, ?, ?, ?)',
+        ('Document', user_id, blob_store.put_blob(conn, ORIGINAL_TEXT), blob_store.put_blob(conn, ANALYSIS_JSON))
+    )
+
+
+def measure(path, users, queries, inserts, tuned):
+    def connection():
+        return storage.get_connection(path) if tuned else sqlite3.connect(path)
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        conn = connection()
+        conn.execute(DASHBOARD_QUERY, (random.randint(1, users),)).fetchall()
+        if not tuned:
+            conn.close()
+    query_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(inserts):
+        conn = connection()
+        if tuned:
+            insert_tuned(conn, random.randint(1, users))
+        else:
+            conn.execute(INSERT_DOCUMENT, ('Document', ORIGINAL_TEXT, ANALYSIS_JSON, random.randint(1, users)))
+        conn.commit()
+        if not tuned:
+            conn.close()
+    insert_seconds = time.perf_counter() - started
+
+    if tuned:
+        storage.close_all()
+    return {
+        'dashboard_queries_per_sec': round(queries / query_seconds, 1),
+        'inserts_per_sec': round(inserts / insert_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--documents', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--inserts', type=int, default=1000)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, tuned in (('baseline', False), ('tuned', True)):
+            random.seed(42)
+            path = os.path.join(tmp, f'{label}.db')
+            build(path, args.users, args.documents, tuned)
+            results[label] = measure(path, args.users, args.queries, args.inserts, tuned)
+
+    print(f"{'mode':<10} {'dashboard q/s':>14} {'inserts/s':>10}")
+    for label, result in results.items():
+        print(f"{label:<10} {result['dashboard_queries_per_sec']:>14} {result['inserts_per_sec']:>10}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# blob_store.py
+"""
+Content-addressed, compressed blob storage in SQLite.
+
+Document text and analysis payloads are stored once per distinct content
+(keyed by SHA-256 of the raw bytes), so identical uploads from different
+users share a row. Payloads are compressed with zstd when the optional
+``zstandard`` package is installed, otherwise with zlib; the codec is
+recorded per blob so both can be read back.
+"""
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Payloads this small are not worth compressing
+MIN_COMPRESS_BYTES = 64
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+
+def encode(data):
+    """Compress raw bytes and return (codec, payload)"""
+    if len(data) < MIN_COMPRESS_BYTES:
+        return 'raw', data
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, ZLIB_LEVEL)
+
+
+def decode(codec, payload):
+    if codec == 'raw':
+        return bytes(payload)
+    if codec == 'zlib':
+        return zlib.decompress(payload)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise Exception("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise Exception(f"Unknown blob codec: {codec}")
+
+
+def put_blob(conn, data):
+    """Store bytes or text (UTF-8) if not already present and return its hash"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    if conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone() is None:
+        codec, payload = encode(data)
+        conn.execute(
+            'INSERT OR IGNORE INTO blobs (hash, codec, raw_size, data) VALUES (?, ?, ?, ?)',
+            (digest, codec, len(data), payload)
+        )
+    return digest
+
+
+def put_json(conn, value):
+    return put_blob(conn, json.dumps(value, ensure_ascii=False, sort_keys=True))
+
+
+def get_blob(conn, digest):
+    row = conn.execute('SELECT codec, data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+    if row is None:
+        raise KeyError(digest)
+    return decode(row[0], row[1])
+
+
+def get_text(conn, digest):
+    return get_blob(conn, digest).decode('utf-8')
+
+
+def get_json(conn, digest):
+    return json.loads(get_blob(conn, digest))
@@ -0,0 +1,180 @@
+# chunking.py
+"""
+Clause-aware splitting of long legal documents for map-reduce analysis.
+
+Documents are cut on section/clause headings and paragraph breaks first,
+then on sentence boundaries, and only as a last resort mid-sentence, so each
+chunk sent to the model holds whole clauses wherever possible.
+
+Which section boundaries become chunk boundaries depends only on the
+sections' own text (content-defined chunking), not on how much text came
+before them. Editing one section therefore changes only the chunk around
+it, and every other chunk hits the per-chunk analysis cache.
+"""
+import hashlib
+import re
+
+# Lines that open a new clause or section, e.g. "12.", "4.2", "(a)", "Section 5",
+# "ARTICLE IV", "Schedule A", "धारा 3", "खंड 2"
+SECTION_HEADING = re.compile(
+    r'^[ \t]*(?:'
+    r'\d+(?:\.\d+)*[.)]?[ \t]+\S'
+    r'|\([a-zA-Z0-9]{1,4}\)[ \t]+\S'
+    r'|(?:section|article|clause|schedule|annexure|appendix|exhibit)[ \t]+[\dA-Za-z]+'
+    r'|(?:SECTION|ARTICLE|CLAUSE|SCHEDULE)\b'
+    r'|(?:धारा|खंड|अनुच्छेद|अनुसूची)[ \t]*[\d०-९]+'
+    r')',
+    re.IGNORECASE | re.MULTILINE
+)
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n')
+# Chunks average about this fraction of max_chars (see _ends_chunk)
+CHUNK_TARGET_FRACTION = 0.5
+SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+')
+
+
+def split_sections(text):
+    """Split text into consecutive sections that concatenate back to the original"""
+    boundaries = {0, len(text)}
+    for match in SECTION_HEADING.finditer(text):
+        boundaries.add(match.start())
+    for match in PARAGRAPH_BREAK.finditer(text):
+        boundaries.add(match.end())
+    points = sorted(boundaries)
+    return [text[start:end] for start, end in zip(points, points[1:]) if start < end]
+
+
+def _split_long(section, max_chars):
+    """Break an oversized section on sentence boundaries, then hard-wrap"""
+    pieces = []
+    current = ''
+    for sentence in _split_keep(section, SENTENCE_END):
+        if len(current) + len(sentence) <= max_chars:
+            current += sentence
+            continue
+        if current:
+            pieces.append(current)
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        current = sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _split_keep(text, pattern):
+    """Split after each match of pattern, keeping the separators attached"""
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(text[last:match.end()])
+        last = match.end()
+    parts.append(text[last:])
+    return [part for part in parts if part]
+
+
+def _ends_chunk(section, max_chars):
+    """
+    Whether a chunk ends after this section. The section's hash decides, with a
+    probability proportional to its length, so chunks hold about
+    CHUNK_TARGET_FRACTION * max_chars characters on average.
+    """
+    digest = hashlib.blake2b(section.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < len(section) / (max_chars * CHUNK_TARGET_FRACTION)
+
+
+def chunk_text(text, max_chars):
+    """
+    Group whole sections into chunks of at most max_chars characters, ending a
+    chunk after the sections chosen by _ends_chunk (or when the next section
+    would not fit). Text that fits in max_chars stays one chunk.
+
+    Returns a list of strings whose concatenation is the original text.
+    """
+    if len(text) <= max_chars:
+        return [text] if text else []
+    chunks = []
+    current = ''
+    for section in split_sections(text):
+        if len(section) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(_split_long(section, max_chars))
+            continue
+        if current and len(current) + len(section) > max_chars:
+            chunks.append(current)
+            current = ''
+        current += section
+        if _ends_chunk(section, max_chars):
+            chunks.append(current)
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_annotations(partial_results):
+    """Concatenate per-chunk annotations in document order, dropping duplicates"""
+    merged = []
+    seen = set()
+    for partial in partial_results:
+        for annotation in partial.get('annotations') or []:
+            if not isinstance(annotation, dict) or not annotation.get('text_to_highlight'):
+                continue
+            key = ' '.join(annotation['text_to_highlight'].split()).lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(annotation)
+    return merged
+
+
+def split_sentences(text, terminators='.!?'):
+    """Split text after each sentence terminator, keeping the punctuation and spacing"""
+    pattern = re.compile('(?<=[' + re.escape(terminators) + r'])\s+')
+    return _split_keep(text, pattern)
+
+
+def _split_bytes(piece, max_bytes):
+    """Break a piece longer than max_bytes (UTF-8) on spaces, then between characters"""
+    if len(piece.encode('utf-8')) <= max_bytes:
+        return [piece]
+    parts = []
+    current = ''
+    for word in re.findall(r'\S+\s*|\s+', piece):
+        if len((current + word).encode('utf-8')) <= max_bytes:
+            current += word
+            continue
+        if current:
+            parts.append(current)
+            current = ''
+        for char in word:
+            if len((current + char).encode('utf-8')) > max_bytes:
+                parts.append(current)
+                current = ''
+            current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack_by_bytes(pieces, max_bytes, first_max_bytes=None):
+    """
+    Group consecutive pieces into segments of at most max_bytes UTF-8 bytes.
+    A smaller first_max_bytes keeps the first segment short so it is ready sooner.
+    """
+    segments = []
+    current = ''
+    limit = first_max_bytes or max_bytes
+    for piece in pieces:
+        # Split against the current limit, so a long first sentence cannot fill the whole first segment
+        for part in _split_bytes(piece, limit):
+            if current and len((current + part).encode('utf-8')) > limit:
+                segments.append(current)
+                current = ''
+                limit = max_bytes
+            current += part
+    if current:
+        segments.append(current)
+    return segments
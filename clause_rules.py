@@ -0,0 +1,229 @@
+# clause_rules.py
+"""
+Rule-based clause detection that runs before (and much faster than) the model.
+
+Each clause category (termination, indemnity, auto-renewal, arbitration,
+penalties, ...) has keyword patterns for English and Hindi. All patterns of
+a language are compiled into one alternation with a named group per
+category, so a document is scanned once. ``detect_clauses`` turns the hits
+into provisional annotations (the sentence around each hit) that the UI can
+show while the model is still working.
+
+``trim_boilerplate`` uses the same index to drop sections that are pure
+boilerplate (signature blocks, counterparts, severability, page numbers)
+from the text sent to the model. A section with any clause hit is kept.
+"""
+import bisect
+import re
+
+from chunking import split_sections
+
+# category -> patterns per language. English patterns only match at the start of a word
+# (see INDEX_PREFIX); Hindi ones are plain substrings because \b is unreliable around
+# Devanagari vowel signs.
+CLAUSE_PATTERNS = {
+    'termination': {
+        'en': [r'terminat(?:e|es|ed|ing|ion)\b', r'notice period\b',
+               r'cancel(?:lation)? (?:of )?(?:this|the) (?:agreement|contract|lease)\b'],
+        'hi': [r'समाप्त', r'समापन', r'रद्द', r'नोटिस अवधि'],
+    },
+    'auto_renewal': {
+        'en': [r'automatic(?:ally)? renew', r'auto[- ]?renew', r'renew(?:s|ed)? automatically\b',
+               r'successive (?:periods|terms)\b'],
+        'hi': [r'स्वतः नवीनीकरण', r'स्वचालित रूप से नवीनीकृत', r'नवीनीकरण'],
+    },
+    'indemnity': {
+        'en': [r'indemni(?:fy|fies|fied|fication|ty)\b', r'hold (?:\w+ )?harmless\b'],
+        'hi': [r'क्षतिपूर्ति', r'हानिरहित'],
+    },
+    'arbitration': {
+        'en': [r'arbitra(?:tion|tor|tors|l|te|ted)\b', r'mediation\b', r'dispute resolution\b'],
+        'hi': [r'मध्यस्थता', r'मध्यस्थ', r'पंचाट', r'विवाद समाधान'],
+    },
+    'penalty': {
+        'en': [r'penalt(?:y|ies)\b', r'liquidated damages\b', r'late (?:fee|fees|charge|charges|payment)\b',
+               r'interest (?:at|of) (?:the rate of )?\d', r'forfeit(?:ed|ure)?\b'],
+        'hi': [r'जुर्माना', r'दंड', r'विलंब शुल्क', r'ब्याज', r'जब्त'],
+    },
+    'liability': {
+        'en': [r'limitation of liability\b', r'shall not be (?:held )?liable\b', r'in no event\b',
+               r'liabilit(?:y|ies) (?:\w+ ){0,4}(?:limited|exceed)'],
+        'hi': [r'दायित्व', r'उत्तरदायी नहीं'],
+    },
+    'confidentiality': {
+        'en': [r'confidential(?:ity)?\b', r'non-disclosure\b'],
+        'hi': [r'गोपनीय'],
+    },
+    'governing_law': {
+        'en': [r'governed by (?:the )?laws?\b', r'governing law\b', r'exclusive jurisdiction\b',
+               r'courts? (?:at|of|in) \w+ shall have jurisdiction\b'],
+        'hi': [r'अधिकार क्षेत्र', r'क्षेत्राधिकार', r'कानूनों द्वारा शासित'],
+    },
+    'deposit': {
+        'en': [r'security deposit\b', r'deposit\b(?:\W+\w+){0,8}\W+refund'],
+        'hi': [r'सुरक्षा जमा', r'जमानत राशि', r'अग्रिम राशि'],
+    },
+    'non_compete': {
+        'en': [r'non-?compet(?:e|ition)\b', r'non-?solicit(?:ation)?\b', r'restrictive covenants?\b'],
+        'hi': [r'प्रतिस्पर्धा'],
+    },
+    'assignment': {
+        'en': [r'sub-?let(?:ting)?\b', r'assign(?:ment)? (?:of )?(?:this|the|its|their|his|her) '
+               r'(?:agreement|lease|rights|obligations)\b', r'shall not assign\b'],
+        'hi': [r'उप-किराए', r'उपकिराए', r'हस्तांतरण'],
+    },
+    'lock_in': {
+        'en': [r'lock-?in period\b', r'minimum (?:term|period) of\b'],
+        'hi': [r'लॉक-इन', r'न्यूनतम अवधि'],
+    },
+}
+
+EXPLANATIONS = {
+    'termination': {
+        'en': 'How and when this agreement can be ended, and what notice is required.',
+        'hi': 'यह समझौता कब और कैसे समाप्त किया जा सकता है, और कितना नोटिस देना होगा।',
+    },
+    'auto_renewal': {
+        'en': 'The agreement may renew by itself unless someone acts before a deadline.',
+        'hi': 'यदि समय सीमा से पहले कार्रवाई न की जाए तो समझौता अपने आप नवीनीकृत हो सकता है।',
+    },
+    'indemnity': {
+        'en': 'One party must cover the other\'s losses or claims; check who carries the risk.',
+        'hi': 'एक पक्ष को दूसरे के नुकसान या दावों की भरपाई करनी होगी; देखें जोखिम किस पर है।',
+    },
+    'arbitration': {
+        'en': 'Disputes go to arbitration or mediation instead of (or before) a court.',
+        'hi': 'विवाद अदालत के बजाय (या उससे पहले) मध्यस्थता में जाएंगे।',
+    },
+    'penalty': {
+        'en': 'Penalties, late fees, interest or forfeiture apply if obligations are not met.',
+        'hi': 'दायित्व पूरे न होने पर जुर्माना, विलंब शुल्क, ब्याज या जब्ती लागू होती है।',
+    },
+    'liability': {
+        'en': 'Limits or excludes a party\'s responsibility for losses.',
+        'hi': 'नुकसान के लिए किसी पक्ष की जिम्मेदारी को सीमित या समाप्त करता है।',
+    },
+    'confidentiality': {
+        'en': 'Information that must be kept confidential, and for how long.',
+        'hi': 'कौन सी जानकारी गोपनीय रखनी है, और कितने समय तक।',
+    },
+    'governing_law': {
+        'en': 'Which law applies and where disputes must be heard.',
+        'hi': 'कौन सा कानून लागू होता है और विवाद कहाँ सुने जाएंगे।',
+    },
+    'deposit': {
+        'en': 'The deposit amount and the conditions for getting it back.',
+        'hi': 'जमा राशि और उसे वापस पाने की शर्तें।',
+    },
+    'non_compete': {
+        'en': 'Restricts working for competitors or soliciting clients or staff.',
+        'hi': 'प्रतिस्पर्धियों के लिए काम करने या ग्राहकों/कर्मचारियों को लुभाने पर रोक।',
+    },
+    'assignment': {
+        'en': 'Whether the agreement or the premises can be transferred or sublet.',
+        'hi': 'क्या समझौता या परिसर किसी और को हस्तांतरित या उप-किराए पर दिया जा सकता है।',
+    },
+    'lock_in': {
+        'en': 'A minimum period during which the agreement cannot be ended without cost.',
+        'hi': 'एक न्यूनतम अवधि जिसमें बिना लागत के समझौता समाप्त नहीं किया जा सकता।',
+    },
+}
+
+# Sections that carry no obligations of their own
+BOILERPLATE_PATTERNS = {
+    'en': [r'\bin witness whereof\b', r'\bcounterparts?\b', r'\bheadings? (?:\w+ ){0,6}(?:convenience|reference)\b',
+           r'\bseverab(?:le|ility)\b', r'^\s*(?:signature|signed|witness(?:es)?|name|date|place)\s*[:_.]',
+           r'^\s*page \d+(?: of \d+)?\s*$', r'\bintentionally left blank\b'],
+    'hi': [r'साक्षी', r'हस्ताक्षर', r'^\s*पृष्ठ [\d०-९]+'],
+}
+
+SENTENCE_STOP = re.compile(r'[.!?।॥\n]')
+MAX_HIGHLIGHT_CHARS = 300
+
+
+# Checked once per position before any alternative is tried, which makes the scan several
+# times faster than letting the regex engine try every pattern everywhere
+INDEX_PREFIX = {'en': r'(?=\w)\b', 'hi': r'(?=[\u0900-\u097F])'}
+
+
+def _compile(language):
+    alternatives = '|'.join(f'(?P<{category}>{"|".join(patterns[language])})'
+                            for category, patterns in CLAUSE_PATTERNS.items() if patterns.get(language))
+    return re.compile(f'{INDEX_PREFIX[language]}(?:{alternatives})', re.IGNORECASE | re.MULTILINE)
+
+
+CLAUSE_INDEX = {language: _compile(language) for language in ('en', 'hi')}
+BOILERPLATE_INDEX = {language: re.compile('|'.join(patterns), re.IGNORECASE | re.MULTILINE)
+                     for language, patterns in BOILERPLATE_PATTERNS.items()}
+
+
+def _indexes(language):
+    # Hindi documents often quote English contract text, so they are scanned with both indexes
+    return [CLAUSE_INDEX['en']] if language != 'hi' else [CLAUSE_INDEX['hi'], CLAUSE_INDEX['en']]
+
+
+def find_matches(text, language='en'):
+    """Yield (category, start, end) for every clause keyword in text"""
+    for index in _indexes(language):
+        for match in index.finditer(text):
+            yield match.lastgroup, match.start(), match.end()
+
+
+def _sentence_bounds(text, stops, start, end):
+    """The sentence (or line) around text[start:end], capped at MAX_HIGHLIGHT_CHARS"""
+    position = bisect.bisect_left(stops, start)
+    left = stops[position - 1] + 1 if position else 0
+    position = bisect.bisect_left(stops, end, position)
+    right = stops[position] + 1 if position < len(stops) else len(text)
+    while left < start and text[left].isspace():
+        left += 1
+    while right > end and text[right - 1].isspace():
+        right -= 1
+    if right - left > MAX_HIGHLIGHT_CHARS:
+        left = max(left, start - MAX_HIGHLIGHT_CHARS // 2)
+        right = min(right, left + MAX_HIGHLIGHT_CHARS)
+    return left, right
+
+
+def detect_clauses(text, language='en'):
+    """
+    Provisional annotations in document order: one per sentence that mentions
+    a known clause type, shaped like the model's annotations plus 'categories',
+    'start' and 'end' offsets and 'provisional': True.
+    """
+    by_sentence = {}
+    stops = [match.start() for match in SENTENCE_STOP.finditer(text)]
+    for category, start, end in find_matches(text, language):
+        bounds = _sentence_bounds(text, stops, start, end)
+        categories = by_sentence.setdefault(bounds, [])
+        if category not in categories:
+            categories.append(category)
+
+    explanation_language = language if language in ('en', 'hi') else 'en'
+    annotations = []
+    for (start, end), categories in sorted(by_sentence.items()):
+        annotations.append({
+            'text_to_highlight': text[start:end],
+            'explanation': ' '.join(EXPLANATIONS[category][explanation_language] for category in categories),
+            'categories': categories,
+            'start': start,
+            'end': end,
+            'provisional': True,
+        })
+    return annotations
+
+
+def trim_boilerplate(text, language='en'):
+    """
+    Drop boilerplate-only sections from text meant for the model.
+    Returns (trimmed_text, removed_chars); sections with a clause hit are always kept.
+    """
+    boilerplate = BOILERPLATE_INDEX.get(language, BOILERPLATE_INDEX['en'])
+    kept = []
+    removed = 0
+    for section in split_sections(text):
+        if boilerplate.search(section) and not any(index.search(section) for index in _indexes(language)):
+            removed += len(section)
+            continue
+        kept.append(section)
+    return ''.join(kept), removed
@@ -0,0 +1,34 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` (Procfile, render.yaml).
+import os
+import threading
+
+# Streaming endpoints (/analyze-stream, /analyze-batch) can run for minutes. A sync worker
+# would be killed by the timeout in the middle of one; gthread workers keep heartbeating while
+# their threads serve requests, so the timeout only catches a hung worker. The threads also
+# let one worker keep serving while others wait on Vertex AI, Vision or TTS.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+
+def on_starting(server):
+    """Drop metrics snapshots left by the previous run so counters start from zero"""
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        import metrics
+        metrics.clear_dir(metrics_dir)
+
+
+def post_fork(server, worker):
+    """Optionally warm up Vertex AI in each worker so the first analysis skips initialization"""
+    if os.getenv('VERTEX_WARM_UP', '').lower() not in ('1', 'true', 'yes'):
+        return
+
+    def _warm_up():
+        import app
+        health = app.warm_up()
+        server.log.info("Vertex AI warm-up in worker %s: %s", worker.pid, health)
+
+    # Run in the background so a slow credential exchange never delays worker boot
+    threading.Thread(target=_warm_up, name='vertex-warm-up', daemon=True).start()
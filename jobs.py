@@ -0,0 +1,270 @@
+# jobs.py
+"""
+Background job queue for document analysis.
+
+A bounded pool of worker threads runs the OCR -> analyze -> persist stages
+outside the request, while the job state lives in the ``jobs`` table so any
+gunicorn worker can answer status polls. ``AsyncJobQueue`` runs the same
+stages as tasks on an event loop for the ASGI server (asgi.py).
+"""
+import asyncio
+import functools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+from ocr import OcrError
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised when the job queue already holds the maximum number of jobs"""
+
+
+class JobError(Exception):
+    """A stage failure with a message that is safe to show to the user"""
+
+
+class JobQueue:
+    """
+    Runs analysis jobs on a bounded thread pool.
+
+    The stages are plain callables so tests can swap in fake Vision/Vertex
+    backends:
+        ocr(uploads) -> OcrResult (text in page order plus per-page timings)
+        analyze(document_text, language, user_id) -> dict
+        persist(analysis_result, user_id, language=language) -> int (the new document id)
+        preview(document_text, language) -> dict, optional; shown in the job details
+        while the analysis runs
+    """
+
+    def __init__(self, db_path, ocr, analyze, persist, preview=None, max_workers=2, max_pending=20,
+                 stale_after=15 * 60):
+        self.db_path = db_path
+        self.ocr = ocr
+        self.analyze = analyze
+        self.persist = persist
+        self.preview = preview
+        self.stale_after = stale_after
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+
+    def _connect(self):
+        return storage.get_connection(self.db_path)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with storage.savepoint(self._connect(), 'jobs') as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def _persist(self, analysis_result, user_id, language):
+        try:
+            return self.persist(analysis_result, user_id, language=language)
+        except Exception:
+            # Drop what a failed persist left pending, so the FAILED update does not commit half a document
+            storage.release(self._connect())
+            raise
+
+    def submit(self, user_id, language, text=None, uploads=None, on_finish=None):
+        """
+        Queue a document for analysis and return the job id.
+
+        Either ``text`` or ``uploads`` (a list of (filename, bytes)) must be given. Raises QueueFull when
+        no slot is free so the caller can answer immediately. ``on_finish`` is called once the job
+        has succeeded or failed.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("Too many documents are being analyzed. Please try again shortly.")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with storage.savepoint(self._connect(), 'jobs') as conn:
+                conn.execute(
+                    'INSERT INTO jobs (id, user_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (job_id, user_id, QUEUED, now, now)
+                )
+            self._executor.submit(self._run, job_id, user_id, language, text, uploads, on_finish)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, user_id, language, text, uploads, on_finish=None):
+        try:
+            details = {}
+            if text is None:
+                self._update(job_id, status=RUNNING, stage='ocr')
+                try:
+                    ocr_result = self.ocr(uploads)
+                except OcrError as e:
+                    raise JobError(str(e))
+                except Exception as e:
+                    print(f"Error during OCR for job {job_id}: {e}")
+                    raise JobError("Failed to process the document")
+                text = ocr_result.text
+                details['ocr'] = ocr_result.summary()
+                self._update(job_id, details=json.dumps(details))
+                if not text:
+                    raise JobError("Could not extract text from the document")
+
+            if self.preview is not None:
+                try:
+                    details['provisional'] = self.preview(text, language)
+                except Exception as e:
+                    print(f"Error building preview for job {job_id}: {e}")  # The analysis still runs
+            self._update(job_id, status=RUNNING, stage='analyze', details=json.dumps(details) if details else None)
+            try:
+                analysis_result = self.analyze(text, language, user_id)
+            except Exception as e:
+                print(f"Error during analysis for job {job_id}: {e}")
+                raise JobError("Failed to analyze document")
+
+            self._update(job_id, stage='persist')
+            try:
+                document_id = self._persist(analysis_result, user_id, language)
+            except Exception as e:
+                print(f"Database error for job {job_id}: {e}")
+                raise JobError("Could not save to database")
+
+            self._update(job_id, status=SUCCEEDED, stage=None, document_id=document_id)
+        except JobError as e:
+            self._update(job_id, status=FAILED, error=str(e))
+        except Exception as e:
+            print(f"Unexpected error in job {job_id}: {e}")
+            self._update(job_id, status=FAILED, error="An unexpected error occurred")
+        finally:
+            self._slots.release()
+            if on_finish is not None:
+                on_finish()
+
+    def get(self, job_id, user_id):
+        """Return the job state as a dict, or None if it does not belong to the user"""
+        row = self._connect().execute(
+            'SELECT id, status, stage, document_id, error, details, updated_at FROM jobs WHERE id = ? AND user_id = ?',
+            (job_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'new_document_id': row['document_id'],
+            'error': row['error'],
+            'details': json.loads(row['details']) if row['details'] else None,
+        }
+        # A job whose worker died (e.g. a gunicorn worker restart) never finishes
+        if job['status'] in (QUEUED, RUNNING) and row['updated_at'] < time.time() - self.stale_after:
+            job['status'] = FAILED
+            job['error'] = "The analysis timed out. Please try again."
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class AsyncJobQueue(JobQueue):
+    """
+    JobQueue for an event loop: each job is a task rather than a pool thread, so
+    hundreds can wait on Vision and Vertex at once. ``ocr`` and ``analyze`` are
+    coroutine functions; ``persist``, ``preview`` and the job table updates block,
+    so they run on ``db_executor``. ``get`` is inherited unchanged.
+    """
+
+    def __init__(self, db_path, ocr, analyze, persist, db_executor, preview=None, max_pending=200,
+                 stale_after=15 * 60):
+        super().__init__(db_path, ocr, analyze, persist, preview=preview, max_workers=1,
+                         max_pending=max_pending, stale_after=stale_after)
+        self.db_executor = db_executor
+        self._tasks = set()  # The loop only keeps weak references to running tasks
+
+    async def _blocking(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.db_executor, functools.partial(function, *args, **kwargs)
+        )
+
+    def _insert(self, job_id, user_id):
+        now = time.time()
+        with storage.savepoint(self._connect(), 'jobs') as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, user_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, user_id, QUEUED, now, now)
+            )
+
+    async def submit_async(self, user_id, language, text=None, uploads=None, on_finish=None):
+        """Coroutine version of submit; on_finish may be a plain callable (it runs on db_executor)"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("Too many documents are being analyzed. Please try again shortly.")
+
+        job_id = uuid.uuid4().hex
+        try:
+            await self._blocking(self._insert, job_id, user_id)
+        except BaseException:
+            self._slots.release()
+            raise
+        task = asyncio.get_running_loop().create_task(
+            self._run_async(job_id, user_id, language, text, uploads, on_finish)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def _run_async(self, job_id, user_id, language, text, uploads, on_finish=None):
+        try:
+            details = {}
+            if text is None:
+                await self._blocking(self._update, job_id, status=RUNNING, stage='ocr')
+                try:
+                    ocr_result = await self.ocr(uploads)
+                except OcrError as e:
+                    raise JobError(str(e))
+                except Exception as e:
+                    print(f"Error during OCR for job {job_id}: {e}")
+                    raise JobError("Failed to process the document")
+                text = ocr_result.text
+                details['ocr'] = ocr_result.summary()
+                await self._blocking(self._update, job_id, details=json.dumps(details))
+                if not text:
+                    raise JobError("Could not extract text from the document")
+
+            if self.preview is not None:
+                try:
+                    details['provisional'] = await self._blocking(self.preview, text, language)
+                except Exception as e:
+                    print(f"Error building preview for job {job_id}: {e}")
+            await self._blocking(self._update, job_id, status=RUNNING, stage='analyze',
+                                 details=json.dumps(details) if details else None)
+            try:
+                analysis_result = await self.analyze(text, language, user_id)
+            except Exception as e:
+                print(f"Error during analysis for job {job_id}: {e}")
+                raise JobError("Failed to analyze document")
+
+            await self._blocking(self._update, job_id, stage='persist')
+            try:
+                document_id = await self._blocking(self._persist, analysis_result, user_id, language)
+            except Exception as e:
+                print(f"Database error for job {job_id}: {e}")
+                raise JobError("Could not save to database")
+
+            await self._blocking(self._update, job_id, status=SUCCEEDED, stage=None, document_id=document_id)
+        except JobError as e:
+            await self._blocking(self._update, job_id, status=FAILED, error=str(e))
+        except Exception as e:
+            print(f"Unexpected error in job {job_id}: {e}")
+            await self._blocking(self._update, job_id, status=FAILED, error="An unexpected error occurred")
+        finally:
+            self._slots.release()
+            if on_finish is not None:
+                await self._blocking(on_finish)
@@ -0,0 +1,131 @@
+# json_stream.py
+"""
+Incremental parser for a JSON object that arrives in pieces.
+
+Model responses are streamed a few tokens at a time. ``IncrementalJsonParser``
+scans only the new characters on each ``feed`` and reports every top-level
+member as soon as its value is complete, and every element of top-level
+arrays (e.g. each annotation) as soon as that element is complete, without
+waiting for the closing brace. Text before the first ``{`` (such as a
+```json fence) and after the object ends is ignored.
+"""
+import json
+
+WHITESPACE = ' \t\r\n'
+
+
+class IncrementalJsonParser:
+    """
+    Feed text with ``feed(chunk)``; it returns a list of events:
+        ('item', key, index, value)  - element index of the top-level array key
+        ('field', key, value)        - a complete top-level member
+    ``done`` is True once the top-level object has closed.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None          # key whose value is being read at depth 1
+        self._key_start = None    # start of a key string at depth 1
+        self._value_start = None  # start of the current top-level value
+        self._array_key = None    # key of the top-level array being read
+        self._item_start = None   # start of the current array element
+        self._item_index = 0
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = []
+        buffer = self.buffer
+        position = self._pos
+        while position < len(buffer) and not self.done:
+            char = buffer[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._string_closed(position, events)
+            elif self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+                self._value_opened(position)
+            elif char in '{[':
+                self._value_opened(position, array=(char == '['))
+                self._depth += 1
+            elif char in '}]':
+                self._scalar_closed(position, events)
+                self._depth -= 1
+                self._container_closed(position, events)
+            elif char == ',':
+                self._scalar_closed(position, events)
+            elif char not in WHITESPACE and char != ':':
+                self._value_opened(position)
+            position += 1
+        self._pos = position
+        return events
+
+    def _value_opened(self, position, array=False):
+        """A string, container or scalar starts at position"""
+        if self._depth == 1:
+            if self._key is None:
+                if self._key_start is None:
+                    self._key_start = position
+            elif self._value_start is None:
+                self._value_start = position
+                if array:
+                    self._array_key = self._key
+                    self._item_index = 0
+        elif self._depth == 2 and self._array_key is not None and self._item_start is None:
+            self._item_start = position
+
+    def _string_closed(self, position, events):
+        if self._depth == 1:
+            if self._key_start is not None:
+                self._key = json.loads(self.buffer[self._key_start:position + 1])
+                self._key_start = None
+            elif self._value_start is not None:
+                self._emit_field(self._value_start, position + 1, events)
+        elif self._depth == 2 and self._item_start is not None and self.buffer[self._item_start] == '"':
+            self._emit_item(self._item_start, position + 1, events)
+
+    def _container_closed(self, position, events):
+        """Called after the depth has been decremented for a closing bracket"""
+        if self._depth == 0:
+            self.done = True
+        elif self._depth == 1 and self._value_start is not None:
+            self._emit_field(self._value_start, position + 1, events)
+            self._array_key = None
+        elif self._depth == 2 and self._item_start is not None:
+            self._emit_item(self._item_start, position + 1, events)
+
+    def _scalar_closed(self, position, events):
+        """A ',' or closing bracket ends a number, true, false or null"""
+        if self._depth == 1 and self._value_start is not None and self.buffer[self._value_start] not in '"{[':
+            self._emit_field(self._value_start, position, events)
+        elif (self._depth == 2 and self._item_start is not None
+              and self.buffer[self._item_start] not in '"{['):
+            self._emit_item(self._item_start, position, events)
+
+    def _emit_field(self, start, end, events):
+        try:
+            events.append(('field', self._key, json.loads(self.buffer[start:end])))
+        except json.JSONDecodeError:
+            pass  # Left for the final parse of the whole response to report
+        self._key = None
+        self._value_start = None
+
+    def _emit_item(self, start, end, events):
+        try:
+            events.append(('item', self._array_key, self._item_index, json.loads(self.buffer[start:end])))
+        except json.JSONDecodeError:
+            pass
+        self._item_index += 1
+        self._item_start = None
@@ -0,0 +1,235 @@
+# metrics.py
+"""
+Per-stage latency metrics, Server-Timing headers and structured logs.
+
+``timed(stage)`` wraps the slow stages (OCR, Vertex AI calls, SQLite reads
+and writes, Text-to-Speech). Each use updates Prometheus histograms and
+counters and, when it runs on a request thread, adds to that request's
+Server-Timing header. ``render()`` produces the Prometheus text format for
+/metrics without needing a client library.
+
+Metrics live in process memory. With several gunicorn workers, set METRICS_DIR:
+each worker then writes a snapshot there (at most once a second, after a
+request) and /metrics adds up the snapshots of every worker.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'legalclarity_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+FLUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_metrics = {}
+_request = threading.local()
+_last_flush = 0.0
+
+
+class _Metric:
+    def __init__(self, kind, name, help_text, labels, buckets=None):
+        self.kind = kind
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.samples = {}  # label values tuple -> count, or [bucket counts..., sum, count]
+        _metrics[self.name] = self
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.samples[label_values] = self.samples.get(label_values, 0) + amount
+
+    def observe(self, value, *label_values):
+        with _lock:
+            sample = self.samples.get(label_values)
+            if sample is None:
+                sample = self.samples[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+
+def counter(name, help_text, labels=()):
+    return _Metric('counter', name, help_text, labels)
+
+
+def gauge(name, help_text, labels=()):
+    """A value that goes up and down (use inc with a negative amount); worker values are summed"""
+    return _Metric('gauge', name, help_text, labels)
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return _Metric('histogram', name, help_text, labels, buckets)
+
+
+STAGE_SECONDS = histogram('stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+STAGE_CALLS = counter('stage_calls_total', 'Calls to each processing stage', ('stage',))
+STAGE_ERRORS = counter('stage_errors_total', 'Failed calls to each processing stage', ('stage',))
+CACHE_LOOKUPS = counter('cache_lookups_total', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result'))
+PROMPT_CHARS = histogram('prompt_chars', 'Size of prompts sent to Vertex AI, in characters', ('language',),
+                         SIZE_BUCKETS)
+REQUEST_SECONDS = histogram('http_request_duration_seconds', 'Time to produce a response (streamed bodies excluded)',
+                            ('method', 'endpoint', 'status'))
+
+
+@contextmanager
+def timed(stage):
+    """Time a block as one call to stage; exceptions are counted as errors and re-raised"""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, failed)
+
+
+def observe_stage(stage, seconds, failed=False):
+    STAGE_SECONDS.observe(seconds, stage)
+    STAGE_CALLS.inc(stage)
+    if failed:
+        STAGE_ERRORS.inc(stage)
+    timings = getattr(_request, 'timings', None)
+    if timings is not None:
+        total, calls = timings.get(stage, (0.0, 0))
+        timings[stage] = (total + seconds, calls + 1)
+
+
+def cache_lookup(cache, hit, count=1):
+    """Record count lookups in a cache (e.g. the pages of an upload)"""
+    if count:
+        CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss', amount=count)
+
+
+def begin_request():
+    """Start collecting stage timings for the request on this thread"""
+    _request.timings = {}
+    _request.started = time.perf_counter()
+
+
+def end_request():
+    """Stop collecting; returns (elapsed seconds, {stage: (seconds, calls)})"""
+    timings = getattr(_request, 'timings', None)
+    started = getattr(_request, 'started', None)
+    _request.timings = _request.started = None
+    if started is None:
+        return None, {}
+    return time.perf_counter() - started, timings
+
+
+def server_timing(elapsed, timings):
+    """Format stage timings as a Server-Timing header value"""
+    entries = []
+    for stage, (seconds, calls) in timings.items():
+        description = f';desc="{calls} calls"' if calls > 1 else ''
+        entries.append(f'{stage};dur={seconds * 1000:.1f}{description}')
+    entries.append(f'app;dur={elapsed * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def log_event(event, **fields):
+    """Write one JSON log line"""
+    record = {'ts': round(time.time(), 3), 'event': event, 'pid': os.getpid()}
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+# --- Exposition ---
+def snapshot():
+    """A JSON-serializable copy of this process's metrics"""
+    with _lock:
+        return {
+            name: {
+                'kind': metric.kind, 'help': metric.help, 'labels': list(metric.labels),
+                'buckets': list(metric.buckets) if metric.buckets else None,
+                'samples': [[list(values), list(sample) if metric.kind == 'histogram' else sample]
+                            for values, sample in metric.samples.items()],
+            }
+            for name, metric in _metrics.items()
+        }
+
+
+def flush(metrics_dir, force=False):
+    """Write this worker's snapshot to metrics_dir, at most once per FLUSH_INTERVAL"""
+    global _last_flush
+    now = time.monotonic()
+    if not metrics_dir or (not force and now - _last_flush < FLUSH_INTERVAL):
+        return
+    _last_flush = now
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"Could not write metrics snapshot: {e}")
+
+
+def clear_dir(metrics_dir):
+    """Remove snapshots left by a previous server run (gunicorn on_starting)"""
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        os.remove(path)
+
+
+def _merge(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for values, sample in metric['samples']:
+                key = tuple(values)
+                if key not in target['samples']:
+                    target['samples'][key] = sample
+                elif metric['kind'] != 'histogram':
+                    target['samples'][key] += sample
+                else:
+                    target['samples'][key] = [a + b for a, b in zip(target['samples'][key], sample)]
+    return merged
+
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(metrics_dir=None):
+    """Prometheus text exposition of this process, or of every worker when metrics_dir is set"""
+    snapshots = [snapshot()]
+    if metrics_dir:
+        flush(metrics_dir, force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # A worker is replacing its file right now
+
+    lines = []
+    for name, metric in sorted(_merge(snapshots).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labels = metric['labels']
+        for values, sample in sorted(metric['samples'].items()):
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_label_text(labels, values)} {sample}")
+                continue
+            for bound, count in zip(metric['buckets'], sample):
+                lines.append(f"{name}_bucket{_label_text(labels, values, ('le', f'{bound:g}'))} {count}")
+            lines.append(f"{name}_bucket{_label_text(labels, values, ('le', '+Inf'))} {sample[-1]}")
+            lines.append(f"{name}_sum{_label_text(labels, values)} {sample[-2]:.6f}")
+            lines.append(f"{name}_count{_label_text(labels, values)} {sample[-1]}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,240 @@
+# migrations.py
+"""
+Versioned database migrations, applied in order by storage.migrate().
+
+Migrations are append-only and must never lose user data: add a new entry
+instead of editing one that has shipped. An entry is either a SQL script or
+a callable taking the connection (for data migrations).
+"""
+import json
+
+import blob_store
+import search_index
+
+INITIAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    title TEXT NOT NULL,
+    original_text TEXT NOT NULL,
+    analysis_json TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+ANALYSIS_CACHE = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    cache_key TEXT PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    language TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    analysis_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used);
+"""
+
+JOBS = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    document_id INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs (user_id);
+"""
+
+DOCUMENT_SPANS = """
+CREATE TABLE IF NOT EXISTS document_spans (
+    document_id INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    annotation_index INTEGER NOT NULL,
+    FOREIGN KEY (document_id) REFERENCES documents (id)
+);
+CREATE INDEX IF NOT EXISTS idx_document_spans_document_id ON document_spans (document_id);
+"""
+
+DOCUMENTS_USER_CREATED_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_documents_user_created ON documents (user_id, created);
+"""
+
+JOB_DETAILS = """
+ALTER TABLE jobs ADD COLUMN details TEXT;
+"""
+
+OCR_CACHE = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    cache_key TEXT PRIMARY KEY,
+    pages_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used);
+"""
+
+ADMISSION_CONTROL = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    bucket TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS admission_leases (
+    id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_admission_leases_scope ON admission_leases (scope, expires_at);
+"""
+
+NEAR_DUPLICATE_INDEX = """
+CREATE TABLE IF NOT EXISTS near_duplicate_signatures (
+    document_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    language TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS near_duplicate_bands (
+    band_key INTEGER NOT NULL,
+    document_id INTEGER NOT NULL,
+    PRIMARY KEY (band_key, document_id)
+) WITHOUT ROWID;
+"""
+
+
+def move_documents_to_blobs(conn):
+    """
+    Slim the documents table down to metadata. Original text and analysis
+    payloads move to the compressed, content-addressed blobs table; the
+    copy of original_text that used to sit inside analysis_json is dropped.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            raw_size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE documents_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            title TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            text_hash TEXT NOT NULL,
+            analysis_hash TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (text_hash) REFERENCES blobs (hash),
+            FOREIGN KEY (analysis_hash) REFERENCES blobs (hash)
+        )
+    """)
+
+    rows = conn.execute('SELECT id, created, title, user_id, original_text, analysis_json FROM documents ORDER BY id')
+    while True:
+        batch = rows.fetchmany(500)
+        if not batch:
+            break
+        for doc_id, created, title, user_id, original_text, analysis_json in batch:
+            analysis = json.loads(analysis_json)
+            analysis.pop('original_text', None)
+            conn.execute(
+                'INSERT INTO documents_new (id, created, title, user_id, text_hash, analysis_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (doc_id, created, title, user_id,
+                 blob_store.put_blob(conn, original_text), blob_store.put_json(conn, analysis))
+            )
+
+    conn.execute('DROP TABLE documents')
+    conn.execute('ALTER TABLE documents_new RENAME TO documents')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_user_created ON documents (user_id, created)')
+
+
+move_documents_to_blobs.rebuilds_tables = True
+
+
+def create_search_index(conn, tokenize='unicode61'):
+    """Create the contentless FTS5 search index and fill it from existing documents"""
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts "
+        f"USING fts5(owner, title, summary, body, content='', detail='column', tokenize=\"{tokenize}\")"
+    )
+    rows = conn.execute('SELECT id, user_id, title, text_hash, analysis_hash FROM documents ORDER BY id')
+    while True:
+        batch = rows.fetchmany(500)
+        if not batch:
+            break
+        for doc_id, user_id, title, text_hash, analysis_hash in batch:
+            search_index.index_document(
+                conn, doc_id, user_id, title,
+                blob_store.get_json(conn, analysis_hash).get('summary', ''),
+                blob_store.get_text(conn, text_hash)
+            )
+
+
+def add_document_languages(conn):
+    """
+    Record the language each document was analyzed in, and add the table of
+    per-language variants of its analysis. The language of existing documents
+    was never stored; Hindi summaries are written in Devanagari.
+    """
+    conn.execute('ALTER TABLE documents ADD COLUMN language TEXT')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS document_variants (
+            document_id INTEGER NOT NULL,
+            language TEXT NOT NULL,
+            analysis_hash TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (document_id, language),
+            FOREIGN KEY (document_id) REFERENCES documents (id),
+            FOREIGN KEY (analysis_hash) REFERENCES blobs (hash)
+        ) WITHOUT ROWID
+    """)
+    rows = conn.execute('SELECT id, analysis_hash FROM documents ORDER BY id').fetchall()
+    for doc_id, analysis_hash in rows:
+        summary = blob_store.get_json(conn, analysis_hash).get('summary') or ''
+        language = 'hi' if any('\u0900' <= char <= '\u097f' for char in summary) else 'en'
+        conn.execute('UPDATE documents SET language = ? WHERE id = ?', (language, doc_id))
+
+
+def rebuild_search_index(conn):
+    """
+    Rebuild the search index with search_index.TOKENIZE, which keeps combining
+    marks inside words. The contentless table cannot be re-tokenized in place.
+    """
+    conn.execute('DROP TABLE IF EXISTS documents_fts')
+    create_search_index(conn, search_index.TOKENIZE)
+
+
+# (version, name, SQL script or callable)
+MIGRATIONS = [
+    (1, 'initial_schema', INITIAL_SCHEMA),
+    (2, 'analysis_cache', ANALYSIS_CACHE),
+    (3, 'jobs', JOBS),
+    (4, 'document_spans', DOCUMENT_SPANS),
+    (5, 'documents_user_created_index', DOCUMENTS_USER_CREATED_INDEX),
+    (6, 'documents_blobs', move_documents_to_blobs),
+    (7, 'documents_search_index', create_search_index),
+    (8, 'job_details', JOB_DETAILS),
+    (9, 'ocr_cache', OCR_CACHE),
+    (10, 'admission_control', ADMISSION_CONTROL),
+    (11, 'near_duplicate_index', NEAR_DUPLICATE_INDEX),
+    (12, 'document_languages', add_document_languages),
+    (13, 'search_index_combining_marks', rebuild_search_index),
+]
@@ -0,0 +1,110 @@
+# model_registry.py
+"""
+Process-wide registry of Vertex AI model handles.
+
+Credentials are parsed and ``aiplatform.init`` is called once per worker
+process; GenerativeModel instances are built once per model name and reused
+across requests. Tests can install a fake with ``set_model_registry``.
+"""
+import threading
+import time
+
+from service_clients import load_service_account_credentials
+
+
+class ModelRegistry:
+    """
+    Lazily initializes Vertex AI and hands out shared GenerativeModel objects.
+
+    ``language_models`` maps a language code to a model name; languages
+    without an entry use ``default_model``.
+    """
+
+    def __init__(self, project_id, location, default_model, language_models=None):
+        self.project_id = project_id
+        self.location = location
+        self.default_model = default_model
+        self.language_models = dict(language_models or {})
+        self._lock = threading.Lock()
+        self._model_class = None
+        self._models = {}
+        self._init_seconds = None
+        self._last_error = None
+
+    def model_name_for(self, language='en'):
+        return self.language_models.get(language, self.default_model)
+
+    def _initialize(self):
+        if self._model_class is not None:
+            return self._model_class
+        with self._lock:
+            if self._model_class is not None:
+                return self._model_class
+            started = time.perf_counter()
+            try:
+                from google.cloud import aiplatform
+                from vertexai.preview.generative_models import GenerativeModel
+            except ImportError:
+                self._last_error = "Google Cloud AI Platform not installed"
+                raise Exception("Google Cloud AI Platform not installed. Run: pip install google-cloud-aiplatform")
+
+            try:
+                credentials = load_service_account_credentials()
+                if credentials is not None:
+                    aiplatform.init(project=self.project_id, location=self.location, credentials=credentials)
+                else:
+                    # Fall back to default credentials
+                    aiplatform.init(project=self.project_id, location=self.location)
+            except Exception as e:
+                self._last_error = str(e)
+                raise Exception(f"Failed to initialize Vertex AI. Check GCP_PROJECT_ID: {str(e)}")
+
+            self._init_seconds = time.perf_counter() - started
+            self._last_error = None
+            self._model_class = GenerativeModel
+            return GenerativeModel
+
+    def get_model(self, language='en'):
+        """Return the shared model handle for a language, creating it on first use"""
+        model_name = self.model_name_for(language)
+        model = self._models.get(model_name)
+        if model is None:
+            model_class = self._initialize()
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = model_class(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def warm_up(self, languages=('en',)):
+        """Initialize credentials and build the model handles ahead of the first request"""
+        for language in languages:
+            try:
+                self.get_model(language)
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"Vertex AI warm-up failed for '{language}': {e}")
+        return self.health()
+
+    def health(self):
+        return {
+            'initialized': self._model_class is not None,
+            'models': sorted(self._models),
+            'init_seconds': self._init_seconds,
+            'error': self._last_error,
+        }
+
+
+_registry = None
+
+
+def get_model_registry():
+    return _registry
+
+
+def set_model_registry(registry):
+    """Install the registry used by the app (e.g. a local fake in tests)"""
+    global _registry
+    _registry = registry
+    return registry
@@ -0,0 +1,183 @@
+# near_duplicates.py
+"""
+Near-duplicate detection for documents built from the same template.
+
+Every saved document gets a MinHash signature of its word 5-shingles. The
+signature is cut into LSH bands and each band is stored as one row keyed by
+its hash, so finding candidates for a new document is a handful of index
+lookups no matter how many documents are stored. Candidates are then
+checked with the exact shingle Jaccard similarity of the two texts.
+
+``changed_sections`` locates the sections of the new text that do not
+occur in the earlier one; only those need to go to the model.
+
+The index costs ``num_perm * 4`` bytes of signature plus ``bands`` small
+rows per document, and keeps at most ``max_documents`` documents (the
+oldest are dropped first). numpy is used for the signatures when it is
+installed; the pure Python fallback computes the same values.
+"""
+import hashlib
+import random
+import re
+import zlib
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from analysis_cache import normalize_text
+from chunking import split_sections
+
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = (1 << 61) - 1
+MASK_64 = (1 << 64) - 1
+MASK_32 = (1 << 32) - 1
+# Trim the index back to max_documents once every this many inserts
+EVICT_EVERY = 100
+# Signatures only estimate similarity (about +-0.06 with 64 permutations), so candidates
+# somewhat below the threshold are kept for the exact check
+ESTIMATE_MARGIN = 0.1
+
+WORD = re.compile(r'\w+')
+
+
+def shingles(text):
+    """crc32 hashes of the overlapping SHINGLE_WORDS-word sequences of text"""
+    words = WORD.findall(normalize_text(text).lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))} if words else set()
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode('utf-8'))
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures with num_perm hash functions, banded for LSH"""
+
+    def __init__(self, num_perm=64, bands=16, seed=1):
+        if num_perm % bands:
+            raise Exception("NEAR_DUPLICATE_NUM_PERM must be a multiple of NEAR_DUPLICATE_BANDS")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self.a = [rng.randrange(1, MERSENNE_PRIME) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, MERSENNE_PRIME) for _ in range(num_perm)]
+        # Band keys of different settings never collide, so changing them only orphans old rows
+        self._tag = f'{num_perm}:{bands}:{seed}:'.encode()
+
+    def signature(self, shingle_hashes):
+        """array('I') of num_perm minimum hash values (uint64 arithmetic wraps, as in numpy)"""
+        if not shingle_hashes:
+            return array('I', [MASK_32] * self.num_perm)
+        if numpy is not None:
+            values = numpy.fromiter(shingle_hashes, dtype=numpy.uint64, count=len(shingle_hashes))
+            a = numpy.array(self.a, dtype=numpy.uint64)[:, None]
+            b = numpy.array(self.b, dtype=numpy.uint64)[:, None]
+            with numpy.errstate(over='ignore'):
+                hashed = (a * values + b) % numpy.uint64(MERSENNE_PRIME) & numpy.uint64(MASK_32)
+            return array('I', hashed.min(axis=1).astype(numpy.uint32).tobytes())
+        return array('I', [
+            min(((a * value + b) & MASK_64) % MERSENNE_PRIME & MASK_32 for value in shingle_hashes)
+            for a, b in zip(self.a, self.b)
+        ])
+
+    def band_keys(self, signature):
+        """One signed 64-bit key per band (SQLite INTEGER)"""
+        raw = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [
+            int.from_bytes(hashlib.blake2b(self._tag + bytes([band]) + raw[band * width:(band + 1) * width],
+                                           digest_size=8).digest(), 'big', signed=True)
+            for band in range(self.bands)
+        ]
+
+
+def estimate(signature_a, signature_b):
+    """Estimated Jaccard similarity: the share of equal signature values"""
+    if len(signature_a) != len(signature_b):
+        return 0.0
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index in the near_duplicate_signatures and near_duplicate_bands tables.
+    add() is called in the same transaction as the document insert.
+    """
+
+    def __init__(self, hasher, threshold=0.7, max_documents=50000, max_candidates=20):
+        self.hasher = hasher
+        self.threshold = threshold
+        self.max_documents = max_documents
+        self.max_candidates = max_candidates
+
+    def add(self, conn, document_id, user_id, language, text):
+        signature = self.hasher.signature(shingles(text))
+        conn.execute(
+            'INSERT OR REPLACE INTO near_duplicate_signatures (document_id, user_id, language, signature) '
+            'VALUES (?, ?, ?, ?)',
+            (document_id, user_id, language, signature.tobytes())
+        )
+        conn.executemany(
+            'INSERT OR IGNORE INTO near_duplicate_bands (band_key, document_id) VALUES (?, ?)',
+            [(key, document_id) for key in self.hasher.band_keys(signature)]
+        )
+        if document_id % EVICT_EVERY == 0:
+            self.evict(conn)
+
+    def evict(self, conn):
+        """Drop the oldest documents beyond max_documents"""
+        row = conn.execute(
+            'SELECT document_id FROM near_duplicate_signatures ORDER BY document_id DESC LIMIT 1 OFFSET ?',
+            (self.max_documents,)
+        ).fetchone()
+        if row is not None:
+            conn.execute('DELETE FROM near_duplicate_signatures WHERE document_id <= ?', (row[0],))
+            conn.execute('DELETE FROM near_duplicate_bands WHERE document_id <= ?', (row[0],))
+
+    def candidates(self, conn, text, language, user_id=None):
+        """
+        (document_id, estimated similarity) of indexed documents sharing at least one band
+        with text, best first, roughly above the threshold. user_id=None searches every user's documents.
+        """
+        signature = self.hasher.signature(shingles(text))
+        keys = self.hasher.band_keys(signature)
+        query = (
+            'SELECT s.document_id, s.signature FROM near_duplicate_signatures s '
+            'WHERE s.language = ? AND s.document_id IN '
+            f'(SELECT document_id FROM near_duplicate_bands WHERE band_key IN ({",".join("?" * len(keys))}))'
+        )
+        params = [language, *keys]
+        if user_id is not None:
+            query += ' AND s.user_id = ?'
+            params.append(user_id)
+        query += ' ORDER BY s.document_id DESC LIMIT ?'
+        params.append(self.max_candidates)
+
+        scored = []
+        for document_id, stored in conn.execute(query, params):
+            similarity = estimate(signature, array('I', bytes(stored)))
+            if similarity >= self.threshold - ESTIMATE_MARGIN:
+                scored.append((document_id, similarity))
+        return sorted(scored, key=lambda candidate: -candidate[1])
+
+
+def changed_sections(previous_text, text):
+    """(start, end) offsets of the sections of text whose normalized content does not occur in previous_text"""
+    previous = {normalize_text(section) for section in split_sections(previous_text)}
+    spans = []
+    position = 0
+    for section in split_sections(text):
+        normalized = normalize_text(section)
+        if normalized and normalized not in previous:
+            spans.append((position, position + len(section)))
+        position += len(section)
+    return spans
@@ -0,0 +1,90 @@
+# ocr_cache.py
+"""
+Persistent cache of OCR results.
+
+Entries map a content key to the text of each page of an upload. An image
+is stored under two keys: the SHA-256 of the uploaded bytes and the hash
+of its normalized pixels (see ocr.prepare_image), so a re-upload of the
+same scan is found either way, even when it was re-saved in another format
+or with different metadata.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import storage
+
+
+class OcrCache:
+    """
+    SQLite-backed OCR cache with TTL and size-based eviction.
+
+    Like the analysis cache, failures are logged and treated as misses.
+    """
+
+    def __init__(self, db_path, ttl_seconds=90 * 24 * 3600, max_entries=20000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return storage.get_connection(self.db_path)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, *keys):
+        """Return the cached page texts for the first key found, or None"""
+        keys = [key for key in keys if key]
+        now = time.time()
+        row = None
+        try:
+            with storage.savepoint(self._connect(), 'ocr_cache') as conn:
+                for key in keys:
+                    row = conn.execute(
+                        'SELECT pages_json FROM ocr_cache WHERE cache_key = ? AND created_at >= ?',
+                        (key, now - self.ttl_seconds)
+                    ).fetchone()
+                    if row:
+                        conn.execute(
+                            'UPDATE ocr_cache SET last_used = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                            (now, key)
+                        )
+                        break
+        except sqlite3.Error as e:
+            print(f"OCR cache lookup failed: {e}")
+            row = None
+
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(row[0])
+
+    def put(self, keys, pages):
+        """Store the page texts of one upload under each of its keys"""
+        payload = json.dumps(pages, ensure_ascii=False)
+        now = time.time()
+        try:
+            with storage.savepoint(self._connect(), 'ocr_cache') as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO ocr_cache (cache_key, pages_json, created_at, last_used, hit_count) '
+                    'VALUES (?, ?, ?, ?, 0)',
+                    [(key, payload, now, now) for key in keys if key]
+                )
+                conn.execute('DELETE FROM ocr_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+                conn.execute(
+                    'DELETE FROM ocr_cache WHERE cache_key IN ('
+                    'SELECT cache_key FROM ocr_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"OCR cache store failed: {e}")
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
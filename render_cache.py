@@ -0,0 +1,74 @@
+# render_cache.py
+"""
+In-memory cache for rendered pages that never change once produced.
+
+A saved analysis is immutable, so its results page only depends on the
+document, the session language and the templates. Pages are kept per worker
+process, capped in bytes and evicted least-recently-used first. Each entry
+remembers the user it was rendered for and a strong ETag (the hash of the
+exact bytes served), so a hit needs neither SQLite nor Jinja, and a browser
+revalidating with If-None-Match gets a 304 without a body.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+RenderedPage = namedtuple('RenderedPage', 'user_id etag body')
+
+
+def template_version(template_dir, names, *extra):
+    """Hash of the template sources (and anything else rendered into the page, e.g. translations)"""
+    digest = hashlib.sha256()
+    for name in names:
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            digest.update(f.read())
+    for value in extra:
+        digest.update(repr(value).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def page_etag(body):
+    """Strong validator for a rendered page: it changes whenever any byte does"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class RenderCache:
+    """LRU map of key -> RenderedPage, bounded by the total size of the bodies"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, user_id, body):
+        """Store a rendered body and return its RenderedPage (stored only if it fits)"""
+        page = RenderedPage(user_id, page_etag(body), body)
+        if len(body) > self.max_bytes:
+            return page
+        with self._lock:
+            previous = self._pages.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous.body)
+            self._pages[key] = page
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.bytes -= len(evicted.body)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._pages)
@@ -0,0 +1,331 @@
+# response_parsing.py
+"""
+Turning model responses into the JSON objects the prompts ask for.
+
+Every prompt has a declared response schema (the OpenAPI subset Vertex AI's
+``response_schema`` takes). ``parse`` accepts what the model actually sends:
+it skips ```json fences and prose around the object, and when that is not
+valid JSON a repair pass drops trailing commas and closes a truncated
+response after its last complete element. The result is then checked
+against the schema: a missing required field is an error, malformed optional
+fields and array items are dropped.
+
+When no repair works, ``follow_up_prompt`` asks the model to rewrite only
+the broken tail of its answer, which costs a fraction of re-running the
+prompt. ``parse_with_follow_up`` ties the two together and counts the
+outcome (ok, repaired, reasked or failed) in model_responses_total.
+"""
+import json
+import re
+
+import metrics
+
+STRING = {'type': 'string'}
+ANNOTATIONS = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {'text_to_highlight': STRING, 'explanation': STRING},
+        'required': ['text_to_highlight', 'explanation'],
+    },
+}
+# Whole-document analysis (analysis_prompt)
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {'title': STRING, 'summary': STRING, 'annotations': ANNOTATIONS},
+    'required': ['title', 'summary'],
+}
+# One section of a long document (chunk_prompt)
+SECTION_SCHEMA = {
+    'type': 'object',
+    'properties': {'summary': STRING, 'annotations': ANNOTATIONS},
+    'required': ['summary'],
+}
+# Title and summary only (reduce_prompt, revise_prompt)
+SUMMARY_SCHEMA = {
+    'type': 'object',
+    'properties': {'title': STRING, 'summary': STRING},
+    'required': ['title', 'summary'],
+}
+# Translated analysis fields (translation_prompt)
+TRANSLATION_SCHEMA = {
+    'type': 'object',
+    'properties': {'title': STRING, 'summary': STRING, 'explanations': {'type': 'array', 'items': STRING}},
+    'required': ['explanations'],
+}
+
+# Truncation candidates tried (from the end) before giving up
+MAX_REPAIR_ATTEMPTS = 25
+# How much of the valid part the follow-up prompt shows for context
+FOLLOW_UP_CONTEXT_CHARS = 300
+FOLLOW_UP_MAX_TAIL_CHARS = 4000
+
+RESPONSES = metrics.counter('model_responses_total',
+                            'Model JSON responses by outcome (ok, repaired, reasked, failed)', ('outcome',))
+
+FENCE = re.compile(r'^\s*```[a-zA-Z]*\s*')
+
+
+class SchemaError(ValueError):
+    """A parsed value that does not have the declared shape"""
+
+
+class ResponseParseError(json.JSONDecodeError):
+    """
+    A response that could not be parsed or repaired. ``head`` is the response up
+    to its last complete element before the error (None if there is none), which
+    a follow-up can continue from. ``salvage`` is what cutting the response back
+    to ``head`` gives, when that matches the schema: a complete response broken in
+    the middle loses everything after the error that way, so it is only used when
+    no follow-up fixes the response.
+    """
+
+    def __init__(self, msg, doc, pos, head=None, salvage=None):
+        super().__init__(msg, doc, pos)
+        self.head = head
+        self.salvage = salvage
+
+
+def conform(value, schema):
+    """value checked against schema, with malformed optional parts dropped; raises SchemaError"""
+    kind = schema.get('type')
+    if kind == 'string':
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise SchemaError(f"expected a string, got {type(value).__name__}")
+    if kind == 'array':
+        if not isinstance(value, list):
+            raise SchemaError(f"expected an array, got {type(value).__name__}")
+        items = []
+        for item in value:
+            try:
+                items.append(conform(item, schema.get('items', {})))
+            except SchemaError:
+                continue
+        return items
+    if kind == 'object':
+        if not isinstance(value, dict):
+            raise SchemaError(f"expected an object, got {type(value).__name__}")
+        result = dict(value)
+        for name, property_schema in schema.get('properties', {}).items():
+            if name not in result:
+                continue
+            try:
+                result[name] = conform(result[name], property_schema)
+            except SchemaError as e:
+                if name in schema.get('required', ()):
+                    raise SchemaError(f"{name}: {e}")
+                del result[name]
+        missing = [name for name in schema.get('required', ()) if name not in result]
+        if missing:
+            raise SchemaError(f"missing {', '.join(missing)}")
+        return result
+    return value
+
+
+def _scan(text, start):
+    """
+    One pass over text from the opening brace at start. Returns (cleaned JSON with
+    trailing commas removed, cut points, open containers at the end, still inside a
+    string). A cut point (out_length, text_index, closers) marks where the output can
+    be cut after a complete element and closed with closers.
+    """
+    out = []
+    cuts = []
+    stack = []
+    in_string = escaped = False
+    pending_comma = None  # (out_length, text_index) of a comma that may be trailing
+    index = start
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in ' \t\r\n':
+            out.append(char)
+            continue
+        if pending_comma is not None:
+            if char not in '}]':
+                out.insert(pending_comma[0], ',')
+            pending_comma = None
+        if char == ',':
+            closers = ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+            cuts.append((len(out), index, closers))
+            pending_comma = (len(out), index)
+            continue
+        out.append(char)
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append(char)
+            closers = ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+            cuts.append((len(out), index + 1, closers))
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return ''.join(out), cuts, stack, False  # The object is complete; the rest is prose
+            closers = ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+            cuts.append((len(out), index + 1, closers))
+    return ''.join(out), cuts, stack, in_string
+
+
+def _loads(candidate, schema):
+    value = json.loads(candidate, strict=False)  # Models often put raw newlines inside strings
+    return conform(value, schema) if schema else value
+
+
+def parse(text, schema=None, complete=False):
+    """
+    The JSON object in a model response, checked against schema. With complete,
+    a truncated response is an error (with a salvage) rather than repaired.
+    Returns (value, repaired); raises ResponseParseError.
+    """
+    text = FENCE.sub('', text or '', count=1)
+    start = text.find('{')
+    if start < 0:
+        raise ResponseParseError("No JSON object in the response", text, 0)
+
+    try:
+        value, _ = json.JSONDecoder(strict=False).raw_decode(text, start)
+        return (conform(value, schema) if schema else value), False
+    except SchemaError as e:
+        raise ResponseParseError(f"Response does not match the schema: {e}", text, start)
+    except json.JSONDecodeError as e:
+        first_error = e
+
+    cleaned, cuts, stack, in_string = _scan(text, start)
+    truncated = bool(stack)
+    error_pos = len(cleaned)
+    if not truncated:
+        # Complete object: trailing commas are the only thing left to fix without losing content
+        try:
+            return _loads(cleaned, schema), True
+        except SchemaError as e:
+            raise ResponseParseError(f"Response does not match the schema: {e}", text, start)
+        except json.JSONDecodeError as e:
+            error_pos = e.pos
+
+    # Cut after the last complete element before the error, then close what is open
+    usable = [cut for cut in cuts if cut[0] <= error_pos]
+    candidates = [cleaned[:out_length].rstrip().rstrip(',') + closers
+                  for out_length, _, closers in reversed(usable[-MAX_REPAIR_ATTEMPTS:])]
+    if truncated and in_string:
+        # Keep a truncated last string (e.g. the summary) rather than dropping the field
+        closers = ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+        candidates.append(cleaned.rstrip('\\') + '"' + closers)
+
+    value = schema_error = None
+    for candidate in candidates:
+        try:
+            value = _loads(candidate, schema)
+            break
+        except json.JSONDecodeError:
+            continue
+        except SchemaError as e:
+            schema_error = schema_error or e
+            continue
+    if value is not None and truncated and not complete:
+        return value, True
+
+    head = text[start:usable[-1][1]] if usable else None
+    message = f"Unrepairable JSON response: {first_error.msg}"
+    if schema_error is not None and value is None:
+        message += f" (best repair: {schema_error})"
+    raise ResponseParseError(message, text, first_error.pos, head=head, salvage=value)
+
+
+def follow_up_prompt(error, language='en'):
+    """Prompt asking the model to rewrite only the part of its response after error.head"""
+    context = error.head[-FOLLOW_UP_CONTEXT_CHARS:]
+    tail = error.doc[error.doc.find('{') + len(error.head):][:FOLLOW_UP_MAX_TAIL_CHARS]
+    prompt_templates = {
+        'en': f"""Your previous answer was valid JSON up to a point and was then cut off or malformed.
+
+The valid part ends with:
+{context}
+
+The broken remainder is:
+{tail}
+
+Reply with only the text that replaces the broken remainder, so that the valid part followed by your reply is one complete, valid JSON object:""",
+        'hi': f"""आपका पिछला उत्तर एक बिंदु तक वैध JSON था, फिर वह अधूरा या गलत हो गया।
+
+वैध भाग इस पर समाप्त होता है:
+{context}
+
+टूटा हुआ शेष भाग:
+{tail}
+
+केवल वह टेक्स्ट लौटाएँ जो टूटे हुए शेष भाग की जगह ले, ताकि वैध भाग और आपका उत्तर मिलकर एक पूर्ण, वैध JSON ऑब्जेक्ट बनें:"""
+    }
+    return prompt_templates.get(language, prompt_templates['en'])
+
+
+def _continued(error, reply):
+    # The reply may come fenced; only its JSON text continues the head
+    reply = FENCE.sub('', reply or '', count=1)
+    if reply.rstrip().endswith('```'):
+        reply = reply.rstrip()[:-3]
+    return error.head + reply
+
+
+def parse_with_follow_up(text, schema, ask, language='en', follow_ups=1):
+    """
+    parse, then up to follow_ups calls of ask(prompt) -> response text that rewrite
+    the broken tail, then the salvaged part of the response. Returns the value;
+    raises ResponseParseError.
+    """
+    try:
+        value, repaired = parse(text, schema)
+    except ResponseParseError as error:
+        for _ in range(follow_ups):
+            if error.head is None:
+                break
+            try:
+                value, _ = parse(_continued(error, ask(follow_up_prompt(error, language))), schema, complete=True)
+            except ResponseParseError as e:
+                error = e
+                continue
+            RESPONSES.inc('reasked')
+            return value
+        if error.salvage is not None:
+            RESPONSES.inc('repaired')
+            return error.salvage
+        RESPONSES.inc('failed')
+        raise error
+    RESPONSES.inc('repaired' if repaired else 'ok')
+    return value
+
+
+async def parse_with_follow_up_async(text, schema, ask, language='en', follow_ups=1):
+    """parse_with_follow_up for a coroutine ask"""
+    try:
+        value, repaired = parse(text, schema)
+    except ResponseParseError as error:
+        for _ in range(follow_ups):
+            if error.head is None:
+                break
+            try:
+                value, _ = parse(_continued(error, await ask(follow_up_prompt(error, language))), schema,
+                                 complete=True)
+            except ResponseParseError as e:
+                error = e
+                continue
+            RESPONSES.inc('reasked')
+            return value
+        if error.salvage is not None:
+            RESPONSES.inc('repaired')
+            return error.salvage
+        RESPONSES.inc('failed')
+        raise error
+    RESPONSES.inc('repaired' if repaired else 'ok')
+    return value
@@ -0,0 +1,154 @@
+# search_index.py
+"""
+Full-text search over a user's past analyses.
+
+Documents are indexed in a contentless SQLite FTS5 table (rowid = document
+id) over title, summary and original text, so the text is not stored a
+second time uncompressed. Only column-level detail is kept: ranking and
+column filters work, phrase queries do not, and the index is about half
+the size. The owner is indexed as a token too, which lets FTS5 intersect a
+user's documents with the query terms instead of ranking every match in
+the database. Snippets are cut in Python from the blobs of the page of
+results being returned.
+
+Words are letters, numbers and combining marks, both in the FTS5 tokenizer
+and in the query and snippet patterns here, so Devanagari words keep their
+vowel signs (matras) and viramas instead of breaking into single consonants.
+"""
+import re
+import unicodedata
+
+from markupsafe import Markup, escape
+
+import blob_store
+
+SNIPPET_CHARS = 160
+MAX_QUERY_TERMS = 8
+
+# unicode61 splits on combining marks by default, which cuts Hindi words apart
+TOKENIZE = "unicode61 categories 'L* N* Co M*'"
+
+
+def _mark_ranges():
+    """
+    Regex class ranges of the combining marks (M*) and private use characters (Co)
+    that TOKENIZE keeps in words. Marks only occur in planes 0 and 1 and among
+    the variation selectors; the private use planes 15 and 16 are added whole.
+    """
+    ranges = []
+    for code in (*range(0x20000), *range(0xE0000, 0xE1000)):
+        category = unicodedata.category(chr(code))
+        if category[0] == 'M' or category == 'Co':
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    ranges += [[0xF0000, 0xFFFFD], [0x100000, 0x10FFFD]]
+    return ''.join(f'{re.escape(chr(first))}-{re.escape(chr(last))}' for first, last in ranges)
+
+
+# One word character, as TOKENIZE sees it: a letter or number (\w without '_', which
+# unicode61 splits on) or a mark. Both alternatives are one character wide, so it
+# also works in lookbehinds.
+WORD_CHAR = f'(?:[^\\W_]|[{_mark_ranges()}])'
+WORD = re.compile(f'{WORD_CHAR}+')
+
+# owner and title/summary/body column weights for bm25()
+RANK = 'bm25(documents_fts, 0.0, 10.0, 4.0, 1.0)'
+
+
+def owner_token(user_id):
+    return f"u{int(user_id)}"
+
+
+def index_document(conn, doc_id, user_id, title, summary, text):
+    """Add a document to the search index (call in the same transaction as the insert)"""
+    conn.execute(
+        'INSERT INTO documents_fts (rowid, owner, title, summary, body) VALUES (?, ?, ?, ?, ?)',
+        (doc_id, owner_token(user_id), title or '', summary or '', text or '')
+    )
+
+
+def query_terms(query):
+    """Words of a free-text query, lower-cased and deduplicated"""
+    terms = []
+    for term in WORD.findall((query or '').lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def match_expression(user_id, terms):
+    """
+    FTS5 MATCH expression for a user's documents containing every term.
+    Terms are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    quoted = ' '.join(f'"{term}"' for term in terms)
+    return f'owner : "{owner_token(user_id)}" AND {{title summary body}} : ({quoted})'
+
+
+def term_pattern(terms):
+    """Whole-word matches of any term (\\b would end a word at its first vowel sign)"""
+    return re.compile('|'.join(f'(?<!{WORD_CHAR}){re.escape(term)}(?!{WORD_CHAR})' for term in terms),
+                      re.IGNORECASE)
+
+
+def make_snippet(text, pattern, width=SNIPPET_CHARS):
+    """
+    HTML-safe excerpt of text around the first match of pattern, with every
+    match wrapped in <mark>. Returns None when nothing in text matches.
+    """
+    first = pattern.search(text or '')
+    if first is None:
+        return None
+    start = max(0, first.start() - width // 3)
+    end = min(len(text), start + width)
+    if start:
+        # Don't start mid-word
+        space = text.find(' ', start, first.start())
+        start = space + 1 if space != -1 else start
+    excerpt = ' '.join(text[start:end].split())
+
+    parts = ['&hellip;'] if start else []
+    position = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append(f"<mark>{escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    if end < len(text):
+        parts.append('&hellip;')
+    return Markup(''.join(parts))
+
+
+def search(conn, user_id, query, limit=20):
+    """
+    Return up to limit ranked results for a user's query as dicts with
+    id, created, title, score and an HTML-safe snippet.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    rows = conn.execute(
+        f'SELECT d.id, d.created, d.title, d.text_hash, d.analysis_hash, {RANK} AS score '
+        'FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid '
+        'WHERE documents_fts MATCH ? AND d.user_id = ? ORDER BY score LIMIT ?',
+        (match_expression(user_id, terms), user_id, limit)
+    ).fetchall()
+
+    pattern = term_pattern(terms)
+    results = []
+    for row in rows:
+        snippet = make_snippet(blob_store.get_text(conn, row['text_hash']), pattern)
+        if snippet is None:
+            # The match was in the summary or title only
+            summary = blob_store.get_json(conn, row['analysis_hash']).get('summary', '')
+            snippet = make_snippet(summary, pattern) or Markup('')
+        results.append({
+            'id': row['id'],
+            'created': row['created'],
+            'title': row['title'],
+            'score': round(-row['score'], 3),
+            'snippet': snippet,
+        })
+    return results
@@ -0,0 +1,132 @@
+# service_clients.py
+"""
+Lazily created Google Cloud service clients.
+
+Importing google.cloud.vision / texttospeech and building their gRPC clients
+takes a large share of a serverless cold start, so nothing here happens until
+the first request that needs it. ``set_client`` installs fakes for tests and
+benchmarks.
+"""
+import functools
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+_clients = {}
+_errors = {}
+
+
+@functools.lru_cache(maxsize=1)
+def load_service_account_credentials():
+    """
+    Parse GOOGLE_SERVICE_ACCOUNT_JSON once per process.
+    Returns None when it is not set so clients fall back to default credentials.
+    """
+    service_account_info = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
+    if not service_account_info:
+        return None
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(json.loads(service_account_info))
+
+
+def vision_module():
+    from google.cloud import vision
+    return vision
+
+
+def tts_module():
+    from google.cloud import texttospeech
+    return texttospeech
+
+
+def _build_vision_client():
+    vision = vision_module()
+    credentials = load_service_account_credentials()
+    if credentials is not None:
+        return vision.ImageAnnotatorClient(credentials=credentials)
+    # Fall back to default credentials (service account file)
+    return vision.ImageAnnotatorClient()
+
+
+def _build_tts_client():
+    texttospeech = tts_module()
+    credentials = load_service_account_credentials()
+    if credentials is not None:
+        return texttospeech.TextToSpeechClient(credentials=credentials)
+    return texttospeech.TextToSpeechClient()
+
+
+def _build_vision_async_client():
+    # gRPC asyncio clients are bound to the event loop they are created on (see asgi.py)
+    vision = vision_module()
+    credentials = load_service_account_credentials()
+    if credentials is not None:
+        return vision.ImageAnnotatorAsyncClient(credentials=credentials)
+    return vision.ImageAnnotatorAsyncClient()
+
+
+def _build_tts_async_client():
+    texttospeech = tts_module()
+    credentials = load_service_account_credentials()
+    if credentials is not None:
+        return texttospeech.TextToSpeechAsyncClient(credentials=credentials)
+    return texttospeech.TextToSpeechAsyncClient()
+
+
+_FACTORIES = {
+    'vision': _build_vision_client,
+    'tts': _build_tts_client,
+    'vision_async': _build_vision_async_client,
+    'tts_async': _build_tts_async_client,
+}
+
+
+def get_client(name):
+    """
+    Return the shared client, creating it on first use.
+    Returns None if it cannot be configured; the failure is remembered so it is
+    only attempted once per process, as it was when clients were built at import.
+    """
+    if name in _clients:
+        return _clients[name]
+    with _lock:
+        if name not in _clients:
+            try:
+                _clients[name] = _FACTORIES[name]()
+            except Exception as e:
+                print(f"Warning: Google Cloud {name} API not configured properly: {e}")
+                _clients[name] = None
+                _errors[name] = str(e)
+    return _clients[name]
+
+
+def get_vision_client():
+    return get_client('vision')
+
+
+def get_tts_client():
+    return get_client('tts')
+
+
+def get_vision_async_client():
+    return get_client('vision_async')
+
+
+def get_tts_async_client():
+    return get_client('tts_async')
+
+
+def set_client(name, client):
+    """Install a client (e.g. a fake backend) in place of the real one"""
+    with _lock:
+        _clients[name] = client
+        _errors.pop(name, None)
+
+
+def status():
+    """Which clients have been created so far, and any configuration errors"""
+    return {
+        name: {'loaded': name in _clients, 'available': _clients.get(name) is not None, 'error': _errors.get(name)}
+        for name in _FACTORIES
+    }
@@ -0,0 +1,122 @@
+# span_index.py
+"""
+Locate annotation highlights in the original document text.
+
+All ``text_to_highlight`` strings are matched in one pass with an
+Aho-Corasick automaton. Annotations with no exact match fall back to a
+whitespace- and case-tolerant search, then to a punctuation-tolerant one.
+The resulting spans are flattened into non-overlapping segments for
+rendering.
+"""
+import re
+from collections import deque
+
+
+class AhoCorasick:
+    """Multi-pattern exact matcher; finds every occurrence of every pattern in O(n + matches)"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = next_node
+            self._out[node].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def finditer(self, text):
+        """Yield (start, end, pattern_index) for every match, including overlapping ones"""
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._out[node]:
+                yield position + 1 - len(self.patterns[index]), position + 1, index
+
+
+def _fuzzy_patterns(needle):
+    """Progressively more tolerant regexes for a highlight that has no exact match"""
+    words = needle.split()
+    if words:
+        yield re.compile(r'\s+'.join(re.escape(word) for word in words), re.IGNORECASE)
+    tokens = re.findall(r'\w+', needle)
+    if len(tokens) > 1:
+        yield re.compile(r'\W+'.join(re.escape(token) for token in tokens), re.IGNORECASE)
+
+
+def find_annotation_spans(text, annotations):
+    """
+    Return sorted (start, end, annotation_index) spans for every place an
+    annotation's text_to_highlight occurs in text.
+    """
+    needles = [
+        (annotation.get('text_to_highlight') or '') if isinstance(annotation, dict) else ''
+        for annotation in annotations
+    ]
+    spans = list(AhoCorasick(needles).finditer(text))
+
+    matched = {index for _, _, index in spans}
+    for index, needle in enumerate(needles):
+        if index in matched or not needle.strip():
+            continue
+        for pattern in _fuzzy_patterns(needle):
+            found = [(m.start(), m.end(), index) for m in pattern.finditer(text) if m.end() > m.start()]
+            if found:
+                spans.extend(found)
+                break
+
+    spans.sort()
+    return spans
+
+
+def merge_spans(text, spans):
+    """
+    Flatten possibly overlapping spans into consecutive, non-overlapping segments.
+
+    Returns a list of (segment_text, [annotation_index, ...]); plain text has an
+    empty list and overlapping highlights share a segment.
+    """
+    boundaries = {0, len(text)}
+    for start, end, _ in spans:
+        boundaries.add(start)
+        boundaries.add(end)
+    points = sorted(point for point in boundaries if 0 <= point <= len(text))
+
+    starts = {}
+    for start, end, index in spans:
+        starts.setdefault(start, []).append((end, index))
+
+    segments = []
+    active = []  # (end, annotation_index) of spans covering the current position
+    for left, right in zip(points, points[1:]):
+        active = [(end, index) for end, index in active if end > left]
+        active.extend(starts.get(left, []))
+        indexes = sorted({index for _, index in active})
+        if segments and segments[-1][1] == indexes:
+            segments[-1] = (segments[-1][0] + text[left:right], indexes)
+        else:
+            segments.append((text[left:right], indexes))
+    return segments
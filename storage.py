@@ -0,0 +1,154 @@
+# storage.py
+"""
+SQLite storage engine layer.
+
+Connections are opened once per thread (and per process, so nothing leaks
+across a gunicorn fork), tuned with WAL journaling and pragmas suited to a
+small web app, and reused across requests. ``migrate`` applies the
+versioned, non-destructive migrations in migrations.py.
+
+Components that share the request's connection write inside ``savepoint``
+rather than ``with conn:``, which would commit (or roll back) whatever the
+caller has pending on the same connection.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',       # readers never block the writer
+    'PRAGMA synchronous = NORMAL',     # safe with WAL, far fewer fsyncs
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 5000',      # wait for the other worker instead of failing
+    'PRAGMA cache_size = -16000',      # 16MB page cache
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 134217728',    # 128MB memory-mapped reads
+)
+
+_local = threading.local()
+
+
+def connect(path):
+    """Open a new tuned connection"""
+    conn = sqlite3.connect(path, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(path, name=None):
+    """
+    Return this thread's shared connection to path, opening it on first use.
+    A name gives a separate connection of its own (e.g. for work that commits
+    independently of the request's transaction).
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get((path, name))
+    if conn is None:
+        conn = connections[(path, name)] = connect(path)
+    return conn
+
+
+@contextmanager
+def savepoint(conn, name='work'):
+    """
+    A transaction that nests inside whatever the caller has open on conn. On a
+    clean exit it is committed when it is the outermost transaction and merged
+    into the caller's otherwise; on an exception only its own writes are undone.
+    """
+    conn.execute(f'SAVEPOINT {name}')
+    try:
+        yield conn
+    except BaseException:
+        try:
+            conn.execute(f'ROLLBACK TO {name}')
+            conn.execute(f'RELEASE {name}')
+        except sqlite3.Error:
+            pass  # The transaction is already gone (SQLite rolls back on some errors)
+        raise
+    conn.execute(f'RELEASE {name}')
+
+
+def release(conn):
+    """End any transaction a request left open so the connection can be reused"""
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+def close_all():
+    """Close this thread's connections (e.g. at worker shutdown or in tests)"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+def _statements(sql):
+    """Split a SQL script into complete statements"""
+    statement = ''
+    for line in sql.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip():
+                yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+
+def migrate(conn, migrations=None):
+    """
+    Apply pending migrations in order and return the names applied.
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction and is
+    recorded in schema_migrations, so concurrent workers serialize on the
+    write lock and a migration is never applied twice. Callables marked with
+    ``rebuilds_tables = True`` run with foreign keys off (they cannot be
+    toggled inside a transaction) and are checked with foreign_key_check.
+    """
+    if migrations is None:
+        from migrations import MIGRATIONS
+        migrations = MIGRATIONS
+
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at REAL NOT NULL)'
+    )
+    conn.commit()
+
+    applied = []
+    for version, name, migration in migrations:
+        rebuilds_tables = getattr(migration, 'rebuilds_tables', False)
+        if rebuilds_tables:
+            conn.execute('PRAGMA foreign_keys = OFF')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            if callable(migration):
+                migration(conn)
+            else:
+                for statement in _statements(migration):
+                    conn.execute(statement)
+            if rebuilds_tables and conn.execute('PRAGMA foreign_key_check').fetchone():
+                raise Exception(f"Migration {version} ({name}) left foreign key violations")
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if rebuilds_tables:
+                conn.execute('PRAGMA foreign_keys = ON')
+        applied.append(f"{version:04d}_{name}")
+    return applied
@@ -0,0 +1,117 @@
+# tests/conftest.py
+"""
+Shared test setup. The modules under test and the benchmark fakes are imported
+from the repository root; app.py reads its settings at import, so they point
+at a temporary directory before any test imports it.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+TMP = tempfile.mkdtemp(prefix='legalclarity-tests-')
+os.environ.update(
+    DATABASE_PATH=os.path.join(TMP, 'test.db'),
+    UPLOAD_FOLDER=os.path.join(TMP, 'uploads'),
+    TTS_CACHE_DIR=os.path.join(TMP, 'tts_cache'),
+    FLASK_SECRET_KEY='tests',
+    GCP_PROJECT_ID='tests',
+    REQUEST_LOG='0',
+    ADMISSION_BACKEND='memory',
+    FAKE_MODEL_LATENCY_MS='0',
+    FAKE_MODEL_MS_PER_CHAR='0',
+    FAKE_VISION_LATENCY_MS='0',
+    FAKE_TTS_LATENCY_MS='0',
+)
+
+WORDS = 'tenant landlord rent deposit notice premises agreement month payment repair consent written party'.split()
+
+
+def make_document(seed=None):
+    """A short lease no other test analyzes, so no cache answers it"""
+    rng = random.Random(seed if seed is not None else uuid.uuid4().hex)
+    sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 18))).capitalize() + '.'
+                 for _ in range(rng.randint(6, 12))]
+    return '\n\n'.join(f'{number}. {sentence}' for number, sentence in enumerate(sentences, 1))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A migrated database of its own, holding one user (id 1)"""
+    import storage
+    path = str(tmp_path / 'test.db')
+    conn = storage.get_connection(path)
+    storage.migrate(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'tester', 'x')")
+    conn.commit()
+    return path
+
+
+@pytest.fixture
+def backends(app_module):
+    """Zero-latency fakes, installed fresh for each test (set error_rate to make them fail)"""
+    import fakes
+    return fakes.install(app_module, fakes.from_env(seed=7))
+
+
+@pytest.fixture
+def client(app_module, backends):
+    """A Flask test client logged in as a new user"""
+    client = app_module.app.test_client()
+    credentials = {'username': f'user-{uuid.uuid4().hex[:10]}', 'password': 'test-password'}
+    client.post('/register', data=credentials)
+    client.post('/login', data=credentials)
+    client.get('/dashboard')  # Consume the login flash
+    return client
+
+
+@pytest.fixture
+def asgi_app(app_module):
+    import asgi
+    return asgi.app
+
+
+def asgi_request(asgi_app, method, path, body=b'', headers=(), cookie=None):
+    """Send one request through an ASGI app; returns (status, headers dict, body bytes)"""
+    headers = [(b'host', b'localhost'), *((name.encode(), value.encode()) for name, value in headers)]
+    if cookie:
+        headers.append((b'cookie', f'session={cookie}'.encode()))
+    scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': b'',
+             'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+             'headers': headers}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'headers': {}, 'body': b''}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # The client never disconnects
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode(): value.decode() for name, value in message.get('headers', [])}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    asyncio.run(asgi_app(scope, receive, send))
+    return response['status'], response['headers'], response['body']
+
+
+def post_json(asgi_app, path, payload, cookie):
+    return asgi_request(asgi_app, 'POST', path, json.dumps(payload).encode(),
+                        [('content-type', 'application/json')], cookie)
@@ -0,0 +1,115 @@
+# tests/test_admission.py
+import time
+
+import pytest
+
+import admission
+import storage
+from admission import AdmissionController, MemoryAdmissionState, Policy, Rejected, SqliteAdmissionState
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def state(request, database):
+    return MemoryAdmissionState() if request.param == 'memory' else SqliteAdmissionState(database)
+
+
+def controller(state, **limits):
+    settings = dict(user_per_minute=60, user_burst=2, global_per_minute=0, user_concurrency=0, max_wait=0)
+    settings.update(limits)
+    return AdmissionController(state, [Policy('analyze', **settings)])
+
+
+def test_burst_is_admitted_then_rejected_with_retry_after(state):
+    control = controller(state)
+    control.admit('analyze', 1).release()
+    control.admit('analyze', 1).release()
+    with pytest.raises(Rejected) as rejected:
+        control.admit('analyze', 1)
+    assert rejected.value.reason == 'user_rate'
+    assert rejected.value.retry_after == 1  # One token a second, rounded up
+
+
+def test_buckets_refill_over_time(state):
+    policy = Policy('analyze', user_per_minute=60, user_burst=1, global_per_minute=0, user_concurrency=0)
+    assert state.try_acquire(policy, 1, 1000.0)[1] is None
+    lease_id, reason, wait = state.try_acquire(policy, 1, 1000.5)
+    assert (lease_id, reason) == (None, 'user_rate') and wait == pytest.approx(0.5)
+    assert state.try_acquire(policy, 1, 1001.0)[1] is None
+
+
+def test_users_have_separate_buckets_but_share_the_global_one(state):
+    control = controller(state, user_burst=1, global_per_minute=60, global_burst=2)
+    control.admit('analyze', 1)
+    with pytest.raises(Rejected, match='user_rate'):
+        control.admit('analyze', 1)
+    control.admit('analyze', 2)
+    with pytest.raises(Rejected) as rejected:
+        control.admit('analyze', 3)
+    assert rejected.value.reason == 'global_rate'
+
+
+def test_concurrency_limit_until_a_ticket_is_released(state):
+    control = controller(state, user_burst=10, user_concurrency=1)
+    ticket = control.admit('analyze', 1)
+    with pytest.raises(Rejected) as rejected:
+        control.admit('analyze', 1)
+    assert rejected.value.reason == 'user_concurrency'
+    assert rejected.value.retry_after == admission.CONCURRENCY_RETRY_SECONDS
+    ticket.release()
+    ticket.release()
+    control.admit('analyze', 1)
+
+
+def test_short_wait_is_queued_instead_of_rejected(state):
+    control = controller(state, user_per_minute=600, user_burst=1, max_wait=1.0)
+    control.admit('analyze', 1)
+    control.admit('analyze', 1)  # The next token is 0.1 s away
+
+
+def test_full_queue_rejects(state):
+    control = controller(state, user_per_minute=600, user_burst=1, max_wait=1.0, queue_size=0)
+    control.admit('analyze', 1)
+    with pytest.raises(Rejected, match='queue_full'):
+        control.admit('analyze', 1)
+
+
+def test_unmigrated_database_admits(tmp_path):
+    control = controller(SqliteAdmissionState(str(tmp_path / 'empty.db')), user_burst=0)
+    control.admit('analyze', 1).release()
+
+
+def test_locked_database_is_rejected_as_busy(database):
+    writer = storage.connect(database)
+    writer.execute('PRAGMA busy_timeout = 0')
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        conn = storage.get_connection(database, 'admission')
+        conn.execute('PRAGMA busy_timeout = 50')
+        with pytest.raises(Rejected) as rejected:
+            controller(SqliteAdmissionState(database)).admit('analyze', 1)
+        assert rejected.value.reason == 'busy'
+        assert rejected.value.retry_after == admission.BUSY_RETRY_SECONDS
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_request_rollback_never_refunds_admission(database):
+    state = SqliteAdmissionState(database)
+    policy = Policy('analyze', user_per_minute=1, user_burst=1, global_per_minute=0, user_concurrency=1)
+    request_conn = storage.get_connection(database)
+
+    # The request's own pending writes hold the write lock: busy at once, not after the busy timeout
+    request_conn.execute("INSERT INTO users (username, password_hash) VALUES ('pending', 'x')")
+    started = time.monotonic()
+    assert state.try_acquire(policy, 1, 1000.0) == (None, 'busy', admission.BUSY_RETRY_SECONDS)
+    assert time.monotonic() - started < 1
+    request_conn.rollback()
+
+    assert state.try_acquire(policy, 1, 1000.0)[1] is None
+    request_conn.execute("INSERT INTO users (username, password_hash) VALUES ('pending', 'x')")
+    request_conn.rollback()
+    # The lease and the spent token are committed on the admission connection
+    assert state.try_acquire(policy, 1, 1000.0)[1] == 'user_concurrency'
+    conn = storage.get_connection(database, 'admission')
+    assert conn.execute('SELECT tokens FROM rate_buckets').fetchone()[0] == 0
@@ -0,0 +1,68 @@
+# tests/test_asgi_parity.py
+"""The same requests sent to app:app and asgi:app get the same answers"""
+import json
+
+from conftest import make_document, post_json
+
+
+def both(client, asgi_app, path, payload):
+    """(status, JSON body) from Flask, then from the native ASGI route"""
+    cookie = client.get_cookie('session').value
+    flask_response = client.post(path, json=payload)
+    status, _, body = post_json(asgi_app, path, payload, cookie)
+    return (flask_response.status_code, flask_response.get_json()), (status, json.loads(body))
+
+
+def test_analyze_succeeds_on_both(client, asgi_app):
+    flask_result, asgi_result = both(client, asgi_app, '/analyze', {'text': make_document()})
+    assert flask_result[0] == asgi_result[0] == 200
+    assert flask_result[1]['success'] and asgi_result[1]['success']
+
+
+def test_analyze_failure_is_the_same_and_hides_the_model_error(client, asgi_app, backends):
+    backends['model'].error_rate = 1.0
+    flask_result, asgi_result = both(client, asgi_app, '/analyze', {'text': make_document()})
+    assert flask_result == asgi_result == (500, {'error': 'Failed to analyze document'})
+
+
+def test_analyze_without_text_is_the_same(client, asgi_app):
+    flask_result, asgi_result = both(client, asgi_app, '/analyze', {'text': ''})
+    assert flask_result == asgi_result == (400, {'error': 'No text provided'})
+
+
+def stream_events(body):
+    """(event, data) pairs of a text/event-stream body"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def both_streams(client, asgi_app, payload):
+    cookie = client.get_cookie('session').value
+    flask_response = client.post('/analyze-stream', json=payload)
+    status, _, body = post_json(asgi_app, '/analyze-stream', payload, cookie)
+    return ((flask_response.status_code, stream_events(flask_response.get_data(as_text=True))),
+            (status, stream_events(body.decode('utf-8'))))
+
+
+def test_stream_ends_with_the_same_events(client, asgi_app):
+    flask_result, asgi_result = both_streams(client, asgi_app, {'text': make_document()})
+    assert flask_result[0] == asgi_result[0] == 200
+    assert [name for name, _ in flask_result[1]] == [name for name, _ in asgi_result[1]]
+    assert flask_result[1][-1][0] == 'done'
+
+
+def test_stream_failure_is_the_same_and_hides_the_model_error(client, asgi_app, backends):
+    backends['model'].error_rate = 1.0
+    flask_result, asgi_result = both_streams(client, asgi_app, {'text': make_document()})
+    assert flask_result[0] == asgi_result[0] == 200
+    assert flask_result[1][-1] == asgi_result[1][-1] == ('error', {'error': 'Failed to analyze document'})
+
+
+def test_analyze_rejects_anonymous_requests_on_both(app_module, asgi_app, backends):
+    flask_response = app_module.app.test_client().post('/analyze', json={'text': make_document()})
+    status, headers, _ = post_json(asgi_app, '/analyze', {'text': make_document()}, None)
+    assert flask_response.status_code == status == 302
+    assert flask_response.headers['Location'] == headers['location']
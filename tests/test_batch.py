@@ -0,0 +1,168 @@
+# tests/test_batch.py
+import base64
+import io
+import json
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from admission import Rejected
+from batch import BatchError, BatchRunner, read_batch
+from ocr import OcrError, OcrResult
+
+TEXT = '1. The tenant pays the rent on the fifth day of each month.'
+
+
+def ocr(uploads):
+    return OcrResult([(0, 1, uploads[0][0], TEXT, 5.0, False)])
+
+
+def analyze(text, language, user_id=None):
+    if 'fail' in text:
+        raise RuntimeError('quota exceeded')
+    return {'title': text[:20], 'summary': text, 'annotations': []}
+
+
+class Store:
+    """persist_many that records each commit"""
+
+    def __init__(self, fail=()):
+        self.commits = []
+        self.fail = fail
+
+    def __call__(self, batch):
+        self.commits.append(len(batch))
+        return [RuntimeError('locked') if result['summary'] in self.fail else 100 + len(self.commits)
+                for _, result in batch]
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def jsonl(*records):
+    return io.BytesIO('\n'.join(json.dumps(record) for record in records).encode())
+
+
+def test_jsonl_batch_is_read_lazily():
+    items = read_batch('batch.jsonl', jsonl(
+        {'name': 'lease', 'text': TEXT},
+        {'filename': 'scan.png', 'content_base64': base64.b64encode(b'png').decode()},
+        {'name': 'broken'},
+    ))
+    assert [item.name for item in items] == ['lease', 'scan.png', 'broken']
+    assert items[0].load() == ('text', TEXT)
+    assert items[1].load() == ('upload', ('scan.png', b'png'))
+    with pytest.raises(BatchError, match='Line 3'):
+        items[2].load()
+
+
+def test_zip_batch_skips_folders_and_hidden_files():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('leases/one.txt', TEXT)
+        archive.writestr('leases/.DS_Store', 'x')
+        archive.writestr('__MACOSX/leases/._one.txt', 'x')
+        archive.writestr('leases/notes.docx', 'x')
+    items = read_batch('leases.zip', data)
+    assert [item.name for item in items] == ['leases/one.txt', 'leases/notes.docx']
+    assert items[0].load() == ('text', TEXT)
+    with pytest.raises(BatchError, match='Unsupported file type'):
+        items[1].load()
+
+
+def test_batch_limits():
+    with pytest.raises(BatchError, match='at most 1 documents'):
+        read_batch('batch.jsonl', jsonl({'text': TEXT}, {'text': TEXT}), max_documents=1)
+    with pytest.raises(BatchError, match='does not contain any documents'):
+        read_batch('batch.jsonl', io.BytesIO(b'\n'))
+
+
+def test_every_document_gets_one_result(executor):
+    items = read_batch('batch.jsonl', jsonl(
+        *({'name': f'doc {number}', 'text': f'{TEXT} {number}'} for number in range(10)),
+        {'name': 'model error', 'text': f'{TEXT} fail'},
+        {'filename': 'scan.png', 'content_base64': base64.b64encode(b'png').decode()},
+        {'name': 'bad line'},
+    ))
+    store = Store(fail=(f'{TEXT} 3',))
+    runner = BatchRunner(executor, ocr, analyze, store, concurrency=3, commit_size=4)
+    results = sorted(runner.run(items, 1, 'en'), key=lambda result: result['index'])
+
+    assert [result['index'] for result in results] == list(range(13))
+    errors = {result['name']: result['error'] for result in results if result['status'] == 'error'}
+    assert errors == {
+        'doc 3': "Could not save to database",
+        'model error': "Failed to analyze document",
+        'bad line': 'Line 13 needs "text", or "filename" and "content_base64"',
+    }
+    assert results[11]['status'] == 'ok' and results[11]['title'] == TEXT[:20]
+    # Saved in a few transactions rather than one per document
+    assert sum(store.commits) == 11 and max(store.commits) <= 4 and len(store.commits) < 11
+
+
+def test_ocr_errors_are_shown_per_document(executor):
+    def failing_ocr(uploads):
+        raise OcrError("The PDF has too many pages")
+
+    items = read_batch('batch.jsonl', jsonl({'filename': 'scan.pdf', 'content_base64': 'cGRm'}))
+    results = list(BatchRunner(executor, failing_ocr, analyze, Store()).run(items, 1, 'en'))
+    assert results == [{'index': 0, 'name': 'scan.pdf', 'status': 'error', 'error': "The PDF has too many pages"}]
+
+
+def test_closing_the_stream_stops_new_documents(executor):
+    started = []
+    lock = threading.Lock()
+
+    def counting_analyze(text, language, user_id=None):
+        with lock:
+            started.append(text)
+        return analyze(text, language, user_id)
+
+    items = read_batch('batch.jsonl', jsonl(*({'text': f'{TEXT} {number}'} for number in range(50))))
+    results = BatchRunner(executor, ocr, counting_analyze, Store(), concurrency=2, commit_size=1).run(items, 1, 'en')
+    next(results)
+    results.close()
+    executor.shutdown(wait=True)
+    assert len(started) < 50
+
+
+def test_closing_the_stream_saves_the_finished_analyses(executor):
+    proceed = threading.Event()
+
+    def slow_analyze(text, language, user_id=None):
+        if 'fail' not in text:
+            proceed.wait(5)
+        return analyze(text, language, user_id)
+
+    items = read_batch('batch.jsonl', jsonl({'text': f'{TEXT} fail'}, *({'text': TEXT} for _ in range(5))))
+    store = Store()
+    results = BatchRunner(executor, ocr, slow_analyze, store, concurrency=2, commit_size=100,
+                          commit_interval=60).run(items, 1, 'en')
+    assert next(results)['status'] == 'error'
+    proceed.set()
+    results.close()
+    # The document that was already being analyzed is saved; the rest never start
+    assert store.commits == [1]
+
+
+def test_documents_wait_for_admission_instead_of_failing(executor):
+    attempts, released = [], []
+
+    def admit(user_id):
+        attempts.append(user_id)
+        if len(attempts) % 2:
+            raise Rejected('analyze', 'user_rate', 0.01)  # Every other attempt finds the quota used up
+        return SimpleNamespace(release=lambda: released.append(user_id))
+
+    items = read_batch('batch.jsonl', jsonl(*({'text': f'{TEXT} {number}'} for number in range(5))))
+    results = list(BatchRunner(executor, ocr, analyze, Store(), concurrency=2, admit=admit).run(items, 7, 'en'))
+    executor.shutdown(wait=True)
+    assert [result['status'] for result in results] == ['ok'] * 5
+    assert attempts == [7] * 10
+    assert released == [7] * 5
@@ -0,0 +1,52 @@
+# tests/test_chunking.py
+import random
+
+import chunking
+
+WORDS = 'tenant landlord rent deposit notice premises agreement month payment repair consent written party'.split()
+
+
+def make_sections(seed=1, count=80):
+    rng = random.Random(seed)
+    return [f'{number}. ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(15, 250))) + '.\n\n'
+            for number in range(1, count)]
+
+
+def test_chunks_concatenate_to_the_original_text():
+    text = ''.join(make_sections())
+    chunks = chunking.chunk_text(text, 12000)
+    assert ''.join(chunks) == text
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 12000 for chunk in chunks)
+
+
+def test_short_text_is_one_chunk():
+    assert chunking.chunk_text('1. The tenant pays rent.', 12000) == ['1. The tenant pays rent.']
+
+
+def test_editing_one_section_reuses_the_other_chunks():
+    sections = make_sections()
+    before = chunking.chunk_text(''.join(sections), 12000)
+    # An early edit big enough to move every later boundary if chunks were packed greedily
+    sections[5] = sections[5].replace('.\n\n', ' and repaints the premises every year' * 40 + '.\n\n')
+    after = chunking.chunk_text(''.join(sections), 12000)
+
+    # Only the chunk holding the edited section (and at most one neighbour it merges with) changes
+    changed = [chunk for chunk in before if chunk not in after]
+    assert 1 <= len(changed) <= 2
+    assert any(sections[5] in chunk for chunk in after if chunk not in before)
+
+
+def test_oversized_section_is_split_on_sentences():
+    section = '1. ' + ' '.join(f'Sentence number {i} of the clause.' for i in range(400)) + '\n\n'
+    chunks = chunking.chunk_text(section + ''.join(make_sections(count=10)), 3000)
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+    assert chunks[0].endswith('clause. ')
+
+
+def test_pack_by_bytes_keeps_the_first_segment_short():
+    long_sentence = 'word ' * 400 + '. '
+    segments = chunking.pack_by_bytes([long_sentence, 'Short one. '], 1000, 200)
+    assert ''.join(segments) == long_sentence + 'Short one. '
+    assert len(segments[0].encode('utf-8')) <= 200
+    assert all(len(segment.encode('utf-8')) <= 1000 for segment in segments)
@@ -0,0 +1,195 @@
+# tests/test_jobs.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import jobs
+from ocr import OcrError, OcrResult
+
+TEXT = '1. The tenant pays the rent on the fifth day of each month.'
+
+
+def ocr(uploads):
+    return OcrResult([(index, 1, name, TEXT, 5.0, False) for index, (name, _) in enumerate(uploads)])
+
+
+def analyze(text, language, user_id):
+    return {'title': 'Lease', 'summary': text, 'annotations': []}
+
+
+def persist(analysis_result, user_id, language=None):
+    return 42
+
+
+def wait_for(queue, job_id, statuses=(jobs.SUCCEEDED, jobs.FAILED)):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = queue.get(job_id, 1)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish: {job}')
+
+
+@pytest.fixture
+def make_queue(database):
+    queues = []
+
+    def make(**stages):
+        stages = {'ocr': ocr, 'analyze': analyze, 'persist': persist, **stages}
+        queue = jobs.JobQueue(database, max_workers=2, **stages)
+        queues.append(queue)
+        return queue
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def test_text_job_succeeds(make_queue):
+    finished = threading.Event()
+    queue = make_queue()
+    job_id = queue.submit(1, 'en', text=TEXT, on_finish=finished.set)
+    job = wait_for(queue, job_id)
+    assert job['status'] == jobs.SUCCEEDED
+    assert job['new_document_id'] == 42 and job['stage'] is None and job['error'] is None
+    assert finished.wait(5)
+
+
+def test_upload_job_records_ocr_details_and_preview(make_queue):
+    queue = make_queue(preview=lambda text, language: {'summary': text[:10]})
+    job = wait_for(queue, queue.submit(1, 'en', uploads=[('lease.png', b'...')]))
+    assert job['status'] == jobs.SUCCEEDED
+    assert job['details']['ocr']['pages'] == 1
+    assert job['details']['provisional'] == {'summary': TEXT[:10]}
+
+
+def test_job_moves_through_the_stages(make_queue):
+    started, proceed = threading.Event(), threading.Event()
+
+    def slow_analyze(text, language, user_id):
+        started.set()
+        proceed.wait(5)
+        return analyze(text, language, user_id)
+
+    queue = make_queue(analyze=slow_analyze)
+    job_id = queue.submit(1, 'en', text=TEXT)
+    assert started.wait(5)
+    job = queue.get(job_id, 1)
+    assert (job['status'], job['stage']) == (jobs.RUNNING, 'analyze')
+    proceed.set()
+    assert wait_for(queue, job_id)['status'] == jobs.SUCCEEDED
+
+
+@pytest.mark.parametrize('stages, error', [
+    ({'ocr': lambda uploads: (_ for _ in ()).throw(OcrError("Unsupported file type"))}, "Unsupported file type"),
+    ({'ocr': lambda uploads: 1 / 0}, "Failed to process the document"),
+    ({'ocr': lambda uploads: OcrResult([])}, "Could not extract text from the document"),
+    ({'analyze': lambda text, language, user_id: 1 / 0}, "Failed to analyze document"),
+    ({'persist': lambda result, user_id, language=None: 1 / 0}, "Could not save to database"),
+])
+def test_failed_stage_fails_the_job_with_a_safe_message(make_queue, stages, error):
+    queue = make_queue(**stages)
+    job = wait_for(queue, queue.submit(1, 'en', uploads=[('lease.png', b'...')]))
+    assert job['status'] == jobs.FAILED
+    assert job['error'] == error
+
+
+def test_failed_persist_leaves_no_partial_writes(make_queue, database):
+    import storage
+
+    def broken_persist(analysis_result, user_id, language=None):
+        storage.get_connection(database).execute(
+            "INSERT INTO users (username, password_hash) VALUES ('half-saved', 'x')")
+        raise RuntimeError('disk full')
+
+    queue = make_queue(persist=broken_persist)
+    assert wait_for(queue, queue.submit(1, 'en', text=TEXT))['status'] == jobs.FAILED
+    count = storage.get_connection(database).execute(
+        "SELECT COUNT(*) FROM users WHERE username = 'half-saved'").fetchone()[0]
+    assert count == 0
+
+
+def test_preview_failure_does_not_fail_the_job(make_queue):
+    queue = make_queue(preview=lambda text, language: 1 / 0)
+    assert wait_for(queue, queue.submit(1, 'en', text=TEXT))['status'] == jobs.SUCCEEDED
+
+
+def test_full_queue_rejects_and_frees_slots(database):
+    proceed, finished = threading.Event(), threading.Event()
+    queue = jobs.JobQueue(database, ocr, lambda *args: proceed.wait(5) and analyze(*args), persist,
+                          max_workers=1, max_pending=1)
+    try:
+        queue.submit(1, 'en', text=TEXT, on_finish=finished.set)
+        with pytest.raises(jobs.QueueFull):
+            queue.submit(1, 'en', text=TEXT)
+        proceed.set()
+        assert finished.wait(5)  # on_finish runs once the slot is free again
+        wait_for(queue, queue.submit(1, 'en', text=TEXT))
+    finally:
+        proceed.set()
+        queue.shutdown()
+
+
+def test_stale_job_is_reported_as_timed_out(make_queue):
+    proceed = threading.Event()
+    queue = make_queue(analyze=lambda *args: proceed.wait(5) and analyze(*args))
+    queue.stale_after = 0
+    try:
+        job = queue.get(queue.submit(1, 'en', text=TEXT), 1)
+        assert job['status'] == jobs.FAILED
+        assert job['error'] == "The analysis timed out. Please try again."
+    finally:
+        proceed.set()
+
+
+def test_other_users_cannot_see_a_job(make_queue):
+    queue = make_queue()
+    job_id = queue.submit(1, 'en', text=TEXT)
+    wait_for(queue, job_id)
+    assert queue.get(job_id, 2) is None
+
+
+def run_async_job(database, submit_kwargs, **stages):
+    async def async_ocr(uploads):
+        return ocr(uploads)
+
+    async def async_analyze(text, language, user_id):
+        return analyze(text, language, user_id)
+
+    stages = {'ocr': async_ocr, 'analyze': async_analyze, 'persist': persist, **stages}
+    executor = ThreadPoolExecutor(max_workers=1)
+    queue = jobs.AsyncJobQueue(database, db_executor=executor, **stages)
+    finished = []
+
+    async def main():
+        job_id = await queue.submit_async(1, 'en', on_finish=lambda: finished.append(True), **submit_kwargs)
+        while queue._tasks:
+            await asyncio.sleep(0.01)
+        return job_id
+
+    try:
+        job_id = asyncio.run(main())
+    finally:
+        executor.shutdown()
+        queue.shutdown()
+    assert finished == [True]
+    return queue.get(job_id, 1)
+
+
+def test_async_upload_job_succeeds(database):
+    job = run_async_job(database, {'uploads': [('lease.png', b'...')]})
+    assert job['status'] == jobs.SUCCEEDED
+    assert job['new_document_id'] == 42
+    assert job['details']['ocr']['pages'] == 1
+
+
+def test_async_job_failure(database):
+    async def broken_analyze(text, language, user_id):
+        raise RuntimeError('quota exceeded')
+
+    job = run_async_job(database, {'text': TEXT}, analyze=broken_analyze)
+    assert job['status'] == jobs.FAILED
+    assert job['error'] == "Failed to analyze document"
@@ -0,0 +1,53 @@
+# tests/test_json_stream.py
+import json
+
+from json_stream import IncrementalJsonParser
+
+ANALYSIS = {
+    'title': 'Lease "A"',
+    'summary': 'Rent {due} on the 5th, \\ not later.',
+    'annotations': [
+        {'text_to_highlight': 'rent of Rs. 20,000', 'explanation': 'Monthly [rent].'},
+        {'text_to_highlight': 'two months notice', 'explanation': 'Notice period.'},
+    ],
+    'pages': 3,
+    'signed': True,
+}
+RESPONSE = '```json\n' + json.dumps(ANALYSIS) + '\n```'
+
+
+def feed_in_pieces(text, size):
+    parser = IncrementalJsonParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+def test_events_match_the_whole_object_for_any_piece_size():
+    for size in (1, 2, 7, 40, len(RESPONSE)):
+        parser, events = feed_in_pieces(RESPONSE, size)
+        assert parser.done
+        fields = {event[1]: event[2] for event in events if event[0] == 'field'}
+        items = [event[3] for event in events if event[0] == 'item' and event[1] == 'annotations']
+        assert fields == ANALYSIS
+        assert items == ANALYSIS['annotations']
+        assert [event[2] for event in events if event[0] == 'item'] == [0, 1]
+
+
+def test_items_arrive_before_the_array_closes():
+    text = json.dumps(ANALYSIS)
+    cut = text.index('two months notice')
+    parser = IncrementalJsonParser()
+    events = parser.feed(text[:cut])
+    assert ('item', 'annotations', 0, ANALYSIS['annotations'][0]) in events
+    assert not any(event[0] == 'field' and event[1] == 'annotations' for event in events)
+    assert not parser.done
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJsonParser()
+    events = parser.feed('{"title": "Lease"} and {"title": "Other"}')
+    assert events == [('field', 'title', 'Lease')]
+    assert parser.done
+    assert parser.feed('{"summary": "x"}') == []
@@ -0,0 +1,102 @@
+# tests/test_near_duplicates.py
+import random
+import uuid
+
+import pytest
+
+import near_duplicates
+import storage
+from near_duplicates import MinHasher, NearDuplicateIndex, changed_sections, estimate, jaccard, shingles
+
+WORDS = 'tenant landlord rent deposit notice premises agreement month payment repair consent written party'.split()
+
+
+def make_lease(seed, sections=16):
+    rng = random.Random(seed)
+    return ''.join(f'{number}. ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(12, 20))) + '.\n\n'
+                   for number in range(1, sections + 1))
+
+
+def edit_section(text, number, replacement):
+    sections = text.split('\n\n')
+    sections[number - 1] = f'{number}. {replacement}.'
+    return '\n\n'.join(sections)
+
+
+def test_signature_estimates_jaccard():
+    hasher = MinHasher(num_perm=128, bands=16)
+    original = make_lease(1)
+    edited = edit_section(original, 3, 'The tenant may keep one small dog on the premises')
+    exact = jaccard(shingles(original), shingles(edited))
+    assert estimate(hasher.signature(shingles(original)), hasher.signature(shingles(edited))) == \
+        pytest.approx(exact, abs=0.15)
+    assert estimate(hasher.signature(shingles(original)), hasher.signature(shingles(make_lease(2)))) < 0.2
+
+
+def test_pure_python_signature_matches_numpy(monkeypatch):
+    pytest.importorskip('numpy')
+    hasher = MinHasher()
+    hashes = shingles(make_lease(1))
+    with_numpy = hasher.signature(hashes)
+    monkeypatch.setattr(near_duplicates, 'numpy', None)
+    assert hasher.signature(hashes) == with_numpy
+
+
+def test_index_finds_edited_documents_only(database):
+    conn = storage.get_connection(database)
+    index = NearDuplicateIndex(MinHasher(), threshold=0.7)
+    original = make_lease(1)
+    index.add(conn, 1, 1, 'en', original)
+    index.add(conn, 2, 1, 'en', make_lease(2))
+    conn.commit()
+
+    edited = edit_section(original, 3, 'The tenant may keep one small dog on the premises')
+    assert [doc_id for doc_id, _ in index.candidates(conn, edited, 'en')] == [1]
+    assert index.candidates(conn, edited, 'hi') == []
+    assert index.candidates(conn, edited, 'en', user_id=2) == []
+
+
+def test_index_keeps_at_most_max_documents(database):
+    conn = storage.get_connection(database)
+    index = NearDuplicateIndex(MinHasher(), max_documents=3)
+    for document_id in range(1, near_duplicates.EVICT_EVERY + 1):
+        index.add(conn, document_id, 1, 'en', make_lease(document_id, sections=2))
+    count = conn.execute('SELECT COUNT(*) FROM near_duplicate_signatures').fetchone()[0]
+    assert count == 3
+
+
+def test_changed_sections_are_located():
+    original = make_lease(1)
+    edited = edit_section(original, 3, 'The tenant may keep one small dog on the premises')
+    spans = changed_sections(original, edited)
+    assert [edited[start:end].strip() for start, end in spans] == \
+        ['3. The tenant may keep one small dog on the premises.']
+
+
+def test_edited_document_reuses_the_earlier_analysis(app_module, backends, monkeypatch):
+    app_module.init_db()
+    conn = storage.get_connection(app_module.DATABASE)
+    user_id = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')",
+                           (f'user-{uuid.uuid4().hex[:10]}',)).lastrowid
+    conn.commit()
+    prompts = []
+    generate_content = backends['model'].generate_content
+
+    def recording_generate_content(prompt, **kwargs):
+        prompts.append(prompt)
+        return generate_content(prompt, **kwargs)
+    monkeypatch.setattr(backends['model'], 'generate_content', recording_generate_content)
+
+    original = make_lease(101)
+    app_module.save_document(app_module.analyze_with_ai(original, 'en', user_id), user_id, language='en')
+    sections = original.split('\n\n')
+    prompts.clear()
+
+    edited = edit_section(original, 8, 'The tenant may keep one small dog on the premises')
+    result = app_module.analyze_with_ai(edited, 'en', user_id)
+    # Only the changed section (and the earlier summary, to revise it) went to the model
+    assert any('small dog' in prompt for prompt in prompts)
+    assert not any(sections[11][4:] in prompt for prompt in prompts)
+    # Highlights in unchanged sections come from the earlier analysis
+    assert any(annotation['text_to_highlight'] in sections[0] for annotation in result['annotations'])
+    assert result['original_text'] == edited
@@ -0,0 +1,64 @@
+# tests/test_response_parsing.py
+import json
+import os
+
+import pytest
+
+import response_parsing
+import response_corpus
+from response_parsing import ResponseParseError
+
+CORPUS = os.path.join(os.path.dirname(response_corpus.__file__), 'bad_responses.jsonl')
+with open(CORPUS, encoding='utf-8') as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize('case', CASES, ids=[case['name'] for case in CASES])
+def test_corpus_case(case):
+    outcome, value, _ = response_corpus.run_case(case)
+    assert response_corpus.problems(case, outcome, value) == []
+
+
+def test_trailing_commas_are_repaired():
+    value, repaired = response_parsing.parse('{"title": "Lease", "summary": "Rent.", "annotations": [],}',
+                                             response_parsing.ANALYSIS_SCHEMA)
+    assert repaired and value == {'title': 'Lease', 'summary': 'Rent.', 'annotations': []}
+
+
+def test_truncated_response_keeps_its_complete_annotations():
+    text = ('{"title": "Lease", "summary": "Rent.", "annotations": [{"text_to_highlight": "rent", '
+            '"explanation": "Monthly."}, {"text_to_highlight": "dep')
+    value, repaired = response_parsing.parse(text, response_parsing.ANALYSIS_SCHEMA)
+    assert repaired
+    assert value['annotations'] == [{'text_to_highlight': 'rent', 'explanation': 'Monthly.'}]
+
+
+def test_malformed_optional_items_are_dropped():
+    value, repaired = response_parsing.parse(
+        '{"title": "Lease", "summary": "Rent.", "annotations": [{"text_to_highlight": "rent"}, 3]}',
+        response_parsing.ANALYSIS_SCHEMA)
+    assert not repaired and value['annotations'] == []
+
+
+def test_missing_required_field_is_an_error():
+    with pytest.raises(ResponseParseError, match='missing summary'):
+        response_parsing.parse('{"title": "Lease"}', response_parsing.ANALYSIS_SCHEMA)
+
+
+def test_no_object_is_an_error():
+    with pytest.raises(ResponseParseError):
+        response_parsing.parse('I cannot help with that.', response_parsing.ANALYSIS_SCHEMA)
+
+
+def test_follow_up_continues_from_the_last_complete_element():
+    text = '{"title": "Lease", "summary": "Rent." "annotations": []}'
+    prompts = []
+
+    def ask(prompt):
+        prompts.append(prompt)
+        return ', "summary": "Rent.", "annotations": []}'
+
+    value = response_parsing.parse_with_follow_up(text, response_parsing.ANALYSIS_SCHEMA, ask)
+    assert value == {'title': 'Lease', 'summary': 'Rent.', 'annotations': []}
+    # Only the part after the last complete member is asked for again
+    assert len(prompts) == 1 and '"summary": "Rent." "annotations": []}' in prompts[0]
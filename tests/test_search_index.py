@@ -0,0 +1,58 @@
+# tests/test_search_index.py
+import pytest
+
+import blob_store
+import search_index
+import storage
+
+HINDI_TEXT = 'किरायेदार हर महीने की पाँच तारीख तक किराया देगा। मकान मालिक सुरक्षा राशि लौटाएगा।'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect(str(tmp_path / 'search.db'))
+    storage.migrate(conn)
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('asha', 'x')")
+    yield conn
+    conn.close()
+
+
+def add_document(conn, user_id, title, summary, text):
+    cursor = conn.execute(
+        'INSERT INTO documents (title, user_id, text_hash, analysis_hash) VALUES (?, ?, ?, ?)',
+        (title, user_id, blob_store.put_blob(conn, text), blob_store.put_json(conn, {'summary': summary}))
+    )
+    search_index.index_document(conn, cursor.lastrowid, user_id, title, summary, text)
+    conn.commit()
+    return cursor.lastrowid
+
+
+def test_query_terms_keep_vowel_signs():
+    assert search_index.query_terms('किराया') == ['किराया']
+    assert search_index.query_terms('सुरक्षा राशि।') == ['सुरक्षा', 'राशि']
+
+
+def test_hindi_word_is_found_and_marked_whole(conn):
+    doc_id = add_document(conn, 1, 'किराया समझौता', 'मासिक किराया और सुरक्षा राशि', HINDI_TEXT)
+
+    results = search_index.search(conn, 1, 'किराया')
+    assert [result['id'] for result in results] == [doc_id]
+    assert '<mark>किराया</mark>' in results[0]['snippet']
+    assert '<mark>क</mark>' not in results[0]['snippet']
+
+    # A single consonant is not a word of its own any more
+    assert search_index.search(conn, 1, 'क') == []
+
+
+def test_english_search_still_folds_accents(conn):
+    doc_id = add_document(conn, 1, 'Lease', 'Rent is due monthly', 'The café on the ground floor is excluded.')
+    assert [result['id'] for result in search_index.search(conn, 1, 'cafe')] == [doc_id]
+    assert search_index.search(conn, 2, 'cafe') == []
+
+
+def test_underscore_splits_words_as_in_the_index(conn):
+    doc_id = add_document(conn, 1, 'Lease', 'Late fee applies', 'A late_fee of Rs. 500 is charged after the fifth.')
+    assert search_index.query_terms('late_fee') == ['late', 'fee']
+    results = search_index.search(conn, 1, 'late_fee')
+    assert [result['id'] for result in results] == [doc_id]
+    assert '<mark>late</mark>_<mark>fee</mark>' in results[0]['snippet']
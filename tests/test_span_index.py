@@ -0,0 +1,34 @@
+# tests/test_span_index.py
+from span_index import find_annotation_spans, merge_spans
+
+TEXT = 'The tenant pays rent monthly and keeps the premises clean.'
+
+
+def test_text_without_spans_is_one_plain_segment():
+    assert merge_spans(TEXT, []) == [(TEXT, [])]
+
+
+def test_overlapping_spans_share_a_segment():
+    rent = TEXT.index('pays rent monthly')
+    monthly = TEXT.index('monthly and keeps')
+    spans = [(rent, rent + len('pays rent monthly'), 0), (monthly, monthly + len('monthly and keeps'), 1)]
+    segments = merge_spans(TEXT, spans)
+    assert ''.join(segment for segment, _ in segments) == TEXT
+    assert segments == [
+        ('The tenant ', []),
+        ('pays rent ', [0]),
+        ('monthly', [0, 1]),
+        (' and keeps', [1]),
+        (' the premises clean.', []),
+    ]
+
+
+def test_adjacent_segments_with_the_same_annotations_are_merged():
+    spans = [(4, 10, 0), (4, 10, 1), (10, 15, 0), (10, 15, 1)]
+    assert merge_spans(TEXT, spans)[1] == (TEXT[4:15], [0, 1])
+
+
+def test_annotation_spans_are_found_despite_whitespace_and_case():
+    annotations = [{'text_to_highlight': 'pays  RENT monthly'}, {'text_to_highlight': 'not in the text'}]
+    spans = find_annotation_spans(TEXT, annotations)
+    assert [(TEXT[start:end], index) for start, end, index in spans] == [('pays rent monthly', 0)]
@@ -0,0 +1,87 @@
+# tests/test_tts.py
+import asyncio
+import os
+import threading
+import uuid
+
+from conftest import asgi_request
+from tts_cache import AudioCache
+
+SENTENCE = 'The tenant shall pay the monthly rent on or before the fifth day of each month. '
+
+
+def speech_text():
+    return f'Summary {uuid.uuid4().hex}. ' + SENTENCE * 12
+
+
+def request_audio_url(client, text):
+    response = client.post('/text-to-speech', json={'text': text}, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    return response.get_json()['audio_url']
+
+
+def test_pending_requests_count_toward_the_size_cap(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=4096)
+    for number in range(100):
+        key = f'{number:064x}'
+        cache.put_pending(key, {'text': 'x' * 200, 'language': 'en'})
+    size = sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+    assert size <= 4096
+    assert cache.get_pending(f'{99:064x}') is not None  # The newest entry is kept
+
+
+def test_claim_makes_one_leader_until_finished(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    key = 'a' * 64
+    leader, synthesis = cache.claim(key)
+    follower, same = cache.claim(key)
+    assert leader and not follower and same is synthesis
+    cache.finish(key, synthesis)
+    cache.finish(key, synthesis)
+    assert synthesis.done()
+    assert cache.claim(key)[0]
+
+
+def test_concurrent_fetches_of_pending_audio_synthesize_once(client, app_module, backends):
+    backends['tts'].latency_ms = 200
+    url = request_audio_url(client, speech_text())
+    cookie = client.get_cookie('session').value
+    responses = []
+
+    def fetch():
+        other = app_module.app.test_client()
+        other.set_cookie('session', cookie)
+        response = other.get(url)
+        responses.append((response.status_code, response.get_data(), response.headers.get('X-TTS-Segments')))
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _, _ in responses] == [200] * 4
+    assert len({body for _, body, _ in responses}) == 1
+    segments = [int(count) for _, _, count in responses if count]
+    assert len(segments) == 1  # Only one response was synthesized; the others came from the cache
+    assert backends['tts'].calls == segments[0] > 1
+
+
+def test_asgi_fetches_of_pending_audio_synthesize_once(client, asgi_app, backends):
+    backends['tts_async'].latency_ms = 200
+    url = request_audio_url(client, speech_text())
+    cookie = client.get_cookie('session').value
+
+    async def fetch_all():
+        loop = asyncio.get_running_loop()
+        # asgi_request runs its own loop, so each request gets a thread
+        return await asyncio.gather(*(loop.run_in_executor(None, asgi_request, asgi_app, 'GET', url, b'', (), cookie)
+                                      for _ in range(3)))
+
+    responses = asyncio.run(fetch_all())
+    assert [status for status, _, _ in responses] == [200] * 3
+    assert len({body for _, _, body in responses}) == 1
+    synthesized = [headers for _, headers, _ in responses if 'x-tts-segments' in headers]
+    assert len(synthesized) == 1
+    assert backends['tts_async'].calls == int(synthesized[0]['x-tts-segments']) > 1
+    assert backends['tts'].calls == 0
@@ -0,0 +1,172 @@
+# tts_cache.py
+"""
+Disk-backed cache for synthesized speech.
+
+Audio files are named by the hash of everything that affects the output
+(text, voice, speaking rate, encoding), so a cached file never changes and
+can be served directly from disk with strong validators. The directory is
+capped in bytes, pending requests included, and trimmed least-recently-used
+first, using the file access time that ``get`` refreshes on every hit.
+
+``claim``/``finish`` make concurrent requests for the same uncached audio in
+one process share a single synthesis: the first one synthesizes, the others
+wait for it and then serve the cached file.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def audio_key(text, voice, speaking_rate, encoding):
+    """Content hash identifying one synthesized audio file"""
+    material = '\0'.join([voice, repr(float(speaking_rate)), str(encoding), text])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """
+    MP3 files keyed by audio_key(). Text that has been requested but not yet
+    synthesized is parked as a small "pending" JSON file so the audio URL can
+    be handed out before synthesis starts.
+    """
+
+    PENDING_MAX_AGE = 24 * 3600
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, extension='.mp3'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._synthesizing = {}  # key -> Future completed by finish()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        if not KEY_PATTERN.match(key):
+            raise ValueError("Invalid audio key")
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key):
+        """Return the path of a cached file, or None"""
+        path = self.path_for(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        # Refresh the access time for LRU eviction while keeping mtime (Last-Modified) stable
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, data):
+        """Atomically write audio bytes and return the cached path"""
+        path = self.path_for(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.discard_pending(key)
+        self.evict(keep=path)
+        return path
+
+    def _pending_path(self, key):
+        return self.path_for(key)[:-len(self.extension)] + '.pending.json'
+
+    def put_pending(self, key, payload):
+        """Remember what to synthesize for a key that is not cached yet"""
+        path = self._pending_path(key)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        self.evict(keep=path)
+
+    def get_pending(self, key):
+        try:
+            with open(self._pending_path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def discard_pending(self, key):
+        try:
+            os.remove(self._pending_path(key))
+        except FileNotFoundError:
+            pass
+
+    def claim(self, key):
+        """
+        (True, future) when the caller should synthesize key, or (False, future)
+        when another request in this process already is. The future completes
+        when that request calls finish(), successful or not.
+        """
+        with self._lock:
+            future = self._synthesizing.get(key)
+            if future is not None:
+                return False, future
+            future = self._synthesizing[key] = Future()
+            return True, future
+
+    def finish(self, key, future):
+        """End a claim and wake the requests waiting on it (safe to call more than once)"""
+        with self._lock:
+            if self._synthesizing.get(key) is future:
+                del self._synthesizing[key]
+            if not future.done():
+                future.set_result(None)
+
+    def evict(self, keep=None):
+        """Delete least-recently-used files (audio and pending requests) until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.pending.json'):
+                    if self._expire_pending(entry):
+                        continue
+                elif not entry.name.endswith(self.extension):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                if entry.path != keep:
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _expire_pending(self, entry):
+        """Delete a pending request older than PENDING_MAX_AGE; True when it is gone"""
+        try:
+            if entry.stat().st_mtime < time.time() - self.PENDING_MAX_AGE:
+                os.remove(entry.path)
+                return True
+        except FileNotFoundError:
+            return True
+        return False